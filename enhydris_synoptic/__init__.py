@@ -1,2 +1,4 @@
 __version__ = "DEV"
 VERSION = __version__  # synonym
+
+default_app_config = "enhydris_synoptic.apps.EnhydrisSynopticConfig"
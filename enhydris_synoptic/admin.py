@@ -1,13 +1,49 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils.translation import gettext_lazy as _
 
 from enhydris.models import TimeseriesGroup
+from enhydris_synoptic import events
 from enhydris_synoptic.models import (
+    ChartWindow,
     EarlyWarningEmail,
     SynopticGroup,
     SynopticGroupStation,
+    WarningRule,
 )
 
 
+class RenderStatusMixin:
+    """Show when the synoptic group was last rendered, and tell when it will be again.
+
+    The synoptic group of the object must be returned by get_synoptic_group().
+    """
+
+    def render_status(self, obj):
+        synoptic_group = self.get_synoptic_group(obj)
+        if synoptic_group is None:
+            return "-"
+        if events.is_render_pending(synoptic_group.id):
+            return _("Rendering…")
+        if synoptic_group.last_rendered is None:
+            return _("Not rendered yet")
+        return _("Rendered at {}").format(
+            synoptic_group.last_rendered.isoformat(sep=" ", timespec="seconds")
+        )
+
+    render_status.short_description = _("Render status")
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if events.render_on_change():
+            messages.info(
+                request,
+                _(
+                    "The synoptic pages will be rendered again in a few seconds; the "
+                    "render status shows when this has finished."
+                ),
+            )
+
+
 class StationInline(admin.TabularInline):
     model = SynopticGroup.stations.through
 
@@ -29,10 +65,20 @@ class EmailInline(admin.TabularInline):
     extra = 1
 
 
+class ChartWindowInline(admin.TabularInline):
+    model = ChartWindow
+    extra = 1
+
+
 @admin.register(SynopticGroup)
-class GroupAdmin(admin.ModelAdmin):
-    inlines = [StationInline, EmailInline]
+class GroupAdmin(RenderStatusMixin, admin.ModelAdmin):
+    inlines = [StationInline, ChartWindowInline, EmailInline]
     exclude = ["stations"]
+    list_display = ["name", "refresh_policy", "render_status"]
+    readonly_fields = ["render_status", "data_interval", "next_render"]
+
+    def get_synoptic_group(self, obj):
+        return obj
 
 
 class SynopticTimeseriesGroupInline(admin.TabularInline):
@@ -49,10 +95,14 @@ class SynopticTimeseriesGroupInline(admin.TabularInline):
 
 
 @admin.register(SynopticGroupStation)
-class GroupStationAdmin(admin.ModelAdmin):
+class GroupStationAdmin(RenderStatusMixin, admin.ModelAdmin):
     inlines = [SynopticTimeseriesGroupInline]
     exclude = ["synoptic_group", "station", "order", "timeseries_group"]
     list_filter = ["synoptic_group"]
+    readonly_fields = ["render_status"]
+
+    def get_synoptic_group(self, obj):
+        return obj and obj.synoptic_group
 
     def has_add_permission(self, request, obj=None):
         return False
@@ -60,3 +110,13 @@ class GroupStationAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False
         pass
+
+
+@admin.register(WarningRule)
+class WarningRuleAdmin(admin.ModelAdmin):
+    list_display = ["synoptic_timeseries_group", "kind", "threshold", "duration"]
+    list_filter = [
+        "kind",
+        "synoptic_timeseries_group__synoptic_group_station__synoptic_group",
+    ]
+    readonly_fields = ["in_alarm", "last_notified"]
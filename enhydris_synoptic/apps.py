@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class EnhydrisSynopticConfig(AppConfig):
+    name = "enhydris_synoptic"
+
+    def ready(self):
+        from . import signals  # NOQA
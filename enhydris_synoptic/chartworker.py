@@ -0,0 +1,205 @@
+"""Render charts in a child process that is recycled before it grows too much.
+
+matplotlib's caches and the fragmentation of the heap make a process that renders
+charts grow slowly but steadily, and closing the figures does not help much. If
+ENHYDRIS_SYNOPTIC_CHART_WORKER is set, charts are not rendered in the calling process
+(usually a long-lived celery worker) but in a child process, which is replaced with a
+new one after it has rendered ENHYDRIS_SYNOPTIC_CHART_WORKER_MAX_CHARTS charts or when
+its memory has grown by more than ENHYDRIS_SYNOPTIC_CHART_WORKER_MAX_MEMORY megabytes
+since it started; each recycle is logged. The child process lives across runs, so that
+it isn't started for every run.
+
+The child is a new Python interpreter (running this module) rather than a
+multiprocessing.Process, because the children of celery's prefork pool are daemonic
+and multiprocessing doesn't allow daemonic processes to have children. It receives the
+data of one station at a time, pickled through its standard input, with the same
+lightweight objects that are used for rendering charts in parallel (see
+views.DetachedSynopticTimeseriesGroup), and sends back the results through its
+standard output. When charts are rendered in parallel (see
+ENHYDRIS_SYNOPTIC_CHART_PROCESSES) they are already rendered in processes that last for
+only one synoptic group, so this setting doesn't matter.
+"""
+import logging
+import os
+import pickle
+import resource
+import subprocess
+import sys
+
+import django
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# The settings that rendering a chart uses; the child gets the values the calling
+# process has when it starts the child (they may have been overridden at runtime).
+CHILD_SETTINGS = ("ENHYDRIS_SYNOPTIC_ROOT", "TEST_MATPLOTLIB")
+
+
+def is_enabled():
+    return getattr(settings, "ENHYDRIS_SYNOPTIC_CHART_WORKER", False)
+
+
+class ChartWorkerError(Exception):
+    pass
+
+
+class ChartWorker:
+    def __init__(self, max_charts=None, max_memory=None):
+        if max_charts is None:
+            max_charts = getattr(
+                settings, "ENHYDRIS_SYNOPTIC_CHART_WORKER_MAX_CHARTS", 1000
+            )
+        if max_memory is None:
+            max_memory = getattr(
+                settings, "ENHYDRIS_SYNOPTIC_CHART_WORKER_MAX_MEMORY", 500
+            )
+        self.max_charts = max_charts
+        self.max_memory = max_memory  # Megabytes of growth
+        self.process = None
+        self.charts = 0
+
+    def render(self, detached_syntsgs, arrays, charts_to_render, windows):
+        """Render charts in the child process and return their statistics.
+
+        The arguments are like those of views.render_detached_charts(), which is what
+        the child process executes.
+        """
+        try:
+            if self.process is None:
+                self._start()
+            self._send((detached_syntsgs, arrays, charts_to_render, windows))
+            ok, result, memory_growth = pickle.load(self.process.stdout)
+        except (EOFError, OSError):
+            self._stop()
+            raise ChartWorkerError("The chart worker process died")
+        except BaseException:
+            # E.g. the station ran out of time (see the scheduler module); the child
+            # would answer later, so it can't be used for the next job.
+            self._stop()
+            raise
+        if not ok:
+            raise ChartWorkerError(result)
+        self.charts += result["charts"]
+        self._recycle_if_needed(memory_growth)
+        return result
+
+    def _recycle_if_needed(self, memory_growth):
+        too_many = self.max_charts is not None and self.charts >= self.max_charts
+        too_large = self.max_memory is not None and memory_growth >= self.max_memory
+        if too_many or too_large:
+            logger.info(
+                "Recycling chart worker process %d after %d charts (grown by %.0f MB)",
+                self.process.pid,
+                self.charts,
+                memory_growth,
+            )
+            self.close()
+
+    def _start(self):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(x for x in sys.path if x))
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", __name__],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+        self._send(
+            {
+                name: getattr(settings, name)
+                for name in CHILD_SETTINGS
+                if hasattr(settings, name)
+            }
+        )
+        self.charts = 0
+
+    def _send(self, obj):
+        pickle.dump(obj, self.process.stdin)
+        self.process.stdin.flush()
+
+    def close(self):
+        """Stop the child process (a new one is started when needed)."""
+        if self.process is None:
+            return
+        try:
+            self._send(None)
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self._stop()
+
+    def _stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.process = None
+
+
+_worker = None
+
+
+def get_worker():
+    """Return the chart worker of this process, creating it if needed."""
+    global _worker
+    if _worker is None:
+        _worker = ChartWorker()
+    return _worker
+
+
+def close_worker():
+    """Stop the chart worker of this process, if any."""
+    global _worker
+    if _worker is not None:
+        _worker.close()
+        _worker = None
+
+
+def main():
+    """Serve jobs in the child process (see ChartWorker)."""
+    # The results are sent through standard output, so anything else that would be
+    # printed there goes to standard error instead.
+    output = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    input = sys.stdin.buffer
+    django.setup()
+    for name, value in pickle.load(input).items():
+        setattr(settings, name, value)
+    _serve(input, output)
+
+
+def _serve(input, output):
+    from .views import render_detached_charts
+
+    initial_memory = get_memory()
+    while True:
+        job = pickle.load(input)
+        if job is None:
+            return
+        try:
+            result = (True, render_detached_charts(*job))
+        except Exception as e:
+            result = (False, f"{e.__class__.__name__}: {e}")
+        pickle.dump(result + (get_memory() - initial_memory,), output)
+        output.flush()
+
+
+def get_memory():
+    """Return the resident memory of the process in megabytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 2**20
+    except OSError:
+        # No /proc; use the peak instead. It is in kilobytes, except on macOS where it
+        # is in bytes.
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Check the limits of the synoptic time series without rendering.
+
+While a synoptic group is rendered, the value of each of its time series at the last
+common date is compared with low_limit and high_limit, and the warnings are emailed
+at the end, so warnings are only as frequent as renders. check_limits() instead
+compares the cached latest value (see LatestValue) of every synoptic time series of
+all groups with its limits, reading them all in a single query and drawing nothing;
+the check_early_warnings task uses it and is cheap enough to execute every minute. If
+that task is used, ENHYDRIS_SYNOPTIC_EARLY_WARNINGS_IN_RENDER should be set to False,
+so that the renders don't also send warnings.
+
+Whether from renders or from check_limits(), an email is only sent when a variable
+goes out of its limits or returns within them (see AlarmState), and all the emails of
+a run are sent at its end with send_messages(), over a single connection.
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db.models import OuterRef, Q, Subquery
+
+from .models import LatestValue, SynopticTimeseriesGroup
+
+logger = logging.getLogger(__name__)
+
+
+def in_render():
+    """Whether renders should send early warnings."""
+    return getattr(settings, "ENHYDRIS_SYNOPTIC_EARLY_WARNINGS_IN_RENDER", True)
+
+
+def check_limits():
+    """Queue the warnings of all synoptic groups and return the groups.
+
+    The values are queued with SynopticGroup.queue_warning(), so the emails can be
+    created with SynopticGroup.get_early_warning_message() just as after rendering.
+    Time series that are not in the LatestValue cache, or whose latest value is null,
+    are not checked.
+    """
+    synoptic_groups = {}
+    for asyntsg in _get_synoptic_timeseries_groups():
+        if asyntsg.latest_timestamp is None or asyntsg.latest_value is None:
+            continue
+        asyntsg.value = asyntsg.latest_value
+        synoptic_group = synoptic_groups.setdefault(
+            asyntsg.synoptic_group_station.synoptic_group_id,
+            asyntsg.synoptic_group_station.synoptic_group,
+        )
+        tzinfo = asyntsg.timeseries_group.time_zone.as_tzinfo
+        timestamp = asyntsg.latest_timestamp.astimezone(tzinfo)
+        synoptic_group.queue_warning(asyntsg, timestamp=timestamp)
+    return list(synoptic_groups.values())
+
+
+def send_messages(messages):
+    """Send the early warning emails over a single connection to the mail server."""
+    if not messages:
+        return
+    try:
+        connection = get_connection()
+        connection.send_messages(messages)
+    except Exception:
+        logger.exception("Failed to send %d early warning emails", len(messages))
+
+
+def _get_synoptic_timeseries_groups():
+    latest_values = LatestValue.objects.filter(
+        timeseries__timeseries_group_id=OuterRef("timeseries_group_id")
+    ).order_by("-timestamp")
+    return (
+        SynopticTimeseriesGroup.objects.filter(
+            Q(low_limit__isnull=False) | Q(high_limit__isnull=False)
+        )
+        .select_related(
+            "synoptic_group_station__synoptic_group",
+            "synoptic_group_station__station",
+            "timeseries_group__time_zone",
+            "timeseries_group__variable",
+        )
+        .annotate(
+            latest_timestamp=Subquery(latest_values.values("timestamp")[:1]),
+            latest_value=Subquery(latest_values.values("value")[:1]),
+        )
+    )
@@ -0,0 +1,184 @@
+"""Re-render stations when new data arrives or when their configuration changes.
+
+If ENHYDRIS_SYNOPTIC_RENDER_ON_NEW_DATA is set, whenever a time series is saved
+(Enhydris saves the time series whenever data is appended to it) we find the
+synoptic group stations that use it and queue a re-render of these stations and of
+the map page of their synoptic group.
+
+If ENHYDRIS_SYNOPTIC_RENDER_ON_CHANGE is set, whenever a synoptic group, synoptic group
+station, synoptic time series group or chart window is saved or deleted (usually in the
+admin), we queue a re-render of the affected stations (or of the whole group) in the
+same way, but after a shorter delay.
+
+Re-renders are debounced and coalesced: the stations are marked as pending in the
+Django cache, and a single render_pending_stations task per synoptic group is queued
+to run after ENHYDRIS_SYNOPTIC_RENDER_DELAY seconds. Stations that get new data in the
+meantime are rendered by that same task, so a burst of uploads results in one render.
+The periodic create_static_files task remains as a safety net.
+
+From the moment a render is queued until render_pending_stations has finished, and
+while any other process is rendering the group, is_render_pending() is True (the
+admin uses it to show that the pages are being rendered).
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .locks import GroupLock
+from .models import SynopticGroupStation, SynopticTimeseriesGroup
+
+
+class StationIndex:
+    """Map time series group ids to the synoptic group stations that use them.
+
+    The index is kept in memory; it is rebuilt when the synoptic configuration
+    changes in this process (see invalidate()), and also every few minutes, in case
+    it has changed in another process.
+    """
+
+    max_age = 300
+
+    def __init__(self):
+        self._index = None
+
+    def get(self, timeseries_group_id):
+        """Return a set of (synoptic group id, synoptic group station id) tuples."""
+        if self._index is None or time.monotonic() - self._built > self.max_age:
+            self._build()
+        return self._index.get(timeseries_group_id, set())
+
+    def invalidate(self):
+        self._index = None
+
+    def _build(self):
+        index = defaultdict(set)
+        rows = SynopticTimeseriesGroup.objects.values_list(
+            "timeseries_group_id",
+            "synoptic_group_station__synoptic_group_id",
+            "synoptic_group_station_id",
+        )
+        for timeseries_group_id, synoptic_group_id, synoptic_group_station_id in rows:
+            index[timeseries_group_id].add(
+                (synoptic_group_id, synoptic_group_station_id)
+            )
+        self._index = dict(index)
+        self._built = time.monotonic()
+
+
+station_index = StationIndex()
+
+CHANGE_RENDER_DELAY = 2
+
+
+def render_on_new_data():
+    return getattr(settings, "ENHYDRIS_SYNOPTIC_RENDER_ON_NEW_DATA", False)
+
+
+def render_on_change():
+    return getattr(settings, "ENHYDRIS_SYNOPTIC_RENDER_ON_CHANGE", False)
+
+
+def timeseries_changed(timeseries):
+    stations_by_group = defaultdict(list)
+    for synoptic_group_id, synoptic_group_station_id in station_index.get(
+        timeseries.timeseries_group_id
+    ):
+        stations_by_group[synoptic_group_id].append(synoptic_group_station_id)
+    for synoptic_group_id, station_ids in stations_by_group.items():
+        queue_render(synoptic_group_id, station_ids)
+
+
+def synoptic_group_changed(synoptic_group_id):
+    station_ids = SynopticGroupStation.objects.filter(
+        synoptic_group_id=synoptic_group_id
+    ).values_list("id", flat=True)
+    queue_render(synoptic_group_id, station_ids, delay=CHANGE_RENDER_DELAY)
+
+
+def synoptic_group_station_changed(synoptic_group_id, synoptic_group_station_ids):
+    queue_render(
+        synoptic_group_id, synoptic_group_station_ids, delay=CHANGE_RENDER_DELAY
+    )
+
+
+def queue_render(synoptic_group_id, synoptic_group_station_ids, delay=None):
+    """Mark stations as pending and make sure a render of their group is queued.
+
+    The map page of the group is always rendered, so synoptic_group_station_ids may
+    be empty. If the render is already queued, "delay" is ignored.
+    """
+    from .tasks import render_pending_stations
+
+    cache.set_many(
+        {_pending_key(synoptic_group_id, x): True for x in synoptic_group_station_ids},
+        timeout=None,
+    )
+    if delay is None:
+        delay = getattr(settings, "ENHYDRIS_SYNOPTIC_RENDER_DELAY", 30)
+    if cache.add(_queued_key(synoptic_group_id), True, timeout=delay + 60):
+        render_pending_stations.apply_async(args=[synoptic_group_id], countdown=delay)
+
+
+def is_render_queued(synoptic_group_id):
+    return cache.get(_queued_key(synoptic_group_id)) is not None
+
+
+def is_render_pending(synoptic_group_id):
+    """Whether a render of the group is queued or is being executed."""
+    return (
+        is_render_queued(synoptic_group_id)
+        or bool(cache.get(_rendering_key(synoptic_group_id)))
+        or GroupLock(synoptic_group_id).is_held()
+    )
+
+
+def pop_pending_stations(synoptic_group_id):
+    """Return the ids of the group's pending stations and unmark them.
+
+    Also allows a new render of the group to be queued. Stations marked after this
+    is called will be rendered by that new render. The caller must call
+    render_finished() when it has rendered the stations.
+    """
+    # Several renders of the group may be executing (one of them waiting for the
+    # other's lock), so the marker counts them.
+    key = _rendering_key(synoptic_group_id)
+    timeout = getattr(settings, "ENHYDRIS_SYNOPTIC_LOCK_TIMEOUT", 1800)
+    if not cache.add(key, 1, timeout=timeout):
+        _incr(key, timeout)
+    cache.delete(_queued_key(synoptic_group_id))
+    station_ids = SynopticGroupStation.objects.filter(
+        synoptic_group_id=synoptic_group_id
+    ).values_list("id", flat=True)
+    keys = {_pending_key(synoptic_group_id, x): x for x in station_ids}
+    pending = cache.get_many(keys.keys())
+    cache.delete_many(pending.keys())
+    return [keys[key] for key in pending]
+
+
+def render_finished(synoptic_group_id):
+    """Record that a render started by pop_pending_stations() has finished."""
+    try:
+        cache.decr(_rendering_key(synoptic_group_id))
+    except ValueError:
+        pass  # The marker has expired
+
+
+def _incr(key, timeout):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=timeout)  # It expired after add() failed
+
+
+def _pending_key(synoptic_group_id, synoptic_group_station_id):
+    return f"enhydris_synoptic:pending:{synoptic_group_id}:{synoptic_group_station_id}"
+
+
+def _queued_key(synoptic_group_id):
+    return f"enhydris_synoptic:queued:{synoptic_group_id}"
+
+
+def _rendering_key(synoptic_group_id):
+    return f"enhydris_synoptic:rendering:{synoptic_group_id}"
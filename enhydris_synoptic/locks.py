@@ -0,0 +1,72 @@
+"""Make sure a synoptic group is not rendered by two processes at the same time.
+
+Renders are triggered by the periodic tasks and by events (see the events module), and
+a render may take longer than the interval between triggers. Before rendering a group
+we acquire its lock, which is a key in the Django cache (so the cache must be shared by
+all workers). If the group is locked, the new trigger is not executed; instead, it
+requests a follow-up, and the process that holds the lock renders the group once more
+when it finishes. Any number of triggers that arrive during a render thus result in a
+single follow-up render. The follow-up request is a counter, so that a request that
+arrives while the holder is checking for requests is not lost; and since a request may
+arrive after the holder's last check but before it releases the lock, the holder
+checks once more after releasing it (see tasks.render_synoptic_group_exclusively()).
+
+The lock expires after ENHYDRIS_SYNOPTIC_LOCK_TIMEOUT seconds, so that a crashed worker
+does not keep a group locked forever.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class GroupLock:
+    def __init__(self, synoptic_group_id):
+        self.key = f"enhydris_synoptic:lock:{synoptic_group_id}"
+        self.followup_key = f"enhydris_synoptic:followup:{synoptic_group_id}"
+        self.token = uuid.uuid4().hex
+        self.held_for = None  # Total, if the lock is acquired more than once
+
+    def acquire(self):
+        """Acquire the lock and return True, or return False if it is held."""
+        timeout = getattr(settings, "ENHYDRIS_SYNOPTIC_LOCK_TIMEOUT", 1800)
+        if not cache.add(self.key, self.token, timeout=timeout):
+            return False
+        self._acquired_at = time.monotonic()
+        return True
+
+    def is_held(self):
+        """Whether anyone (not necessarily this object) holds the lock."""
+        return cache.get(self.key) is not None
+
+    def release(self):
+        # If the lock has expired and been acquired by someone else, it isn't ours to
+        # delete.
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+        self.held_for = (self.held_for or 0) + time.monotonic() - self._acquired_at
+
+    def request_followup(self):
+        if cache.add(self.followup_key, 1, timeout=None):
+            return
+        try:
+            cache.incr(self.followup_key)
+        except ValueError:
+            # It was popped after add() failed
+            cache.set(self.followup_key, 1, timeout=None)
+
+    def pop_followup(self):
+        """Return whether a follow-up has been requested, and clear the request.
+
+        Only the requests that have been seen are subtracted, so a request made
+        meanwhile remains for the next call.
+        """
+        requests = cache.get(self.followup_key) or 0
+        if requests <= 0:
+            return False
+        try:
+            cache.decr(self.followup_key, requests)
+        except ValueError:
+            pass  # The key has been deleted (e.g. the cache has been cleared)
+        return True
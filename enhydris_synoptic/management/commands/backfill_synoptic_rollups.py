@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from enhydris.models import Timeseries
+from enhydris_synoptic.models import SynopticTimeseriesGroup, TimeseriesRollup
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate from scratch the hourly and daily rollups of the time series "
+        "used in synoptic groups."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--timeseries",
+            type=int,
+            nargs="+",
+            metavar="ID",
+            help="Only backfill these time series (default: all)",
+        )
+
+    def handle(self, *args, **options):
+        if options["timeseries"]:
+            timeseries = Timeseries.objects.filter(id__in=options["timeseries"])
+        else:
+            timeseries = SynopticTimeseriesGroup.objects.referenced_timeseries()
+        for atimeseries in timeseries:
+            TimeseriesRollup.objects.refresh(atimeseries, rebuild=True)
+            self.stdout.write(f"Backfilled rollups of time series {atimeseries.id}")
@@ -0,0 +1,183 @@
+import cProfile
+import io
+import pstats
+
+from django.core.management.base import BaseCommand, CommandError
+
+from enhydris_synoptic import earlywarnings, metrics
+from enhydris_synoptic.models import LatestValue, SynopticGroup
+from enhydris_synoptic.runs import Run
+from enhydris_synoptic.tasks import render_synoptic_group_exclusively
+from enhydris_synoptic.views import render_synoptic_group
+
+
+class Command(BaseCommand):
+    help = (
+        "Render synoptic groups (or some of their stations) and print how long each "
+        "stage took."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--group",
+            nargs="+",
+            metavar="SLUG",
+            help="Only render these synoptic groups (default: all)",
+        )
+        parser.add_argument(
+            "--station",
+            type=int,
+            nargs="+",
+            metavar="ID",
+            help=(
+                "Only render these stations (Enhydris station ids), and the map pages "
+                "of the synoptic groups that contain them"
+            ),
+        )
+        parser.add_argument(
+            "--jobs",
+            type=int,
+            metavar="N",
+            help=(
+                "Render charts in N processes (default: "
+                "ENHYDRIS_SYNOPTIC_CHART_PROCESSES)"
+            ),
+        )
+        only = parser.add_mutually_exclusive_group()
+        only.add_argument(
+            "--charts-only", action="store_true", help="Don't render the pages"
+        )
+        only.add_argument(
+            "--pages-only", action="store_true", help="Don't render the charts"
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Render the groups even if another process is rendering them",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only show what would be rendered",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Profile the render and show the functions that took longest",
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        targets = self._get_targets()
+        if options["dry_run"]:
+            self._show_targets(targets)
+            return
+        run = Run(
+            name="render_synoptic",
+            pages=not options["charts_only"],
+            charts=not options["pages_only"],
+            chart_processes=options["jobs"],
+            # With --profile the whole command is profiled, and cProfile can't nest
+            profile=False if options["profile"] else None,
+        )
+        profiler = cProfile.Profile() if options["profile"] else None
+        if profiler:
+            profiler.enable()
+        with run.timer("latest values"):
+            LatestValue.objects.refresh_all()
+        for sgroup, synoptic_group_station_ids in targets:
+            self._render(sgroup, run, synoptic_group_station_ids)
+        if profiler:
+            profiler.disable()
+        with run.timer("early warning emails"):
+            earlywarnings.send_messages(run.outbox)
+        run.log_summary()
+        metrics.write_metrics(run)
+        self._write_timing_report(run)
+        if profiler:
+            self._write_profile(profiler)
+
+    def _get_targets(self):
+        """Return a list of (synoptic group, synoptic group station ids) tuples.
+
+        The synoptic group station ids are None if all stations are to be rendered.
+        """
+        sgroups = SynopticGroup.objects.all()
+        if self.options["group"]:
+            sgroups = sgroups.filter(slug__in=self.options["group"])
+            missing = set(self.options["group"]) - {x.slug for x in sgroups}
+            if missing:
+                raise CommandError(
+                    "No such synoptic group: {}".format(", ".join(sorted(missing)))
+                )
+        if not self.options["station"]:
+            return [(sgroup, None) for sgroup in sgroups]
+        targets = []
+        found = set()
+        for sgroup in sgroups:
+            synstations = list(
+                sgroup.synopticgroupstation_set.filter(
+                    station_id__in=self.options["station"]
+                ).values_list("id", "station_id")
+            )
+            if synstations:
+                targets.append((sgroup, [x[0] for x in synstations]))
+                found.update(x[1] for x in synstations)
+        missing = set(self.options["station"]) - found
+        if missing:
+            raise CommandError(
+                "No such station in the synoptic groups: {}".format(
+                    ", ".join(str(x) for x in sorted(missing))
+                )
+            )
+        return targets
+
+    def _show_targets(self, targets):
+        for sgroup, synoptic_group_station_ids in targets:
+            synstations = sgroup.synopticgroupstation_set.all()
+            if synoptic_group_station_ids is not None:
+                synstations = synstations.filter(id__in=synoptic_group_station_ids)
+            nwindows = sgroup.chartwindow_set.count()
+            self.stdout.write(f"{sgroup.slug}:")
+            for synstation in synstations:
+                ncharts = synstation.synoptictimeseriesgroup_set.count() * (
+                    1 + nwindows
+                )
+                new_data = " (new data)" if synstation.has_new_data else ""
+                self.stdout.write(f"    {synstation}: {ncharts} charts{new_data}")
+
+    def _render(self, sgroup, run, synoptic_group_station_ids):
+        kwargs = {"run": run, "synoptic_group_station_ids": synoptic_group_station_ids}
+        try:
+            if self.options["force"]:
+                render_synoptic_group(sgroup, **kwargs)
+            elif not render_synoptic_group_exclusively(sgroup, **kwargs):
+                self.stdout.write(
+                    f"{sgroup.slug} is being rendered by another process; it will "
+                    "be rendered again when that finishes"
+                )
+        except Exception as e:
+            run.record_group(sgroup, "failed")
+            self.stderr.write(f"{sgroup.slug}: {e.__class__.__name__}: {e}")
+
+    def _write_timing_report(self, run):
+        self.stdout.write(f"{'Stage':<20}{'Seconds':>10}{'Count':>8}")
+        for stage, seconds in run.stage_times.items():
+            count = run.stage_counts[stage]
+            self.stdout.write(f"{stage:<20}{seconds:>10.2f}{count:>8}")
+        self.stdout.write(f"{'Total':<20}{run.duration:>10.2f}")
+        problems = {
+            key: outcome
+            for key, outcome in run.station_outcomes.items()
+            if outcome != "rendered"
+        }
+        for (group, station), outcome in sorted(problems.items()):
+            self.stdout.write(f"{group}/{station}: {outcome}")
+        for group, outcome in sorted(run.group_outcomes.items()):
+            self.stdout.write(f"{group}: {outcome}")
+
+    def _write_profile(self, profiler):
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats("cumulative").print_stats(25)
+        self.stdout.write(output.getvalue())
@@ -0,0 +1,114 @@
+"""Export the statistics of a run.
+
+After each run, write_metrics() writes the time spent in each stage and the other
+counts that the run has collected (see the runs module), for the whole run and for
+each synoptic group, to "metrics/{run.name}.prom" (in the Prometheus text format, for
+the node exporter's textfile collector) and to "metrics/{run.name}.json" in
+ENHYDRIS_SYNOPTIC_ROOT. Each run overwrites the files of the previous run with the same
+name.
+"""
+import json
+import os
+import time
+from collections import Counter
+
+from .views import File
+
+PREFIX = "enhydris_synoptic"
+
+
+def write_metrics(run):
+    File(os.path.join("metrics", f"{run.name}.prom")).write(get_prometheus_text(run))
+    File(os.path.join("metrics", f"{run.name}.json")).write(
+        json.dumps(get_summary(run), indent=2, sort_keys=True)
+    )
+
+
+def get_summary(run):
+    groups = {}
+    for (group, stage), seconds in run.group_stage_times.items():
+        stages = groups.setdefault(group, {"stages": {}, "counts": {}})["stages"]
+        stages[stage] = {
+            "seconds": seconds,
+            "count": run.group_stage_counts[(group, stage)],
+        }
+    for (group, name), n in run.group_counts.items():
+        groups.setdefault(group, {"stages": {}, "counts": {}})["counts"][name] = n
+    return {
+        "run": run.name,
+        "finished": time.time(),
+        "seconds": run.duration,
+        "stages": {
+            stage: {"seconds": seconds, "count": run.stage_counts[stage]}
+            for stage, seconds in run.stage_times.items()
+        },
+        "counts": dict(run.counts),
+        "stations": dict(Counter(run.station_outcomes.values())),
+        "groups": groups,
+        "problems": {
+            "stations": {
+                f"{group}/{station}": outcome
+                for (group, station), outcome in run.station_outcomes.items()
+                if outcome != "rendered"
+            },
+            "groups": dict(run.group_outcomes),
+        },
+    }
+
+
+def get_prometheus_text(run):
+    lines = []
+
+    def add(name, help_text, samples):
+        name = f"{PREFIX}_{name}"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            labels = {"run": run.name, **labels}
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+
+    add("run_finished_timestamp_seconds", "When the run finished", [({}, time.time())])
+    add("run_seconds", "Duration of the run", [({}, run.duration)])
+    add(
+        "stage_seconds",
+        "Time spent in each stage (stages may be nested)",
+        [({"stage": k}, v) for k, v in run.stage_times.items()],
+    )
+    add(
+        "stage_count",
+        "Number of times each stage was entered",
+        [({"stage": k}, v) for k, v in run.stage_counts.items()],
+    )
+    add(
+        "group_stage_seconds",
+        "Time spent in each stage for each synoptic group",
+        [({"group": g, "stage": k}, v) for (g, k), v in run.group_stage_times.items()],
+    )
+    add(
+        "group_stage_count",
+        "Number of times each stage was entered for each synoptic group",
+        [({"group": g, "stage": k}, v) for (g, k), v in run.group_stage_counts.items()],
+    )
+    for name in sorted(set(run.counts) | {k for g, k in run.group_counts}):
+        metric = name.replace(" ", "_")
+        add(metric, f"Number of {name}", [({}, run.counts[name])])
+        add(
+            f"group_{metric}",
+            f"Number of {name} for each synoptic group",
+            [({"group": g}, v) for (g, k), v in run.group_counts.items() if k == name],
+        )
+    outcomes = Counter(run.station_outcomes.values())
+    add(
+        "stations",
+        "Number of stations by outcome",
+        [
+            ({"outcome": outcome}, outcomes[outcome])
+            for outcome in ("rendered", "failed", "timed out", "skipped")
+        ],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.17 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("enhydris_synoptic", "0102_earlywarningemail"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChartWindow",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "duration",
+                    models.DurationField(
+                        help_text=(
+                            "The period shown by the chart, e.g. 7 days. Specify it "
+                            "in the format 'DD HH:MM:SS'. Windows up to 31 days use "
+                            "hourly values; longer windows use daily values."
+                        )
+                    ),
+                ),
+                (
+                    "synoptic_group",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="enhydris_synoptic.SynopticGroup",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Extra chart window",
+                "verbose_name_plural": "Extra chart windows",
+                "ordering": ["synoptic_group", "duration"],
+                "unique_together": {("synoptic_group", "duration")},
+            },
+        ),
+    ]
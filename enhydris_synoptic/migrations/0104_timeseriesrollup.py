@@ -0,0 +1,51 @@
+# Generated by Django 2.2.17 on 2026-10-18 10:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("enhydris", "0037_timeseries_groups"),
+        ("enhydris_synoptic", "0103_chartwindow"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimeseriesRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "unit",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")], max_length=4
+                    ),
+                ),
+                ("timestamp", models.DateTimeField()),
+                ("min", models.FloatField(null=True)),
+                ("max", models.FloatField(null=True)),
+                ("mean", models.FloatField(null=True)),
+                ("count", models.PositiveIntegerField()),
+                (
+                    "timeseries",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="enhydris.Timeseries",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["timeseries", "unit", "timestamp"],
+                "unique_together": {("timeseries", "unit", "timestamp")},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.17 on 2026-10-18 11:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("enhydris", "0037_timeseries_groups"),
+        ("enhydris_synoptic", "0104_timeseriesrollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LatestValue",
+            fields=[
+                (
+                    "timeseries",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="enhydris.Timeseries",
+                    ),
+                ),
+                ("timestamp", models.DateTimeField()),
+                ("value", models.FloatField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.17 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("enhydris_synoptic", "0105_latestvalue"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="synopticgroup",
+            name="last_rendered",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
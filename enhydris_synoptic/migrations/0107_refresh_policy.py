@@ -0,0 +1,56 @@
+# Generated by Django 2.2.17 on 2026-10-18 13:07
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("enhydris_synoptic", "0106_synopticgroup_last_rendered"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="synopticgroup",
+            name="refresh_policy",
+            field=models.CharField(
+                choices=[("fixed", "Fixed interval"), ("adaptive", "Adaptive")],
+                default="fixed",
+                help_text=(
+                    "With a fixed interval, the group is rendered every refresh "
+                    "interval. An adaptive policy learns how often the data of the "
+                    "group changes and renders it twice as often, but at least every "
+                    "hour, and not more often than the refresh interval."
+                ),
+                max_length=8,
+            ),
+        ),
+        migrations.AddField(
+            model_name="synopticgroup",
+            name="refresh_interval",
+            field=models.DurationField(
+                default=datetime.timedelta(0),
+                help_text=(
+                    "Zero means that the group is rendered every time the renderer "
+                    "runs. Specify it in seconds or in the format 'DD HH:MM:SS'."
+                ),
+            ),
+        ),
+        migrations.AddField(
+            model_name="synopticgroup",
+            name="data_interval",
+            field=models.DurationField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="synopticgroup",
+            name="last_data_date",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="synopticgroup",
+            name="next_render",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
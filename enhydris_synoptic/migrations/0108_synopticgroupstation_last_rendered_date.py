@@ -0,0 +1,18 @@
+# Generated by Django 2.2.17 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("enhydris_synoptic", "0107_refresh_policy"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="synopticgroupstation",
+            name="last_rendered_date",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.17 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("enhydris_synoptic", "0108_synopticgroupstation_last_rendered_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="synopticgroup",
+            name="renotify_interval",
+            field=models.DurationField(
+                blank=True,
+                help_text=(
+                    "Early warnings are sent when a variable goes out of its limits "
+                    "and when it returns within them. If a variable stays out of its "
+                    "limits, the warning is repeated this often; leave empty to not "
+                    "repeat it. Specify it in seconds or in the format 'DD HH:MM:SS'."
+                ),
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="synoptictimeseriesgroup",
+            name="hysteresis",
+            field=models.FloatField(
+                blank=True,
+                help_text=(
+                    "A variable that has gone out of its limits is considered back to "
+                    "normal only when it is within them by at least this much. This "
+                    "avoids repeated warnings when the variable fluctuates around a "
+                    "limit."
+                ),
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="AlarmState",
+            fields=[
+                (
+                    "synoptic_timeseries_group",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        serialize=False,
+                        to="enhydris_synoptic.SynopticTimeseriesGroup",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("ok", "Within limits"),
+                            ("low", "Low"),
+                            ("high", "High"),
+                        ],
+                        max_length=4,
+                    ),
+                ),
+                ("since", models.DateTimeField()),
+                ("last_notified", models.DateTimeField()),
+            ],
+        ),
+    ]
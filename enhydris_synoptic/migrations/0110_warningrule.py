@@ -0,0 +1,69 @@
+# Generated by Django 2.2.17 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("enhydris_synoptic", "0109_alarmstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WarningRule",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("above", "Above the threshold for the whole duration"),
+                            ("below", "Below the threshold for the whole duration"),
+                            (
+                                "rate",
+                                "Changed by more than the threshold within the "
+                                "duration",
+                            ),
+                            ("total", "Total within the duration above the threshold"),
+                        ],
+                        max_length=5,
+                    ),
+                ),
+                ("threshold", models.FloatField()),
+                (
+                    "duration",
+                    models.DurationField(
+                        help_text=(
+                            "The length of the window of data the rule looks at, up "
+                            "to 24 hours, ending at the last common date of the "
+                            "station. Specify it in seconds or in the format "
+                            "'HH:MM:SS'."
+                        )
+                    ),
+                ),
+                ("in_alarm", models.BooleanField(default=False, editable=False)),
+                ("last_notified", models.DateTimeField(editable=False, null=True)),
+                (
+                    "synoptic_timeseries_group",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="warning_rules",
+                        to="enhydris_synoptic.SynopticTimeseriesGroup",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["synoptic_timeseries_group", "id"],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.17 on 2026-10-18 19:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("enhydris_synoptic", "0110_warningrule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="synopticgroupstation",
+            name="stale",
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
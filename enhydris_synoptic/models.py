@@ -1,11 +1,23 @@
 import datetime as dt
+import math
 
 from django.conf import settings
-from django.core.mail import send_mail
-from django.db import IntegrityError, models
+from django.core.exceptions import ValidationError
+from django.core.mail import EmailMessage
+from django.db import IntegrityError, models, transaction
+from django.db.models import Q
+from django.utils import timezone
 from django.utils.translation import ugettext as _
 
-from enhydris.models import Station, TimeseriesGroup, TimeZone
+from enhydris.models import (
+    Station,
+    Timeseries,
+    TimeseriesGroup,
+    TimeseriesRecord,
+    TimeZone,
+)
+
+from . import records, runs, tailcache
 
 # NOTE: Confusingly, there are three distinct uses of "group" here. They refer to
 # different things:
@@ -25,7 +37,25 @@ from enhydris.models import Station, TimeseriesGroup, TimeZone
 # Yes, this sucks. Ideas on improving it are welcome.
 
 
+class SynopticGroupManager(models.Manager):
+    def due(self, now=None):
+        """Return the synoptic groups that need to be rendered according to policy."""
+        now = now or timezone.now()
+        return self.filter(Q(next_render__isnull=True) | Q(next_render__lte=now))
+
+
 class SynopticGroup(models.Model):
+    FIXED = "fixed"
+    ADAPTIVE = "adaptive"
+    REFRESH_POLICIES = ((FIXED, _("Fixed interval")), (ADAPTIVE, _("Adaptive")))
+
+    # An adaptive policy renders twice as often as the data changes, but not less
+    # often than this.
+    MAX_ADAPTIVE_REFRESH_INTERVAL = dt.timedelta(hours=1)
+
+    # The weight of the latest observation in the learned data interval
+    DATA_INTERVAL_SMOOTHING = 0.3
+
     name = models.CharField(max_length=50)
     slug = models.SlugField(unique=True, help_text="Identifier to be used in URL")
     stations = models.ManyToManyField(Station, through="SynopticGroupStation")
@@ -37,32 +67,250 @@ class SynopticGroup(models.Model):
             "shows green. Specify it in seconds or in the format 'DD HH:MM:SS'."
         )
     )
+    last_rendered = models.DateTimeField(null=True, blank=True, editable=False)
+    refresh_policy = models.CharField(
+        max_length=8,
+        choices=REFRESH_POLICIES,
+        default=FIXED,
+        help_text=_(
+            "With a fixed interval, the group is rendered every refresh interval. An "
+            "adaptive policy learns how often the data of the group changes and "
+            "renders it twice as often, but at least every hour, and not more often "
+            "than the refresh interval."
+        ),
+    )
+    refresh_interval = models.DurationField(
+        default=dt.timedelta(0),
+        help_text=_(
+            "Zero means that the group is rendered every time the renderer runs. "
+            "Specify it in seconds or in the format 'DD HH:MM:SS'."
+        ),
+    )
+    data_interval = models.DurationField(null=True, blank=True, editable=False)
+    last_data_date = models.DateTimeField(null=True, blank=True, editable=False)
+    next_render = models.DateTimeField(null=True, blank=True, editable=False)
+    renotify_interval = models.DurationField(
+        null=True,
+        blank=True,
+        help_text=_(
+            "Early warnings are sent when a variable goes out of its limits and when "
+            "it returns within them. If a variable stays out of its limits, the "
+            "warning is repeated this often; leave empty to not repeat it. Specify "
+            "it in seconds or in the format 'DD HH:MM:SS'."
+        ),
+    )
+
+    objects = SynopticGroupManager()
 
     def __str__(self):
         return self.name
 
-    def queue_warning(self, asyntsg):
+    def mark_rendered(self, synstations=None, complete=True):
+        """Record that the group has just been rendered and schedule the next render.
+
+        "synstations" are the stations of the group as used in the render, so that
+        their last common dates need not be determined again; the default is to read
+        them from the database. If "complete" is False (only some of the stations, or
+        only the pages or the charts, were rendered), only the time of the render is
+        recorded; the next render is not rescheduled, otherwise the stations that were
+        left out could miss their scheduled render.
+
+        We use update() rather than save() so that this does not count as a change of
+        the synoptic group (which would queue another render; see the events module).
+        """
+        self.last_rendered = timezone.now()
+        if not complete:
+            SynopticGroup.objects.filter(id=self.id).update(
+                last_rendered=self.last_rendered
+            )
+            return
+        self._learn_data_interval(synstations)
+        self.next_render = self.last_rendered + self._get_refresh_interval()
+        SynopticGroup.objects.filter(id=self.id).update(
+            last_rendered=self.last_rendered,
+            data_interval=self.data_interval,
+            last_data_date=self.last_data_date,
+            next_render=self.next_render,
+        )
+
+    def _learn_data_interval(self, synstations):
+        # The data interval is a moving average of the time between successive last
+        # dates of the group. Since the adaptive policy renders the group at least
+        # twice per data interval, the observed time between successive last dates
+        # converges to the actual interval between data.
+        last_data_date = self._get_last_data_date(synstations)
+        if last_data_date is None:
+            return
+        if self.last_data_date is not None and last_data_date > self.last_data_date:
+            observed = last_data_date - self.last_data_date
+            if self.data_interval is None:
+                self.data_interval = observed
+            else:
+                a = self.DATA_INTERVAL_SMOOTHING
+                self.data_interval = a * observed + (1 - a) * self.data_interval
+        self.last_data_date = last_data_date
+
+    def _get_last_data_date(self, synstations=None):
+        if synstations is None:
+            synstations = self.synopticgroupstation_set.all()
+        dates = [x.last_common_date for x in synstations if x.last_common_date]
+        return max(dates, default=None)
+
+    def _get_refresh_interval(self):
+        if self.refresh_policy != self.ADAPTIVE or self.data_interval is None:
+            return self.refresh_interval
+        adaptive_interval = min(
+            self.data_interval / 2, self.MAX_ADAPTIVE_REFRESH_INTERVAL
+        )
+        return max(self.refresh_interval, adaptive_interval)
+
+    @property
+    def latest_values(self):
+        """The cached latest values of the group's time series.
+
+        This is a dictionary that maps a time series id to its LatestValue object.
+        Time series that are not in the cache are not in the dictionary. Use
+        SynopticGroupStation.get_latest_value() to find the latest value of the
+        default time series of a synoptic time series group (a time series group may
+        have other time series in the cache, e.g. if its default has changed since
+        the cache was refreshed).
+        """
+        if not hasattr(self, "_latest_values"):
+            self._latest_values = self._get_latest_values()
+        return self._latest_values
+
+    def _get_latest_values(self):
+        run = getattr(self, "render_run", None)
+        if run is None:
+            return self._load_latest_values()
+        # In a run we load the latest values of all groups at once
+        return run.data_cache.get(
+            ("latest_values",), lambda: self._load_latest_values(all_groups=True)
+        )
+
+    def _load_latest_values(self, all_groups=False):
+        latest_values = LatestValue.objects.all()
+        if not all_groups:
+            timeseries_group_ids = SynopticTimeseriesGroup.objects.filter(
+                synoptic_group_station__synoptic_group=self
+            ).values("timeseries_group_id")
+            latest_values = latest_values.filter(
+                timeseries__timeseries_group_id__in=timeseries_group_ids
+            )
+        return {x.timeseries_id: x for x in latest_values}
+
+    def queue_warning(self, asyntsg, timestamp=None):
+        """Record asyntsg.value for the early warnings.
+
+        This must be called for every value that has been compared with the limits of
+        asyntsg, whether it is outside them or not, so that it can be found when a
+        variable returns within its limits; get_early_warning_message() decides what
+        to send. "timestamp" is the time of the value; the default is the last common
+        date of the station.
+        """
         if not hasattr(self, "early_warnings"):
             self.early_warnings = {}
-        timestamp = asyntsg.synoptic_group_station.last_common_date.replace(tzinfo=None)
-        self.early_warnings[asyntsg.get_title()] = {
+        if asyntsg.value is None or math.isnan(asyntsg.value):
+            return
+        if timestamp is None:
+            timestamp = asyntsg.synoptic_group_station.last_common_date
+        timestamp = timestamp.replace(tzinfo=None)
+        self.early_warnings[asyntsg.id] = {
             "station": asyntsg.synoptic_group_station.station.name,
             "timestamp": timestamp.isoformat(sep=" ", timespec="minutes"),
             "variable": asyntsg.get_title(),
             "value": asyntsg.value,
             "low_limit": asyntsg.low_limit,
             "high_limit": asyntsg.high_limit,
+            "hysteresis": asyntsg.hysteresis,
+            "status": asyntsg.get_value_status(asyntsg.value),
         }
 
-    def send_early_warning_emails(self):
-        if len(getattr(self, "early_warnings", {})) == 0:
+    def queue_rule_checks(self, asyntsg):
+        """Record the data windows needed by the warning rules of asyntsg.
+
+        The windows are copied, so the data of the station can be freed afterwards;
+        the rules are evaluated together by get_early_warning_message().
+        """
+        if not hasattr(self, "rule_checks"):
+            self.rule_checks = {}
+        rules = self._get_warning_rules().get(asyntsg.id, [])
+        if not rules:
             return
+        from .windowrules import RuleCheck
+
+        for rule in rules:
+            self.rule_checks[rule.id] = RuleCheck(rule, asyntsg)
+
+    def _get_warning_rules(self):
+        if not hasattr(self, "_warning_rules"):
+            self._warning_rules = {}
+            rules = WarningRule.objects.filter(
+                synoptic_timeseries_group__synoptic_group_station__synoptic_group=self
+            )
+            for rule in rules:
+                self._warning_rules.setdefault(
+                    rule.synoptic_timeseries_group_id, []
+                ).append(rule)
+        return self._warning_rules
+
+    def get_early_warning_message(self):
+        """Update the alarm states and return the early warning email, or None.
+
+        Only the variables whose alarm state has changed (or which need to be notified
+        again; see renotify_interval) are included; afterwards, early_warnings
+        contains only these.
+        """
+        early_warnings = getattr(self, "early_warnings", {})
+        notify = AlarmState.objects.update_states(
+            early_warnings, self.renotify_interval
+        )
+        self.early_warnings = {k: v for k, v in early_warnings.items() if k in notify}
+        self.early_warnings.update(self._get_rule_warnings())
+        if len(self.early_warnings) == 0:
+            return None
         emails = [x.email for x in self.earlywarningemail_set.all()]
+        if not emails:
+            return None
         content = ""
         for var in self.early_warnings:
             content += self._get_early_warning_line(self.early_warnings[var])
         subject = self._get_warning_email_subject()
-        send_mail(subject, content, settings.DEFAULT_FROM_EMAIL, emails)
+        return EmailMessage(subject, content, settings.DEFAULT_FROM_EMAIL, emails)
+
+    def _get_rule_warnings(self):
+        checks = list(getattr(self, "rule_checks", {}).values())
+        if not checks:
+            return {}
+        from .windowrules import evaluate
+
+        triggered, measured = evaluate(checks)
+        # A rule that couldn't measure anything (e.g. no data) keeps its state
+        results = [
+            (check, bool(t), float(m))
+            for check, t, m in zip(checks, triggered, measured)
+            if not math.isnan(m)
+        ]
+        notify = WarningRule.objects.update_states(
+            [(check.rule, t) for check, t, m in results], self.renotify_interval
+        )
+        return {
+            f"rule{check.rule.id}": {
+                "station": check.station,
+                "timestamp": check.timestamp,
+                "variable": check.variable,
+                "value": round(m, 6),
+                "status": "rule" if t else "ok",
+                "rule": check.rule.description,
+            }
+            for check, t, m in results
+            if check.rule.id in notify
+        }
+
+    def send_early_warning_emails(self):
+        message = self.get_early_warning_message()
+        if message is not None:
+            message.send()
 
     def _get_warning_email_subject(self):
         stations = list({v["station"] for k, v in self.early_warnings.items()})
@@ -75,12 +323,12 @@ class SynopticGroup(models.Model):
         variable = data["variable"]
         value = data["value"]
         timestamp = data["timestamp"]
-        if data["high_limit"] is not None and value > data["high_limit"]:
-            lowhigh = "high"
-            limit = data["high_limit"]
-        else:
-            lowhigh = "low"
-            limit = data["low_limit"]
+        if data["status"] == "ok":
+            return f"{station} {timestamp} {variable} {value} (back to normal)\n"
+        if data["status"] == "rule":
+            return f"{station} {timestamp} {variable} {value} ({data['rule']})\n"
+        lowhigh = data["status"]
+        limit = data[f"{lowhigh}_limit"]
         return f"{station} {timestamp} {variable} {value} ({lowhigh} limit {limit})\n"
 
 
@@ -93,6 +341,44 @@ class EarlyWarningEmail(models.Model):
         verbose_name_plural = _("Where to send early warnings")
 
 
+class ChartWindow(models.Model):
+    """An additional chart period for the stations of a synoptic group.
+
+    Each station page always shows charts of the last 24 hours. For each chart window,
+    it additionally shows charts of the specified duration (e.g. the last 7 days).
+    These longer charts use hourly or daily aggregates rather than the raw records, so
+    that they cost about the same as the 24-hour charts.
+    """
+
+    synoptic_group = models.ForeignKey(SynopticGroup, on_delete=models.CASCADE)
+    duration = models.DurationField(
+        help_text=_(
+            "The period shown by the chart, e.g. 7 days. Specify it in the format "
+            "'DD HH:MM:SS'. Windows up to 31 days use hourly values; longer windows "
+            "use daily values."
+        )
+    )
+
+    class Meta:
+        unique_together = (("synoptic_group", "duration"),)
+        ordering = ["synoptic_group", "duration"]
+        verbose_name = _("Extra chart window")
+        verbose_name_plural = _("Extra chart windows")
+
+    def __str__(self):
+        return self.slug
+
+    @property
+    def slug(self):
+        """Short identifier used in the chart file names, e.g. "7d" or "36h"."""
+        hours = int(self.duration.total_seconds() // 3600)
+        return f"{hours // 24}d" if hours % 24 == 0 else f"{hours}h"
+
+    @property
+    def aggregation_unit(self):
+        return "hour" if self.duration <= dt.timedelta(days=31) else "day"
+
+
 class SynopticGroupStation(models.Model):
     synoptic_group = models.ForeignKey(SynopticGroup, on_delete=models.CASCADE)
     station = models.ForeignKey(Station, on_delete=models.CASCADE)
@@ -100,6 +386,9 @@ class SynopticGroupStation(models.Model):
     timeseries_groups = models.ManyToManyField(
         TimeseriesGroup, through="SynopticTimeseriesGroup"
     )
+    last_rendered_date = models.DateTimeField(null=True, blank=True, editable=False)
+    # Whether the station was stale when last checked by staleness.check_stations()
+    stale = models.BooleanField(default=False, editable=False)
 
     class Meta:
         unique_together = (("synoptic_group", "order"),)
@@ -147,54 +436,64 @@ class SynopticGroupStation(models.Model):
     def synoptic_timeseries_groups(self):
         """List of synoptic timeseries group objects with data.
 
-        The objects in the list have attribute "data", which is a pandas dataframe with
-        the last 24 hours preceding the last common date, "value", which is the
-        value at the last common date, and "value_status" which is the string "ok",
+        The objects in the list have attribute "data", which is a records.SeriesArrays
+        object with the last 24 hours preceding the last common date, "value", which is
+        the value at the last common date, and "value_status" which is the string "ok",
         "high" or "low", depending on where "value" is compared to low_limit and
         high_limit.
         """
         if not hasattr(self, "_synoptic_timeseries_groups"):
-            self._determine_timeseries_groups()
+            with runs.timer(self.synoptic_group, "timeseries groups"):
+                self._determine_timeseries_groups()
         return self._synoptic_timeseries_groups
 
     def _determine_timeseries_groups(self):
         if self.last_common_date is None:
             self._synoptic_timeseries_groups = []
             return
-        start_date = self.last_common_date - dt.timedelta(minutes=1439)
-        self._synoptic_timeseries_groups = list(self.synoptictimeseriesgroup_set.all())
+        self._synoptic_timeseries_groups = list(self._get_synoptictimeseriesgroups())
         self.error = False  # This may be changed by _set_ts_value()
         for asyntsg in self._synoptic_timeseries_groups:
-            asyntsg.data = asyntsg.timeseries_group.default_timeseries.get_data(
-                start_date=start_date, end_date=self.last_common_date
-            ).data
             self._set_tsg_value(asyntsg)
             self._set_tsg_value_status(asyntsg)
+            self.synoptic_group.queue_rule_checks(asyntsg)
+
+    def _get_synoptictimeseriesgroups(self):
+        if not hasattr(self, "_synoptictimeseriesgroups"):
+            self._synoptictimeseriesgroups = list(
+                self.synoptictimeseriesgroup_set.select_related(
+                    "timeseries_group__time_zone",
+                    "timeseries_group__unit_of_measurement",
+                    "timeseries_group__variable",
+                    "group_with",
+                )
+            )
+        return self._synoptictimeseriesgroups
 
     def _set_tsg_value(self, asyntsg):
+        # If the cached latest value is at the last common date we use it; otherwise
+        # we need to look into the data (which are then loaded from the database).
+        latest = self.get_latest_value(asyntsg)
+        if latest is not None and latest.timestamp == self.last_common_date:
+            asyntsg.value = float("nan") if latest.value is None else latest.value
+            return
         try:
-            asyntsg.value = asyntsg.data.loc[
+            asyntsg.value = asyntsg.data.value_at(
                 self.last_common_date.replace(tzinfo=None)
-            ]["value"]
+            )
         except KeyError:
             self.error = True
 
     def _set_tsg_value_status(self, asyntsg):
-        if not hasattr(asyntsg, "value") or asyntsg.value is None:
-            asyntsg.value_status = "error"
-        elif asyntsg.low_limit is not None and asyntsg.value < asyntsg.low_limit:
-            asyntsg.value_status = "low"
+        asyntsg.value_status = asyntsg.get_value_status(getattr(asyntsg, "value", None))
+        if asyntsg.value_status != "error" and asyntsg.has_limits:
             self.synoptic_group.queue_warning(asyntsg)
-        elif asyntsg.high_limit is not None and asyntsg.value > asyntsg.high_limit:
-            asyntsg.value_status = "high"
-            self.synoptic_group.queue_warning(asyntsg)
-        else:
-            asyntsg.value_status = "ok"
 
     @property
     def last_common_date(self):
         if not hasattr(self, "_last_common_date"):
-            self._determine_last_common_date()
+            with runs.timer(self.synoptic_group, "last common date"):
+                self._determine_last_common_date()
         return self._last_common_date
 
     def _determine_last_common_date(self):
@@ -202,12 +501,56 @@ class SynopticGroupStation(models.Model):
         # we get the minimum of the last dates of the timeseries, which will usually be
         # the last common date. station is an enhydris_synoptic.models.Station object.
         last_common_date = None
-        for asyntsg in self.synoptictimeseriesgroup_set.all():
-            end_date = asyntsg.timeseries_group.default_timeseries.end_date
+        for asyntsg in self._get_synoptictimeseriesgroups():
+            end_date = self._get_end_date(asyntsg)
             if end_date and ((not last_common_date) or (end_date < last_common_date)):
                 last_common_date = end_date
         self._last_common_date = last_common_date
 
+    def get_latest_value(self, asyntsg):
+        """Return the cached LatestValue of the default time series of asyntsg.
+
+        Return None if it is not in the cache.
+        """
+        timeseries = asyntsg.get_default_timeseries()
+        if timeseries is None:
+            return None
+        return self.synoptic_group.latest_values.get(timeseries.id)
+
+    def _get_end_date(self, asyntsg):
+        latest = self.get_latest_value(asyntsg)
+        if latest is None:
+            timeseries = asyntsg.get_default_timeseries()
+            return runs.get_cached(
+                self.synoptic_group,
+                ("end_date", timeseries.id),
+                lambda: timeseries.end_date,
+            )
+        tzinfo = asyntsg.timeseries_group.time_zone.as_tzinfo
+        return latest.timestamp.astimezone(tzinfo)
+
+    def free_data(self):
+        """Release the data of the synoptic timeseries groups.
+
+        The latest values (and everything else that is needed for the map page) are
+        kept; the data is read again if it is needed again.
+        """
+        for asyntsg in getattr(self, "_synoptic_timeseries_groups", []):
+            vars(asyntsg).pop("_data", None)
+            vars(asyntsg).pop("_window_data", None)
+
+    @property
+    def has_new_data(self):
+        """Whether the last common date has changed since the station was rendered."""
+        return self.last_common_date != self.last_rendered_date
+
+    def mark_rendered(self):
+        # See SynopticGroup.mark_rendered() for why we use update()
+        self.last_rendered_date = self.last_common_date
+        SynopticGroupStation.objects.filter(id=self.id).update(
+            last_rendered_date=self.last_rendered_date
+        )
+
     @property
     def last_common_date_pretty(self):
         return self.last_common_date and self.last_common_date.strftime(
@@ -243,6 +586,20 @@ class SynopticTimeseriesGroupManager(models.Manager):
         """Return only time series groups that don't have group_with."""
         return self.filter(group_with__isnull=True)
 
+    def referenced_timeseries(self):
+        """Return the default time series of all synoptic timeseries groups.
+
+        Each time series is returned only once, even if its time series group is used
+        in many synoptic groups.
+        """
+        result = {}
+        tsg_ids = self.values_list("timeseries_group_id", flat=True).distinct()
+        for tsg in TimeseriesGroup.objects.filter(id__in=tsg_ids):
+            timeseries = tsg.default_timeseries
+            if timeseries is not None:
+                result[timeseries.id] = timeseries
+        return list(result.values())
+
 
 class SynopticTimeseriesGroup(models.Model):
     synoptic_group_station = models.ForeignKey(
@@ -273,6 +630,15 @@ class SynopticTimeseriesGroup(models.Model):
             "If the variable goes higher than this, it will be shown red on the map."
         ),
     )
+    hysteresis = models.FloatField(
+        blank=True,
+        null=True,
+        help_text=_(
+            "A variable that has gone out of its limits is considered back to normal "
+            "only when it is within them by at least this much. This avoids repeated "
+            "warnings when the variable fluctuates around a limit."
+        ),
+    )
     group_with = models.ForeignKey(
         "self",
         blank=True,
@@ -334,3 +700,422 @@ class SynopticTimeseriesGroup(models.Model):
         if self.subtitle:
             result += " (" + self.subtitle + ")"
         return result
+
+    @property
+    def has_limits(self):
+        return self.low_limit is not None or self.high_limit is not None
+
+    def get_value_status(self, value):
+        """Return "ok", "low", "high" or "error", comparing value to the limits."""
+        if value is None:
+            return "error"
+        elif self.low_limit is not None and value < self.low_limit:
+            return "low"
+        elif self.high_limit is not None and value > self.high_limit:
+            return "high"
+        return "ok"
+
+    def get_default_timeseries(self):
+        return runs.get_cached(
+            self.synoptic_group_station.synoptic_group,
+            ("default_timeseries", self.timeseries_group_id),
+            lambda: self.timeseries_group.default_timeseries,
+        )
+
+    @property
+    def data(self):
+        """The data of the last 24 hours preceding the last common date.
+
+        This is a records.SeriesArrays object. It is read from the database (or from
+        the tail cache) the first time it is needed.
+        """
+        if not hasattr(self, "_data"):
+            self._data = self._read_data()
+        return self._data
+
+    def _read_data(self):
+        timeseries = self.get_default_timeseries()
+        end_date = self.synoptic_group_station.last_common_date
+        start_date = end_date - dt.timedelta(minutes=1439)
+        return runs.get_cached(
+            self.synoptic_group_station.synoptic_group,
+            ("data", timeseries.id, start_date, end_date),
+            lambda: self._read_data_uncached(timeseries, start_date, end_date),
+            series=True,
+        )
+
+    def _read_data_uncached(self, timeseries, start_date, end_date):
+        if tailcache.is_enabled():
+            data = tailcache.TailCache(timeseries).get_arrays(start_date, end_date)
+            if data is not None:
+                return data
+        return records.read_arrays(timeseries, start_date, end_date)
+
+    def get_window_data(self, window):
+        """Return the aggregated data for a ChartWindow.
+
+        The result is a pandas dataframe like "data" (see
+        SynopticGroupStation.synoptic_timeseries_groups), except that it has one row
+        per hour or day (see ChartWindow.aggregation_unit) of the window preceding the
+        last common date.
+        """
+        if not hasattr(self, "_window_data"):
+            self._window_data = {}
+        if window.id not in self._window_data:
+            timeseries = self.get_default_timeseries()
+            unit = window.aggregation_unit
+            end_date = self.synoptic_group_station.last_common_date
+            start_date = end_date - window.duration
+            self._window_data[window.id] = runs.get_cached(
+                self.synoptic_group_station.synoptic_group,
+                ("window_data", timeseries.id, unit, start_date, end_date),
+                lambda: TimeseriesRollup.objects.get_data(
+                    timeseries, unit, start_date=start_date, end_date=end_date
+                ),
+                series=True,
+            )
+        return self._window_data[window.id]
+
+    def get_window_arrays(self, window):
+        """Same as get_window_data(), but return a records.SeriesArrays object."""
+        return records.SeriesArrays.from_dataframe(self.get_window_data(window))
+
+
+class TimeseriesRollupManager(models.Manager):
+    def refresh(self, timeseries, rebuild=False):
+        """Bring the hourly and daily rollups of a time series up to date.
+
+        Normally only the last stored hour (or day), which may have been incomplete,
+        and those after it are recalculated. If "rebuild" is True, all the rollups of
+        the time series are recalculated from the beginning; this is needed if the
+        time series data have been replaced rather than appended to.
+        """
+        for unit in (TimeseriesRollup.HOUR, TimeseriesRollup.DAY):
+            self._refresh_unit(timeseries, unit, rebuild)
+
+    def _refresh_unit(self, timeseries, unit, rebuild):
+        existing = self.filter(timeseries=timeseries, unit=unit)
+        last_rollup = None if rebuild else existing.order_by("-timestamp").first()
+        since = last_rollup and last_rollup.timestamp
+        rows = records.aggregate_rows(timeseries, unit, start_date=since)
+        utc_offset = records.get_utc_offset(timeseries)
+        new_rollups = [
+            TimeseriesRollup(
+                timeseries=timeseries,
+                unit=unit,
+                timestamp=records.to_aware(timestamp, utc_offset),
+                min=min_value,
+                max=max_value,
+                mean=mean_value,
+                count=count,
+            )
+            for timestamp, min_value, max_value, mean_value, count in rows
+        ]
+        with transaction.atomic():
+            if since is not None:
+                existing = existing.filter(timestamp__gte=since)
+            existing.delete()
+            self.bulk_create(new_rollups, batch_size=1000)
+
+    def refresh_all(self, rebuild=False):
+        for timeseries in SynopticTimeseriesGroup.objects.referenced_timeseries():
+            self.refresh(timeseries, rebuild=rebuild)
+
+    def get_data(self, timeseries, unit, start_date, end_date):
+        """Return the aggregated data of a time series for a period.
+
+        The result is the same as that of records.aggregate(), but the stored rollups
+        are used wherever possible. Only the last stored hour (or day), which may have
+        been incomplete, and any data after it are aggregated from the records.
+        """
+        rollups = list(
+            self.filter(
+                timeseries=timeseries,
+                unit=unit,
+                timestamp__gte=start_date,
+                timestamp__lte=end_date,
+            )
+            .order_by("timestamp")
+            .values_list("timestamp", "min", "max", "mean", "count")
+        )
+        tail_start_date = rollups.pop()[0] if rollups else start_date
+        utc_offset = records.get_utc_offset(timeseries)
+        rows = [(records.to_local(r[0], utc_offset), *r[1:]) for r in rollups]
+        rows += records.aggregate_rows(timeseries, unit, tail_start_date, end_date)
+        return records.rows_to_dataframe(rows)
+
+
+class TimeseriesRollup(models.Model):
+    """Hourly or daily statistics of a time series used in synoptic groups.
+
+    The rollups are maintained by the update_rollups task, and they can be
+    recalculated from scratch with the backfill_synoptic_rollups management command.
+    "timestamp" is the beginning of the hour or day in the time zone of the time
+    series group.
+    """
+
+    HOUR = "hour"
+    DAY = "day"
+    UNITS = ((HOUR, _("Hour")), (DAY, _("Day")))
+
+    timeseries = models.ForeignKey(Timeseries, on_delete=models.CASCADE)
+    unit = models.CharField(max_length=4, choices=UNITS)
+    timestamp = models.DateTimeField()
+    min = models.FloatField(null=True)
+    max = models.FloatField(null=True)
+    mean = models.FloatField(null=True)
+    count = models.PositiveIntegerField()
+
+    objects = TimeseriesRollupManager()
+
+    class Meta:
+        unique_together = (("timeseries", "unit", "timestamp"),)
+        ordering = ["timeseries", "unit", "timestamp"]
+
+    def __str__(self):
+        return f"{self.timeseries} {self.unit} {self.timestamp}"
+
+
+class AlarmStateManager(models.Manager):
+    def update_states(self, early_warnings, renotify_interval=None):
+        """Update the alarm states and return the ids of those to be notified.
+
+        "early_warnings" is a dictionary like SynopticGroup.early_warnings; the
+        "status" of its items is changed according to the hysteresis, if needed.
+        Items are to be notified if their status has changed, or, if
+        renotify_interval is specified, if they are still out of their limits that
+        long after they were last notified.
+        """
+        now = timezone.now()
+        states = self.in_bulk(list(early_warnings))
+        to_create, to_update, notify = [], [], set()
+        for syntsg_id, data in early_warnings.items():
+            state = states.get(syntsg_id)
+            previous_status = state.status if state else "ok"
+            data["status"] = _apply_hysteresis(data, previous_status)
+            if state is None:
+                if data["status"] == "ok":
+                    continue
+                state = AlarmState(synoptic_timeseries_group_id=syntsg_id)
+                to_create.append(state)
+            elif data["status"] != previous_status or _is_due(
+                state, renotify_interval, now
+            ):
+                to_update.append(state)
+            else:
+                continue
+            if data["status"] != previous_status:
+                state.status = data["status"]
+                state.since = now
+            state.last_notified = now
+            notify.add(syntsg_id)
+        self.bulk_create(to_create)
+        self.bulk_update(to_update, ["status", "since", "last_notified"])
+        return notify
+
+
+def _apply_hysteresis(data, previous_status):
+    hysteresis = data["hysteresis"] or 0
+    if data["status"] != "ok" or previous_status == "ok":
+        return data["status"]
+    limit = data[f"{previous_status}_limit"]
+    if limit is None:
+        return data["status"]
+    if previous_status == "high" and data["value"] > limit - hysteresis:
+        return "high"
+    if previous_status == "low" and data["value"] < limit + hysteresis:
+        return "low"
+    return data["status"]
+
+
+def _is_due(state, renotify_interval, now):
+    if state.status == "ok" or renotify_interval is None:
+        return False
+    return now - state.last_notified >= renotify_interval
+
+
+class AlarmState(models.Model):
+    """Whether a synoptic timeseries group is out of its limits.
+
+    Early warnings are only sent when this changes (see
+    SynopticGroup.get_early_warning_message()). A synoptic timeseries group that has
+    no state is within its limits.
+    """
+
+    STATUSES = (("ok", _("Within limits")), ("low", _("Low")), ("high", _("High")))
+
+    synoptic_timeseries_group = models.OneToOneField(
+        SynopticTimeseriesGroup, on_delete=models.CASCADE, primary_key=True
+    )
+    status = models.CharField(max_length=4, choices=STATUSES)
+    since = models.DateTimeField()
+    last_notified = models.DateTimeField()
+
+    objects = AlarmStateManager()
+
+    def __str__(self):
+        return f"{self.synoptic_timeseries_group}: {self.status}"
+
+
+class WarningRuleManager(models.Manager):
+    def update_states(self, results, renotify_interval=None):
+        """Update in_alarm and return the ids of the rules to be notified.
+
+        "results" is a list of (rule, triggered) tuples. Like in
+        AlarmStateManager.update_states(), rules are to be notified if they have
+        been triggered or have stopped being triggered, or, if renotify_interval is
+        specified, if they are still triggered that long after they were last
+        notified.
+        """
+        now = timezone.now()
+        to_update, notify = [], set()
+        for rule, triggered in results:
+            is_due = (
+                rule.in_alarm
+                and renotify_interval is not None
+                and now - rule.last_notified >= renotify_interval
+            )
+            if triggered == rule.in_alarm and not is_due:
+                continue
+            rule.in_alarm = triggered
+            rule.last_notified = now
+            to_update.append(rule)
+            notify.add(rule.id)
+        self.bulk_update(to_update, ["in_alarm", "last_notified"])
+        return notify
+
+
+class WarningRule(models.Model):
+    """An early warning rule that looks at a window of data; see windowrules."""
+
+    ABOVE = "above"
+    BELOW = "below"
+    RATE = "rate"
+    TOTAL = "total"
+    KINDS = (
+        (ABOVE, _("Above the threshold for the whole duration")),
+        (BELOW, _("Below the threshold for the whole duration")),
+        (RATE, _("Changed by more than the threshold within the duration")),
+        (TOTAL, _("Total within the duration above the threshold")),
+    )
+
+    synoptic_timeseries_group = models.ForeignKey(
+        SynopticTimeseriesGroup, on_delete=models.CASCADE, related_name="warning_rules"
+    )
+    kind = models.CharField(max_length=5, choices=KINDS)
+    threshold = models.FloatField()
+    duration = models.DurationField(
+        help_text=_(
+            "The length of the window of data the rule looks at, up to 24 hours, "
+            "ending at the last common date of the station. Specify it in seconds or "
+            "in the format 'HH:MM:SS'."
+        )
+    )
+    in_alarm = models.BooleanField(default=False, editable=False)
+    last_notified = models.DateTimeField(null=True, editable=False)
+
+    objects = WarningRuleManager()
+
+    class Meta:
+        ordering = ["synoptic_timeseries_group", "id"]
+
+    def __str__(self):
+        return f"{self.synoptic_timeseries_group}: {self.description}"
+
+    @property
+    def description(self):
+        formats = {
+            self.ABOVE: _("above {threshold} for {duration}"),
+            self.BELOW: _("below {threshold} for {duration}"),
+            self.RATE: _("changed by more than {threshold} in {duration}"),
+            self.TOTAL: _("total in {duration} above {threshold}"),
+        }
+        return formats[self.kind].format(
+            threshold=self.threshold, duration=self.duration
+        )
+
+    def clean(self):
+        # Except for "total", rules need the value at or before the start of the
+        # window, and the data only goes 24 hours back.
+        if self.duration is None:
+            return
+        max_duration = dt.timedelta(days=1)
+        if self.duration <= dt.timedelta(0) or self.duration > max_duration:
+            raise ValidationError(
+                {"duration": _("The duration must be positive and at most 24 hours.")}
+            )
+        if self.kind != self.TOTAL and self.duration == max_duration:
+            raise ValidationError(
+                {"duration": _('Only "total" rules can have a duration of 24 hours.')}
+            )
+
+
+class LatestValueManager(models.Manager):
+    def refresh(self, timeseries_list, rebuild=False):
+        """Update the cached latest values of the specified time series.
+
+        Only records newer than the cached ones are searched, and all time series are
+        searched in a single query. If the data of a time series has been replaced
+        rather than appended to, the cache must be rebuilt (rebuild=True).
+        """
+        if rebuild:
+            self.filter(timeseries__in=timeseries_list).delete()
+        cached = {
+            x.timeseries_id: x for x in self.filter(timeseries__in=timeseries_list)
+        }
+        condition = Q()
+        for timeseries in timeseries_list:
+            timeseries_condition = Q(timeseries_id=timeseries.id)
+            if timeseries.id in cached:
+                timeseries_condition &= Q(timestamp__gt=cached[timeseries.id].timestamp)
+            condition |= timeseries_condition
+        if not condition:
+            return
+        newer_records = (
+            TimeseriesRecord.objects.filter(condition)
+            .order_by("timeseries_id", "-timestamp")
+            .distinct("timeseries_id")
+            .values_list("timeseries_id", "timestamp", "value")
+        )
+        to_create, to_update = [], []
+        for timeseries_id, timestamp, value in newer_records:
+            latest_value = cached.get(timeseries_id)
+            if latest_value is None:
+                to_create.append(
+                    LatestValue(
+                        timeseries_id=timeseries_id, timestamp=timestamp, value=value
+                    )
+                )
+            else:
+                latest_value.timestamp = timestamp
+                latest_value.value = value
+                to_update.append(latest_value)
+        self.bulk_create(to_create)
+        self.bulk_update(to_update, ["timestamp", "value"])
+
+    def refresh_all(self, rebuild=False):
+        """Update the cached latest values of all time series used in synoptic."""
+        timeseries_list = SynopticTimeseriesGroup.objects.referenced_timeseries()
+        self.exclude(timeseries__in=timeseries_list).delete()
+        self.refresh(timeseries_list, rebuild=rebuild)
+
+
+class LatestValue(models.Model):
+    """The last record of a time series used in synoptic groups.
+
+    The cache is maintained by LatestValueManager.refresh_all() (which is called by the
+    refresh_latest_values and create_static_files tasks), and it allows finding the
+    last common date of a station and its current values without reading the
+    records.
+    """
+
+    timeseries = models.OneToOneField(
+        Timeseries, on_delete=models.CASCADE, primary_key=True
+    )
+    timestamp = models.DateTimeField()
+    value = models.FloatField(null=True)
+
+    objects = LatestValueManager()
+
+    def __str__(self):
+        return f"{self.timeseries} {self.timestamp} {self.value}"
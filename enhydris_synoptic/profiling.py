@@ -0,0 +1,88 @@
+"""Profile the rendering of synoptic groups.
+
+If ENHYDRIS_SYNOPTIC_PROFILE is set (or if the task is called with profile=True), the
+rendering of each synoptic group is run under cProfile. For each profiled render, a
+"{time}-{run name}-{group slug}.prof" file (which can be examined with pstats or
+snakeviz) and a ".txt" file with the functions that took longest are written to
+ENHYDRIS_SYNOPTIC_PROFILE_DIR; only the newest ENHYDRIS_SYNOPTIC_PROFILE_KEEP profiles
+are kept.
+
+cProfile slows rendering down considerably, so to keep profiling on in production set
+ENHYDRIS_SYNOPTIC_PROFILE_SAMPLE_RATE to the fraction of renders that should be
+profiled (e.g. 0.05). Only the calling process is profiled; charts rendered in other
+processes (see ENHYDRIS_SYNOPTIC_CHART_PROCESSES) are not.
+"""
+import cProfile
+import glob
+import io
+import os
+import pstats
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+def get_directory():
+    # Not under ENHYDRIS_SYNOPTIC_ROOT, which is served to the public; the profiles
+    # show the source paths and internals of the installation.
+    default = os.path.join(tempfile.gettempdir(), "enhydris-synoptic-profiles")
+    return getattr(settings, "ENHYDRIS_SYNOPTIC_PROFILE_DIR", default)
+
+
+def should_profile(run):
+    if run.profile is not None:
+        return run.profile
+    if not getattr(settings, "ENHYDRIS_SYNOPTIC_PROFILE", False):
+        return False
+    sample_rate = getattr(settings, "ENHYDRIS_SYNOPTIC_PROFILE_SAMPLE_RATE", 1.0)
+    return random.random() < sample_rate
+
+
+@contextmanager
+def profile(synoptic_group, run):
+    """Profile the block, if so configured, and save the results."""
+    if not should_profile(run):
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        timestamp = time.strftime("%Y%m%dT%H%M%S")
+        _save(profiler, f"{timestamp}-{run.name}-{synoptic_group.slug}")
+        _rotate()
+
+
+def _save(profiler, basename):
+    directory = get_directory()
+    os.makedirs(directory, exist_ok=True)
+    pathname = os.path.join(directory, basename)
+    profiler.dump_stats(pathname + ".prof")
+    with open(pathname + ".txt", "w") as f:
+        f.write(get_summary(profiler))
+
+
+def get_summary(profiler):
+    """Return the top functions by cumulative and by own time, as text."""
+    top = getattr(settings, "ENHYDRIS_SYNOPTIC_PROFILE_TOP", 30)
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats("cumulative").print_stats(top)
+    stats.sort_stats("tottime").print_stats(top)
+    return output.getvalue()
+
+
+def _rotate():
+    keep = getattr(settings, "ENHYDRIS_SYNOPTIC_PROFILE_KEEP", 50)
+    profiles = sorted(glob.glob(os.path.join(get_directory(), "*.prof")))
+    for filename in profiles[: max(len(profiles) - keep, 0)]:
+        for pathname in (filename, filename[: -len(".prof")] + ".txt"):
+            try:
+                os.remove(pathname)
+            except FileNotFoundError:
+                pass
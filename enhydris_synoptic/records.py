@@ -0,0 +1,169 @@
+"""Low-level access to Enhydris time series records.
+
+Enhydris gives us the data of a time series through Timeseries.get_data(), which
+reads all the records of the requested period and creates a pandas dataframe. This is
+fine for the 24 hours we usually chart, but it is wasteful when we need longer periods
+only in order to aggregate them. The functions in this module query the records table
+directly and let the database do the work.
+
+The data that are charted are read with read_arrays(), which returns numpy arrays
+filled directly from the database cursor; this avoids creating a pandas dataframe and
+Python datetime objects for each record.
+
+Timestamps are stored in the database in UTC. Like Timeseries.get_data(), the
+functions in this module return naive timestamps in the time zone of the time series
+group (Enhydris time zones are fixed UTC offsets, so this is a simple addition).
+"""
+import datetime as dt
+
+from django.db import connection
+
+import numpy as np
+import pandas as pd
+
+from enhydris.models import TimeseriesRecord
+
+AGGREGATE_SQL = """
+    SELECT
+        date_trunc(%(unit)s, timestamp AT TIME ZONE 'UTC' + %(offset)s) AS bucket,
+        MIN(value), MAX(value), AVG(value), COUNT(value)
+    FROM {table}
+    WHERE timeseries_id = %(timeseries_id)s
+        AND (%(start_date)s IS NULL OR timestamp >= %(start_date)s)
+        AND (%(end_date)s IS NULL OR timestamp <= %(end_date)s)
+    GROUP BY bucket
+    ORDER BY bucket
+"""
+
+READ_SQL = """
+    SELECT * FROM (
+        SELECT
+            (EXTRACT(EPOCH FROM timestamp) * 1000)::bigint AS milliseconds,
+            COALESCE(value, 'NaN'::float8)
+        FROM {table}
+        WHERE timeseries_id = %(timeseries_id)s
+            AND (%(start_date)s IS NULL OR timestamp >= %(start_date)s)
+            AND (%(end_date)s IS NULL OR timestamp <= %(end_date)s)
+        ORDER BY timestamp DESC
+        LIMIT %(limit)s
+    ) AS records
+    ORDER BY milliseconds
+"""
+
+
+class SeriesArrays:
+    """The timestamps and values of a time series as numpy arrays.
+
+    "timestamps" is a datetime64[ns] array of naive timestamps in the time zone of the
+    time series group, sorted in ascending order; "values" is a float64 array in which
+    null values are NaN.
+    """
+
+    def __init__(self, timestamps, values):
+        self.timestamps = timestamps
+        self.values = values
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def from_dataframe(cls, dataframe):
+        return cls(
+            dataframe.index.values.astype("datetime64[ns]"),
+            dataframe["value"].values.astype("float64"),
+        )
+
+    def value_at(self, timestamp):
+        """Return the value at the specified naive timestamp.
+
+        Like pandas's .loc[], raises KeyError if there is no such timestamp.
+        """
+        timestamp = np.datetime64(timestamp, "ns")
+        i = np.searchsorted(self.timestamps, timestamp)
+        if i == len(self.timestamps) or self.timestamps[i] != timestamp:
+            raise KeyError(timestamp)
+        return self.values[i]
+
+    def slice(self, start_date, end_date):
+        """Return the part between the specified naive timestamps (inclusive)."""
+        first = np.searchsorted(self.timestamps, np.datetime64(start_date, "ns"))
+        last = np.searchsorted(
+            self.timestamps, np.datetime64(end_date, "ns"), side="right"
+        )
+        return SeriesArrays(self.timestamps[first:last], self.values[first:last])
+
+
+def get_utc_offset(timeseries):
+    return timeseries.timeseries_group.time_zone.as_tzinfo.utcoffset(None)
+
+
+def to_local(timestamp, utc_offset):
+    """Convert an aware timestamp to naive local time."""
+    return timestamp.astimezone(dt.timezone.utc).replace(tzinfo=None) + utc_offset
+
+
+def to_aware(timestamp, utc_offset):
+    """Convert a naive local timestamp to an aware (UTC) timestamp."""
+    return (timestamp - utc_offset).replace(tzinfo=dt.timezone.utc)
+
+
+def aggregate_rows(timeseries, unit, start_date=None, end_date=None):
+    """Aggregate the records of a time series per hour or per day.
+
+    "unit" is "hour" or "day". Records with timestamp between start_date and
+    end_date (inclusive) are considered; either may be None, meaning no limit. Returns
+    a list of (timestamp, min, max, mean, count) tuples, where "timestamp" is the
+    (naive, local) start of each hour or day.
+    """
+    sql = AGGREGATE_SQL.format(table=TimeseriesRecord._meta.db_table)
+    params = {
+        "unit": unit,
+        "offset": get_utc_offset(timeseries),
+        "timeseries_id": timeseries.id,
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def aggregate(timeseries, unit, start_date=None, end_date=None):
+    """Same as aggregate_rows(), but return a dataframe.
+
+    The dataframe is indexed by timestamp and has columns "min", "max", "mean" (or
+    "value", which is the same as "mean") and "count".
+    """
+    rows = aggregate_rows(timeseries, unit, start_date, end_date)
+    return rows_to_dataframe(rows)
+
+
+def rows_to_dataframe(rows):
+    result = pd.DataFrame(
+        rows, columns=["timestamp", "min", "max", "mean", "count"]
+    ).set_index("timestamp")
+    result["value"] = result["mean"]
+    return result
+
+
+def read_arrays(timeseries, start_date=None, end_date=None, last=None):
+    """Read the records of a time series into a SeriesArrays object.
+
+    Records with timestamp between start_date and end_date (inclusive) are read;
+    either may be None, meaning no limit. If "last" is specified, only the last that
+    many of these records are read.
+    """
+    sql = READ_SQL.format(table=TimeseriesRecord._meta.db_table)
+    params = {
+        "timeseries_id": timeseries.id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "limit": last,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    array = np.array(rows, dtype="float64").reshape(-1, 2)
+    utc_offset = np.timedelta64(get_utc_offset(timeseries), "ns")
+    timestamps = array[:, 0].astype("int64").astype("datetime64[ms]") + utc_offset
+    return SeriesArrays(timestamps.astype("datetime64[ns]"), array[:, 1].copy())
@@ -0,0 +1,221 @@
+"""State shared by the synoptic groups rendered in the same run.
+
+create_static_files() renders all synoptic groups one after the other. The same
+stations (and therefore the same time series) are often in more than one group, so a
+Run object holds what has been read from the database during the run, and all the
+groups of the run are served from it. render_synoptic_group() attaches the run to the
+synoptic group as its "render_run" attribute.
+
+The run also holds the options of the render (e.g. whether to render pages or charts
+or both, or whether to render in streaming mode, which keeps memory bounded), has a
+time budget (see the scheduler module), and keeps track of how long each stage took and
+of what happened to each station and group, which it logs at the end.
+"""
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DataCache:
+    """Memoize data for the duration of a run.
+
+    get(key, load) returns the object cached under "key", calling load() to create
+    it if it isn't there. Time series data is large, so it is marked with
+    series=True; if keep_series is False, it is not memoized at all (load() is called
+    every time), which keeps the memory used by the run from growing with the number
+    of stations.
+    """
+
+    def __init__(self, keep_series=True):
+        self._items = {}
+        self.keep_series = keep_series
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load, series=False):
+        if series and not self.keep_series:
+            self.misses += 1
+            return load()
+        try:
+            result = self._items[key]
+            self.hits += 1
+        except KeyError:
+            result = self._items[key] = load()
+            self.misses += 1
+        return result
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class Run:
+    def __init__(
+        self,
+        name="run",
+        time_budget=None,
+        pages=True,
+        charts=True,
+        chart_processes=None,
+        profile=None,
+        streaming=None,
+    ):
+        self.name = name
+        if streaming is None:
+            streaming = getattr(settings, "ENHYDRIS_SYNOPTIC_STREAMING", False)
+        self.streaming = streaming  # See views._render_synoptic_group_streaming()
+        self.data_cache = DataCache(keep_series=not streaming)
+        self.started = time.monotonic()
+        if time_budget is None:
+            time_budget = getattr(settings, "ENHYDRIS_SYNOPTIC_RUN_TIME_BUDGET", None)
+        self.time_budget = time_budget
+        self.pages = pages
+        self.charts = charts
+        if chart_processes is None:
+            chart_processes = getattr(settings, "ENHYDRIS_SYNOPTIC_CHART_PROCESSES", 1)
+        self.chart_processes = chart_processes
+        self.profile = profile  # None means "as configured" (see profiling module)
+
+        # Seconds spent in, and number of times we entered, each stage (see timer()),
+        # and other counts (see count()), for the whole run and for each synoptic
+        # group (the keys of the latter are (synoptic group slug, stage or count
+        # name) tuples). Stages may be nested (e.g. "templates" is part of "station
+        # pages"). Work whose result is shared by groups (e.g. data read once in the
+        # run) is attributed to the group that needed it first.
+        self.stage_times = Counter()
+        self.stage_counts = Counter()
+        self.counts = Counter()
+        self.group_stage_times = Counter()
+        self.group_stage_counts = Counter()
+        self.group_counts = Counter()
+        self.current_group = None  # The slug of the group being rendered
+
+        # Maps chart fingerprints to the filenames of charts rendered in this run
+        # (see views.Chart.get_fingerprint()).
+        self.rendered_charts = {}
+
+        # Maps synoptic group slugs to the seconds for which their lock was held
+        # (see the locks module).
+        self.lock_durations = {}
+
+        # Map (synoptic group slug, station name) to "rendered", "failed", "timed
+        # out" or "skipped", and synoptic group slugs to "failed" or "skipped"
+        # (groups that were rendered normally are not included).
+        self.station_outcomes = {}
+        self.group_outcomes = {}
+
+        # Early warning emails, sent together when the run finishes (see
+        # earlywarnings.send_messages()).
+        self.outbox = []
+
+    @contextmanager
+    def timer(self, stage):
+        """Add the time spent in the block to the time of the specified stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage, seconds, count=1):
+        self.stage_times[stage] += seconds
+        self.stage_counts[stage] += count
+        if self.current_group is not None:
+            self.group_stage_times[(self.current_group, stage)] += seconds
+            self.group_stage_counts[(self.current_group, stage)] += count
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+        if self.current_group is not None:
+            self.group_counts[(self.current_group, name)] += n
+
+    def count_query(self, execute, sql, params, many, context):
+        """Count database queries; use with connection.execute_wrapper()."""
+        self.count("queries")
+        return execute(sql, params, many, context)
+
+    @property
+    def duration(self):
+        return time.monotonic() - self.started
+
+    def get_remaining_time(self):
+        """Return the seconds remaining in the time budget, or None if unlimited."""
+        if self.time_budget is None:
+            return None
+        return self.time_budget - (time.monotonic() - self.started)
+
+    def is_out_of_time(self):
+        remaining = self.get_remaining_time()
+        return remaining is not None and remaining <= 0
+
+    def record_station(self, synstation, outcome):
+        key = (synstation.synoptic_group.slug, str(synstation))
+        self.station_outcomes[key] = outcome
+
+    def record_group(self, synoptic_group, outcome):
+        self.group_outcomes[synoptic_group.slug] = outcome
+
+    def log_summary(self):
+        counts = Counter(self.station_outcomes.values())
+        logger.info(
+            "enhydris-synoptic run finished in %.1f s; stations: %d rendered, "
+            "%d failed, %d timed out, %d skipped; data cache: %d hits, %d misses "
+            "(hit rate %.0f%%); %d distinct charts; locks held for %.1f s",
+            self.duration,
+            counts["rendered"],
+            counts["failed"],
+            counts["timed out"],
+            counts["skipped"],
+            self.data_cache.hits,
+            self.data_cache.misses,
+            100 * self.data_cache.hit_rate,
+            len(self.rendered_charts),
+            sum(self.lock_durations.values()),
+        )
+        problems = [
+            f"{group}/{station}: {outcome}"
+            for (group, station), outcome in self.station_outcomes.items()
+            if outcome != "rendered"
+        ]
+        problems += [
+            f"{group}: {outcome}" for group, outcome in self.group_outcomes.items()
+        ]
+        if problems:
+            logger.warning(
+                "enhydris-synoptic run problems: %s", "; ".join(sorted(problems))
+            )
+
+
+def get_cached(synoptic_group, key, load, series=False):
+    """Return load(), memoized in the run of the synoptic group, if any.
+
+    "series" should be True if the result is time series data (see DataCache).
+    """
+    run = getattr(synoptic_group, "render_run", None)
+    if run is None:
+        return load()
+    return run.data_cache.get(key, load, series=series)
+
+
+@contextmanager
+def timer(synoptic_group, stage):
+    """Time the block in the run of the synoptic group, if any."""
+    run = getattr(synoptic_group, "render_run", None)
+    if run is None:
+        yield
+        return
+    with run.timer(stage):
+        yield
+
+
+def get_run(synoptic_group):
+    """Return the run of the synoptic group, attaching a new one if it has none."""
+    if getattr(synoptic_group, "render_run", None) is None:
+        synoptic_group.render_run = Run()
+    return synoptic_group.render_run
@@ -0,0 +1,99 @@
+"""Render the stations of a synoptic group in order of priority and within time limits.
+
+Stations whose last common date has changed since they were last rendered are
+rendered first, so that if time runs out it is the stations without new data that are
+left behind. Each station must be rendered within ENHYDRIS_SYNOPTIC_STATION_TIME_BUDGET
+seconds, and the whole run (see the runs module) within
+ENHYDRIS_SYNOPTIC_RUN_TIME_BUDGET seconds; both default to no limit.
+
+A station that fails (i.e. raises an exception) or runs out of time is logged and
+skipped, and the rest of the stations are rendered normally. The files of a skipped
+station are left as they were; since each file is replaced atomically (see
+views.File), a file is always either the old one or the new one. When the run runs out
+of time, the remaining stations are skipped.
+
+When the charts are rendered in parallel (see views._render_charts_in_parallel()),
+the same limits apply to waiting for the charts of each station, and when the run
+runs out of time the charts of the remaining stations are discarded.
+
+The per-station time limit uses SIGALRM, so it only works in the main thread of a
+process (which is where celery's prefork workers execute tasks); elsewhere the limit is
+only checked between stations.
+"""
+import logging
+import signal
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class StationTimeout(Exception):
+    pass
+
+
+def render_stations(synstations, render_station, run, mark_rendered=True):
+    """Call render_station() for each station and return those that succeeded.
+
+    If mark_rendered is False, the caller marks the stations rendered (e.g. when
+    render_station() does only part of the work). Stations are never marked rendered
+    when the run doesn't render pages, since their pages don't show the new data.
+    """
+    rendered = []
+    for synstation in prioritize(synstations):
+        if run.is_out_of_time():
+            run.record_station(synstation, "skipped")
+            continue
+        try:
+            with time_limit(get_station_time_limit(run)):
+                render_station(synstation)
+        except StationTimeout:
+            logger.warning("Station %s took too long; skipped", synstation)
+            run.record_station(synstation, "timed out")
+        except Exception:
+            logger.exception("Failed to render station %s", synstation)
+            run.record_station(synstation, "failed")
+        else:
+            run.record_station(synstation, "rendered")
+            if mark_rendered and run.pages:
+                synstation.mark_rendered()
+            rendered.append(synstation)
+    return rendered
+
+
+def prioritize(synstations):
+    """Return the stations sorted so that those with new data come first."""
+    return sorted(synstations, key=lambda x: (not x.has_new_data, x.order))
+
+
+def get_station_time_limit(run):
+    """Return the seconds a station may take, or None if unlimited."""
+    limit = getattr(settings, "ENHYDRIS_SYNOPTIC_STATION_TIME_BUDGET", None)
+    remaining = run.get_remaining_time()
+    if remaining is not None:
+        limit = remaining if limit is None else min(limit, remaining)
+    return limit
+
+
+@contextmanager
+def time_limit(seconds):
+    """Raise StationTimeout if the block takes more than the specified seconds.
+
+    If seconds is None, or if we aren't in the main thread, there is no limit.
+    """
+    if seconds is None or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def handler(signum, frame):
+        raise StationTimeout()
+
+    previous_handler = signal.signal(signal.SIGALRM, handler)
+    signal.setitimer(signal.ITIMER_REAL, max(seconds, 0.001))
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
@@ -0,0 +1,101 @@
+"""Hand the series data of a synoptic group over to chart worker processes.
+
+When charts are rendered in separate processes (see ENHYDRIS_SYNOPTIC_CHART_PROCESSES),
+pickling the data of each chart to the workers would copy it many times. Instead, we
+put the arrays of all series of the synoptic group in a single shared memory block,
+together with an index of offsets, and the workers attach to the block and create
+numpy views on it without copying anything.
+
+    with SharedSeriesBlock(arrays) as block:
+        # give block.handle to the workers; in the workers:
+        with attach(handle) as arrays:
+            ...
+
+"arrays" is a dictionary mapping keys (any picklable object) to records.SeriesArrays
+objects. This requires Python 3.8 or later; is_available() tells whether we can use it.
+"""
+import gc
+from contextlib import contextmanager
+
+import numpy as np
+
+from . import records
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+
+def is_available():
+    return shared_memory is not None
+
+
+class SharedSeriesBlock:
+    def __init__(self, arrays):
+        self.offsets = {}
+        size = 0
+        for key, series_arrays in arrays.items():
+            self.offsets[key] = (size, len(series_arrays))
+            size += 16 * len(series_arrays)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            for key, series_arrays in arrays.items():
+                timestamps, values = _get_views(self.shm, *self.offsets[key])
+                timestamps[:] = series_arrays.timestamps
+                values[:] = series_arrays.values
+                del timestamps, values
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def handle(self):
+        """A picklable object with which workers can attach() to the block."""
+        return (self.shm.name, self.offsets)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+@contextmanager
+def attach(handle):
+    """Attach to a SharedSeriesBlock and yield its series as SeriesArrays.
+
+    The SeriesArrays objects are views on the shared memory and must not be used after
+    the context manager exits.
+    """
+    name, offsets = handle
+    shm = shared_memory.SharedMemory(name=name)
+    series = {
+        key: records.SeriesArrays(*_get_views(shm, offset, length))
+        for key, (offset, length) in offsets.items()
+    }
+    try:
+        yield series
+    finally:
+        series.clear()
+        gc.collect()  # Matplotlib figures may be in reference cycles
+        try:
+            shm.close()
+        except BufferError:
+            # Something still holds a view; the memory will be released when it is
+            # garbage collected.
+            pass
+
+
+def _get_views(shm, offset, length):
+    timestamps = np.ndarray(
+        (length,), dtype="datetime64[ns]", buffer=shm.buf, offset=offset
+    )
+    values = np.ndarray(
+        (length,), dtype="float64", buffer=shm.buf, offset=offset + 8 * length
+    )
+    return timestamps, values
@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from enhydris.models import Timeseries
+
+from . import events
+from .models import (
+    ChartWindow,
+    SynopticGroup,
+    SynopticGroupStation,
+    SynopticTimeseriesGroup,
+)
+
+
+@receiver(post_save, sender=Timeseries)
+def timeseries_saved(sender, instance, **kwargs):
+    if events.render_on_new_data():
+        transaction.on_commit(lambda: events.timeseries_changed(instance))
+
+
+@receiver(post_save, sender=SynopticGroupStation)
+@receiver(post_delete, sender=SynopticGroupStation)
+@receiver(post_save, sender=SynopticTimeseriesGroup)
+@receiver(post_delete, sender=SynopticTimeseriesGroup)
+def synoptic_configuration_changed(sender, **kwargs):
+    events.station_index.invalidate()
+
+
+@receiver(post_save, sender=SynopticGroup)
+def synoptic_group_saved(sender, instance, **kwargs):
+    if events.render_on_change():
+        transaction.on_commit(lambda: events.synoptic_group_changed(instance.id))
+
+
+@receiver(post_save, sender=ChartWindow)
+@receiver(post_delete, sender=ChartWindow)
+def chart_window_changed(sender, instance, **kwargs):
+    if events.render_on_change():
+        synoptic_group_id = instance.synoptic_group_id
+        transaction.on_commit(lambda: events.synoptic_group_changed(synoptic_group_id))
+
+
+@receiver(post_save, sender=SynopticGroupStation)
+def synoptic_group_station_saved(sender, instance, **kwargs):
+    if events.render_on_change():
+        _queue_station_render(instance.synoptic_group_id, [instance.id])
+
+
+@receiver(post_delete, sender=SynopticGroupStation)
+def synoptic_group_station_deleted(sender, instance, **kwargs):
+    # Only the map page needs to be rendered again
+    if events.render_on_change():
+        _queue_station_render(instance.synoptic_group_id, [])
+
+
+@receiver(post_save, sender=SynopticTimeseriesGroup)
+@receiver(post_delete, sender=SynopticTimeseriesGroup)
+def synoptic_timeseries_group_changed(sender, instance, **kwargs):
+    if not events.render_on_change():
+        return
+    # We don't use instance.synoptic_group_station, because if the station is being
+    # deleted along with this object it might not be possible to fetch it later.
+    synoptic_group_ids = SynopticGroupStation.objects.filter(
+        id=instance.synoptic_group_station_id
+    ).values_list("synoptic_group_id", flat=True)
+    for synoptic_group_id in synoptic_group_ids:
+        _queue_station_render(synoptic_group_id, [instance.synoptic_group_station_id])
+
+
+def _queue_station_render(synoptic_group_id, synoptic_group_station_ids):
+    transaction.on_commit(
+        lambda: events.synoptic_group_station_changed(
+            synoptic_group_id, synoptic_group_station_ids
+        )
+    )
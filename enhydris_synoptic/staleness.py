@@ -0,0 +1,142 @@
+"""Report the stations whose data is not fresh, without rendering.
+
+A station is stale if its last common date is older than the fresh_time_limit of its
+synoptic group (this is what makes its date show red on the map; see
+SynopticGroupStation.freshness), or if it has no data at all. check_stations() finds
+the last common date of all stations of all groups from the cached latest values (see
+LatestValue), in two queries and without reading any records or drawing anything,
+and writes "{slug}/staleness.json" to ENHYDRIS_SYNOPTIC_ROOT for each group; the
+check_staleness task uses it and is cheap enough to execute every minute.
+
+If ENHYDRIS_SYNOPTIC_STALENESS_ALERTS is True, the early warning recipients of a group
+are also emailed when one of its stations becomes stale and when it becomes fresh
+again.
+"""
+import json
+import os
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from django.utils.translation import ugettext as _
+
+from .models import LatestValue, SynopticGroupStation, SynopticTimeseriesGroup
+from .views import File
+
+
+def alerts_enabled():
+    """Whether stations becoming stale or fresh again should be emailed."""
+    return getattr(settings, "ENHYDRIS_SYNOPTIC_STALENESS_ALERTS", False)
+
+
+def check_stations(now=None):
+    """Write the staleness reports of all synoptic groups and return the alerts.
+
+    The return value is a list of EmailMessage objects, which is empty unless alerts
+    are enabled. SynopticGroupStation.stale is updated whether alerts are enabled or
+    not.
+    """
+    now = now or timezone.now()
+    last_common_dates = _get_last_common_dates()
+    groups = {}
+    for synstation in SynopticGroupStation.objects.select_related(
+        "synoptic_group", "station"
+    ):
+        groups.setdefault(synstation.synoptic_group_id, []).append(synstation)
+    messages, changed = [], []
+    for synstations in groups.values():
+        synoptic_group = synstations[0].synoptic_group
+        stale = {
+            x.id: _get_staleness(x, last_common_dates.get(x.id), now)
+            for x in synstations
+        }
+        report = get_report(synoptic_group, synstations, stale, now)
+        File(os.path.join(synoptic_group.slug, "staleness.json")).write(
+            json.dumps(report, indent=2)
+        )
+        transitions = [x for x in synstations if x.stale != (stale[x.id] is not None)]
+        for synstation in transitions:
+            synstation.stale = not synstation.stale
+        changed.extend(transitions)
+        if transitions and alerts_enabled():
+            message = _get_alert_message(synoptic_group, transitions, last_common_dates)
+            if message is not None:
+                messages.append(message)
+    SynopticGroupStation.objects.bulk_update(changed, ["stale"])
+    return messages
+
+
+def get_report(synoptic_group, synstations, stale, now):
+    """Return the staleness report of a synoptic group as a dictionary.
+
+    "stale" maps the ids of the stations to what _get_staleness() returns for them.
+    """
+    return {
+        "group": synoptic_group.slug,
+        "checked": now.isoformat(),
+        "fresh_time_limit_seconds": synoptic_group.fresh_time_limit.total_seconds(),
+        "stations": len(synstations),
+        "stale_stations": [
+            {"id": x.station_id, "name": x.station.name, **stale[x.id]}
+            for x in synstations
+            if stale[x.id] is not None
+        ],
+    }
+
+
+def _get_staleness(synstation, last_common_date, now):
+    # None if the station is fresh; otherwise how long it has been stale (which is
+    # unknown if there is no data at all).
+    if last_common_date is None:
+        return {"last_common_date": None, "stale_since": None, "stale_seconds": None}
+    stale_since = last_common_date + synstation.synoptic_group.fresh_time_limit
+    if stale_since >= now:
+        return None
+    return {
+        "last_common_date": last_common_date.isoformat(),
+        "stale_since": stale_since.isoformat(),
+        "stale_seconds": (now - stale_since).total_seconds(),
+    }
+
+
+def _get_last_common_dates():
+    # Like SynopticGroupStation.last_common_date, the minimum of the last dates of the
+    # time series of each station.
+    latest_values = LatestValue.objects.filter(
+        timeseries__timeseries_group_id=OuterRef("timeseries_group_id")
+    ).order_by("-timestamp")
+    end_dates = SynopticTimeseriesGroup.objects.annotate(
+        latest_timestamp=Subquery(latest_values.values("timestamp")[:1])
+    ).values_list("synoptic_group_station_id", "latest_timestamp")
+    result = {}
+    for synoptic_group_station_id, end_date in end_dates:
+        if end_date is None:
+            continue
+        previous = result.get(synoptic_group_station_id)
+        if previous is None or end_date < previous:
+            result[synoptic_group_station_id] = end_date
+    return result
+
+
+def _get_alert_message(synoptic_group, synstations, last_common_dates):
+    emails = [x.email for x in synoptic_group.earlywarningemail_set.all()]
+    if not emails:
+        return None
+    tzinfo = synoptic_group.time_zone.as_tzinfo
+    content = ""
+    for synstation in synstations:
+        last_common_date = last_common_dates.get(synstation.id)
+        if last_common_date is not None:
+            last_common_date = last_common_date.astimezone(tzinfo).strftime(
+                "%Y-%m-%d %H:%M"
+            )
+        if not synstation.stale:
+            line = _("{} fresh again (last data {})")
+        elif last_common_date is None:
+            line = _("{} stale (no data)")
+        else:
+            line = _("{} stale (no new data since {})")
+        content += line.format(synstation.station.name, last_common_date) + "\n"
+    subject = _("Enhydris stale stations ({})").format(synoptic_group.name)
+    return EmailMessage(subject, content, settings.DEFAULT_FROM_EMAIL, emails)
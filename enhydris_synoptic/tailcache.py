@@ -0,0 +1,176 @@
+"""On-disk cache of the last records of time series.
+
+Every time the synoptic pages are rendered we need the last 24 hours of each time
+series, but only the last few records have changed since the previous time. If
+ENHYDRIS_SYNOPTIC_TAIL_CACHE_DIR is set, we keep the last
+ENHYDRIS_SYNOPTIC_TAIL_CACHE_SIZE records of each time series in a file in that
+directory, and we only read from the database the records newer than those already in
+the file.
+
+Each file is a fixed-size ring buffer that is memory-mapped with numpy; it consists of
+a header followed by an array of timestamps and an array of values. The timestamps are
+naive and in the time zone of the time series group, as in records.SeriesArrays. The
+files are shared by all processes on a host; access is serialized with a lock file. If
+the end date of the cache does not match the end date of the time series (e.g. because
+the time series data has been replaced), the file is rebuilt.
+"""
+import fcntl
+import os
+
+from django.conf import settings
+
+import numpy as np
+import pandas as pd
+
+from . import records
+
+MAGIC = b"ESTAIL1"
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S8"),
+        ("capacity", "<i8"),
+        ("count", "<i8"),
+        ("head", "<i8"),
+        ("end", "<i8"),
+    ]
+)
+HEADER_SIZE = 64
+NO_DATE = np.iinfo(np.int64).min
+
+
+def is_enabled():
+    return bool(getattr(settings, "ENHYDRIS_SYNOPTIC_TAIL_CACHE_DIR", None))
+
+
+class TailCache:
+    """The cached last records of a time series.
+
+    TailCache(timeseries).get_arrays(start_date, end_date) returns a
+    records.SeriesArrays object, or None if the cache does not contain all the data of
+    the requested period (in that case the caller should read them from the database).
+    """
+
+    def __init__(self, timeseries):
+        self.timeseries = timeseries
+        self.directory = settings.ENHYDRIS_SYNOPTIC_TAIL_CACHE_DIR
+        self.capacity = getattr(settings, "ENHYDRIS_SYNOPTIC_TAIL_CACHE_SIZE", 4096)
+        self.filename = os.path.join(self.directory, f"{timeseries.id}.tail")
+        self.utc_offset = records.get_utc_offset(timeseries)
+
+    def get_arrays(self, start_date, end_date):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.filename + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._bring_up_to_date()
+            timestamps, values = self._get_ordered_arrays()
+        return self._get_slice(timestamps, values, start_date, end_date)
+
+    def _bring_up_to_date(self):
+        end_date = self._get_timeseries_end_date()
+        if not self._open():
+            self._rebuild()
+            return
+        if self._end < end_date:
+            self._append_records_after(self._end)
+        if self._end != end_date:
+            self._rebuild()
+
+    def _get_timeseries_end_date(self):
+        end_date = self.timeseries.end_date
+        if end_date is None:
+            return NO_DATE
+        return self._to_int(records.to_local(end_date, self.utc_offset))
+
+    def _open(self):
+        """Map the file into memory; return False if it is missing or unusable."""
+        expected_size = HEADER_SIZE + 16 * self.capacity
+        try:
+            if os.path.getsize(self.filename) != expected_size:
+                return False
+        except FileNotFoundError:
+            return False
+        self._map(self.filename, "r+")
+        return (
+            self._header["magic"][0] == MAGIC
+            and self._header["capacity"][0] == self.capacity
+        )
+
+    def _map(self, filename, mode):
+        self._header = np.memmap(filename, HEADER_DTYPE, mode, offset=0, shape=(1,))
+        self._timestamps = np.memmap(
+            filename, "<i8", mode, offset=HEADER_SIZE, shape=(self.capacity,)
+        )
+        self._values = np.memmap(
+            filename,
+            "<f8",
+            mode,
+            offset=HEADER_SIZE + 8 * self.capacity,
+            shape=(self.capacity,),
+        )
+
+    @property
+    def _end(self):
+        return self._header["end"][0]
+
+    def _rebuild(self):
+        # We build the new file under a temporary name and then atomically replace the
+        # old one, so that a crash in the middle will not leave a corrupted file.
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            f.truncate(HEADER_SIZE + 16 * self.capacity)
+        self._map(tmp_filename, "r+")
+        self._header[0] = (MAGIC, self.capacity, 0, 0, NO_DATE)
+        self._append(*self._read_records(after=None))
+        os.replace(tmp_filename, self.filename)
+
+    def _append_records_after(self, timestamp):
+        self._append(*self._read_records(after=timestamp))
+
+    def _read_records(self, after):
+        if after is None:
+            start_date = None
+        else:
+            # The cache has nanoseconds, the database has microseconds
+            naive_start_date = pd.Timestamp(after + 1000).to_pydatetime()
+            start_date = records.to_aware(naive_start_date, self.utc_offset)
+        arrays = records.read_arrays(
+            self.timeseries, start_date=start_date, last=self.capacity
+        )
+        return arrays.timestamps.view("<i8"), arrays.values
+
+    def _to_int(self, naive_datetime):
+        return np.datetime64(naive_datetime, "ns").astype("<i8")
+
+    def _append(self, timestamps, values):
+        n = len(timestamps)
+        if n == 0:
+            return
+        capacity = self.capacity
+        count = self._header["count"][0]
+        head = self._header["head"][0]
+        positions = (head + count + np.arange(n)) % capacity
+        self._timestamps[positions] = timestamps
+        self._values[positions] = values
+        new_count = min(capacity, count + n)
+        new_head = (head + count + n - new_count) % capacity
+        self._timestamps.flush()
+        self._values.flush()
+        self._header[0] = (MAGIC, capacity, new_count, new_head, timestamps[-1])
+        self._header.flush()
+
+    def _get_ordered_arrays(self):
+        count = self._header["count"][0]
+        head = self._header["head"][0]
+        positions = (head + np.arange(count)) % self.capacity
+        self._is_full = count == self.capacity
+        return self._timestamps[positions], self._values[positions]
+
+    def _get_slice(self, timestamps, values, start_date, end_date):
+        start = records.to_local(start_date, self.utc_offset)
+        end = records.to_local(end_date, self.utc_offset)
+        if self._is_full and (
+            len(timestamps) == 0 or timestamps[0] > self._to_int(start)
+        ):
+            return None
+        arrays = records.SeriesArrays(timestamps.view("datetime64[ns]"), values)
+        return arrays.slice(start, end)
@@ -1,11 +1,188 @@
+import logging
+
+from celery.signals import worker_process_init
+
 from enhydris.celery import app
 
-from .models import SynopticGroup
+from . import earlywarnings, events, metrics, staleness, warmup
+from .locks import GroupLock
+from .models import LatestValue, SynopticGroup, TimeseriesRollup
+from .runs import Run
 from .views import render_synoptic_group
 
+logger = logging.getLogger(__name__)
+
+
+@worker_process_init.connect
+def warm_up_worker_process(**kwargs):
+    if not warmup.is_enabled():
+        return
+    try:
+        warmup.warm_up()
+    except Exception:
+        # A worker that could not be warmed up can still render (only slower)
+        logger.exception("Failed to warm up worker process for rendering")
+
+
+@app.task
+def create_static_files(profile=None):
+    """Create static html files for all enhydris-synoptic.
+
+    If "profile" is True or False, it overrides ENHYDRIS_SYNOPTIC_PROFILE (see the
+    profiling module).
+    """
+    LatestValue.objects.refresh_all()
+    run = Run(name="create_static_files", profile=profile)
+    _render_synoptic_groups(SynopticGroup.objects.all(), run)
+
+
+@app.task
+def render_due_synoptic_groups(profile=None):
+    """Render the synoptic groups that are due according to their refresh policy.
+
+    This is meant to be executed often (e.g. every minute) instead of
+    create_static_files. "profile" is the same as in create_static_files.
+    """
+    LatestValue.objects.refresh_all()
+    run = Run(name="render_due_synoptic_groups", profile=profile)
+    _render_synoptic_groups(SynopticGroup.objects.due(), run)
+
+
+def _render_synoptic_groups(sgroups, run):
+    # A group that fails does not stop the rest; the run summary lists the problems.
+    for sgroup in sgroups:
+        if run.is_out_of_time():
+            run.record_group(sgroup, "skipped")
+            continue
+        try:
+            render_synoptic_group_exclusively(sgroup, run=run)
+        except Exception:
+            logger.exception("Failed to render synoptic group %s", sgroup.slug)
+            run.record_group(sgroup, "failed")
+    _finish(run)
+
+
+def _finish(run):
+    with run.timer("early warning emails"):
+        earlywarnings.send_messages(run.outbox)
+    run.log_summary()
+    metrics.write_metrics(run)
+
+
+@app.task
+def update_rollups():
+    """Update the hourly and daily rollups of the time series used in synoptic."""
+    TimeseriesRollup.objects.refresh_all()
+
 
 @app.task
-def create_static_files():
-    """Create static html files for all enhydris-synoptic."""
-    for sgroup in SynopticGroup.objects.all():
-        render_synoptic_group(sgroup)
+def refresh_latest_values():
+    """Update the cached latest values of the time series used in synoptic."""
+    LatestValue.objects.refresh_all()
+
+
+@app.task
+def check_early_warnings():
+    """Check the limits of all synoptic time series and send early warnings.
+
+    This uses only the latest values (see the earlywarnings module), so it can be
+    executed often (e.g. every minute).
+    """
+    LatestValue.objects.refresh_all()
+    messages = [
+        sgroup.get_early_warning_message() for sgroup in earlywarnings.check_limits()
+    ]
+    earlywarnings.send_messages([x for x in messages if x is not None])
+
+
+@app.task
+def check_staleness():
+    """Write the staleness report of each synoptic group and send its alerts.
+
+    This uses only the latest values (see the staleness module), so it can be
+    executed often (e.g. every minute).
+    """
+    LatestValue.objects.refresh_all()
+    earlywarnings.send_messages(staleness.check_stations())
+
+
+@app.task
+def render_pending_stations(synoptic_group_id):
+    """Render the map page and the pending stations of a synoptic group.
+
+    This is queued by the events module; see there for more information.
+    """
+    station_ids = events.pop_pending_stations(synoptic_group_id)
+    try:
+        sgroup = SynopticGroup.objects.filter(id=synoptic_group_id).first()
+        if sgroup is None:
+            return
+        LatestValue.objects.refresh_all()
+        run = Run(name="render_pending_stations")
+        render_synoptic_group_exclusively(
+            sgroup, run=run, synoptic_group_station_ids=station_ids
+        )
+        _finish(run)
+    finally:
+        events.render_finished(synoptic_group_id)
+
+
+def render_synoptic_group_exclusively(
+    sgroup, run=None, synoptic_group_station_ids=None
+):
+    """Render a synoptic group, unless it is already being rendered.
+
+    If it is, a follow-up render is requested from the process that is rendering it
+    (see the locks module), and False is returned. The follow-up renders need fresh
+    data, so each one has its own run, named "followup", which is finished (its
+    metrics written and its emails sent) as soon as it has been rendered.
+    """
+    lock = GroupLock(sgroup.id)
+    if not lock.acquire():
+        lock.request_followup()
+        logger.info(
+            "Synoptic group %s is already being rendered; follow-up requested",
+            sgroup.slug,
+        )
+        return False
+    try:
+        _render_locked(lock, sgroup, run, synoptic_group_station_ids)
+        # A follow-up requested after our last check but before we released the lock
+        # would not be executed by anyone, so we check once more.
+        while lock.pop_followup():
+            if not lock.acquire():
+                # Another process has the lock now, so the follow-up is for it
+                lock.request_followup()
+                break
+            _render_locked(lock, sgroup, None, None, is_followup=True)
+    finally:
+        logger.info(
+            "Synoptic group %s: lock held for %.1f s", sgroup.slug, lock.held_for
+        )
+        if run is not None:
+            run.lock_durations[sgroup.slug] = lock.held_for
+    return True
+
+
+def _render_locked(lock, sgroup, run, synoptic_group_station_ids, is_followup=False):
+    # Render, then render the follow-ups requested meanwhile, then release the lock
+    try:
+        if is_followup:
+            _render_followup(sgroup)
+        else:
+            render_synoptic_group(
+                sgroup, run=run, synoptic_group_station_ids=synoptic_group_station_ids
+            )
+        while lock.pop_followup():
+            _render_followup(sgroup)
+    finally:
+        lock.release()
+
+
+def _render_followup(sgroup):
+    LatestValue.objects.refresh_all()
+    run = Run(name="followup")
+    try:
+        render_synoptic_group(SynopticGroup.objects.get(id=sgroup.id), run=run)
+    finally:
+        _finish(run)
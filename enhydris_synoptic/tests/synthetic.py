@@ -0,0 +1,133 @@
+import datetime as dt
+from io import StringIO
+
+from django.contrib.gis.geos import Point
+
+import numpy as np
+from model_mommy import mommy
+
+from enhydris.models import (
+    Station,
+    Timeseries,
+    TimeseriesGroup,
+    TimeZone,
+    UnitOfMeasurement,
+    Variable,
+)
+from enhydris_synoptic.models import (
+    SynopticGroup,
+    SynopticGroupStation,
+    SynopticTimeseriesGroup,
+)
+
+
+class SyntheticDeployment:
+    """A synthetic deployment of configurable size, for benchmarks.
+
+    SyntheticDeployment(groups=N, stations=M, variables=K).create() creates N synoptic
+    groups with M stations each, and K time series groups in each station, each with
+    "days" days of data at "time_step" intervals, ending at "end_date". In each
+    station, the last "grouped" variables are shown in the same chart as the variable
+    before them (like wind gust with wind speed). The data is a random walk, which is
+    reproducible for a given seed.
+    """
+
+    def __init__(
+        self,
+        groups=1,
+        stations=10,
+        variables=3,
+        time_step=dt.timedelta(minutes=10),
+        days=1,
+        grouped=0,
+        end_date=dt.datetime(2015, 10, 23, 15, 0),
+        seed=0,
+    ):
+        self.ngroups = groups
+        self.nstations = stations
+        self.nvariables = variables
+        self.time_step = time_step
+        self.days = days
+        self.ngrouped = min(grouped, variables - 1)
+        self.end_date = end_date
+        self.random = np.random.default_rng(seed)
+
+    def create(self):
+        self.time_zone = TimeZone.objects.create(code="EET", utc_offset=120)
+        self.unit = mommy.make(UnitOfMeasurement, symbol="u")
+        self.variables = [
+            mommy.make(Variable, descr=f"Variable {i + 1}")
+            for i in range(self.nvariables)
+        ]
+        self.synoptic_groups = [self._create_group(i) for i in range(self.ngroups)]
+
+    @property
+    def nrecords(self):
+        """The number of records of each time series."""
+        return int(dt.timedelta(days=self.days) / self.time_step)
+
+    def _create_group(self, i):
+        synoptic_group = mommy.make(
+            SynopticGroup,
+            name=f"Group {i + 1}",
+            slug=f"group{i + 1}",
+            fresh_time_limit=dt.timedelta(hours=1),
+            time_zone=self.time_zone,
+        )
+        for j in range(self.nstations):
+            self._create_station(synoptic_group, j)
+        return synoptic_group
+
+    def _create_station(self, synoptic_group, j):
+        station = mommy.make(
+            Station,
+            name=f"{synoptic_group.name} station {j + 1}",
+            geom=Point(
+                x=20 + self.random.uniform(0, 2),
+                y=38 + self.random.uniform(0, 2),
+                srid=4326,
+            ),
+        )
+        synoptic_group_station = mommy.make(
+            SynopticGroupStation,
+            synoptic_group=synoptic_group,
+            station=station,
+            order=j + 1,
+        )
+        leader = None
+        for k, variable in enumerate(self.variables):
+            is_grouped = k >= self.nvariables - self.ngrouped
+            syntsg = mommy.make(
+                SynopticTimeseriesGroup,
+                synoptic_group_station=synoptic_group_station,
+                timeseries_group=self._create_timeseries_group(station, variable),
+                order=k + 1,
+                group_with=leader if is_grouped else None,
+            )
+            if not is_grouped:
+                leader = syntsg
+
+    def _create_timeseries_group(self, station, variable):
+        timeseries_group = mommy.make(
+            TimeseriesGroup,
+            gentity=station,
+            variable=variable,
+            name=variable.descr,
+            precision=1,
+            unit_of_measurement=self.unit,
+            time_zone=self.time_zone,
+        )
+        timeseries = mommy.make(
+            Timeseries, timeseries_group=timeseries_group, type=Timeseries.INITIAL
+        )
+        timeseries.set_data(StringIO(self._get_csv()))
+        return timeseries_group
+
+    def _get_csv(self):
+        n = self.nrecords
+        start_date = self.end_date - (n - 1) * self.time_step
+        values = 15 + np.cumsum(self.random.normal(0, 0.5, n))
+        return "".join(
+            f"{(start_date + i * self.time_step):%Y-%m-%d %H:%M},{value:.1f},\n"
+            for i, value in enumerate(values)
+        )
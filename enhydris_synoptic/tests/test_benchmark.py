@@ -0,0 +1,163 @@
+"""Benchmark rendering on a synthetic deployment.
+
+This is skipped unless the ENHYDRIS_SYNOPTIC_BENCHMARK environment variable is set. Its
+value configures the synthetic deployment (see synthetic.SyntheticDeployment) and the
+number of times to render it, e.g.:
+
+    ENHYDRIS_SYNOPTIC_BENCHMARK="groups=2,stations=50,variables=4,time_step=10,\\
+    days=2,grouped=1,repeat=3" python manage.py test \\
+    enhydris_synoptic.tests.test_benchmark
+
+(time_step is in minutes). The results (time spent in each stage and other counts for
+each repetition and their median, the peak memory usage in a separate render with
+tracemalloc on, and the time it takes to import the tasks) are written in JSON to
+ENHYDRIS_SYNOPTIC_BENCHMARK_OUTPUT (default "synoptic-benchmark.json"), together with
+the configuration and the git commit, so that results of different commits can be
+compared. Besides the run's own stages, the
+results summarize the time spent in the main stages of rendering (see STAGES). The
+first repetition is usually slower than the rest, because the caches (e.g. the latest
+values) are cold.
+"""
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from unittest import skipUnless
+
+from django.test import TestCase
+
+from enhydris_synoptic.models import LatestValue, SynopticGroup
+from enhydris_synoptic.runs import Run
+from enhydris_synoptic.views import render_synoptic_group
+
+from .synthetic import SyntheticDeployment
+from .test_imports import measure_import
+from .test_tasks import RandomSynopticRoot
+
+DEFAULT_CONFIG = {
+    "groups": 1,
+    "stations": 10,
+    "variables": 3,
+    "time_step": 10,
+    "days": 1,
+    "grouped": 0,
+    "repeat": 3,
+}
+
+# The run's stages that correspond to each stage of the rendering
+STAGES = {
+    "end date resolution": ["last common date"],
+    "data load": ["data"],
+    "chart render": ["chart render"],
+    "page render": ["templates"],
+    "writes": ["writes"],
+}
+
+
+def get_config():
+    config = dict(DEFAULT_CONFIG)
+    for item in os.environ["ENHYDRIS_SYNOPTIC_BENCHMARK"].split(","):
+        if item.strip():
+            key, value = item.split("=")
+            if key.strip() not in config:
+                raise ValueError(f"Unknown benchmark parameter {key}")
+            config[key.strip()] = int(value)
+    return config
+
+
+def render_all():
+    run = Run(name="benchmark")
+    with run.timer("latest values"):
+        LatestValue.objects.refresh_all()
+    for sgroup in SynopticGroup.objects.all():
+        render_synoptic_group(sgroup, run=run)
+    return run
+
+
+def get_result(run):
+    return {
+        "seconds": run.duration,
+        "summary": {
+            name: sum(run.stage_times.get(stage, 0) for stage in stages)
+            for name, stages in STAGES.items()
+        },
+        "stages": dict(run.stage_times),
+        "stage_counts": dict(run.stage_counts),
+        "counts": dict(run.counts),
+    }
+
+
+def get_medians(results):
+    stages = {stage for result in results for stage in result["stages"]}
+    return {
+        "seconds": statistics.median(x["seconds"] for x in results),
+        "summary": {
+            name: statistics.median(x["summary"][name] for x in results)
+            for name in STAGES
+        },
+        "stages": {
+            stage: statistics.median(x["stages"].get(stage, 0) for x in results)
+            for stage in sorted(stages)
+        },
+    }
+
+
+def get_peak_memory():
+    tracemalloc.start()
+    try:
+        render_all()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@skipUnless(
+    os.environ.get("ENHYDRIS_SYNOPTIC_BENCHMARK"),
+    "Set ENHYDRIS_SYNOPTIC_BENCHMARK to run the benchmark",
+)
+@RandomSynopticRoot()
+class BenchmarkTestCase(TestCase):
+    def test_benchmark(self):
+        config = get_config()
+        deployment = SyntheticDeployment(
+            groups=config["groups"],
+            stations=config["stations"],
+            variables=config["variables"],
+            time_step=dt.timedelta(minutes=config["time_step"]),
+            days=config["days"],
+            grouped=config["grouped"],
+        )
+        deployment.create()
+        results = [get_result(render_all()) for i in range(config["repeat"])]
+        output = {
+            "config": config,
+            "records_per_timeseries": deployment.nrecords,
+            "commit": get_git_commit(),
+            "python": platform.python_version(),
+            "repetitions": results,
+            "median": get_medians(results),
+            "peak_memory_bytes": get_peak_memory(),
+            "import_seconds": measure_import("enhydris_synoptic.tasks")["seconds"],
+        }
+        filename = os.environ.get(
+            "ENHYDRIS_SYNOPTIC_BENCHMARK_OUTPUT", "synoptic-benchmark.json"
+        )
+        with open(filename, "w") as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+        self.assertGreater(results[0]["counts"]["charts rendered"], 0)
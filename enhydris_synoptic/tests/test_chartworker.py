@@ -0,0 +1,84 @@
+import os
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+import numpy as np
+
+from enhydris_synoptic import chartworker
+from enhydris_synoptic.tasks import create_static_files
+
+from .data import TestData
+from .test_tasks import RandomSynopticRoot
+
+
+@RandomSynopticRoot()
+@override_settings(ENHYDRIS_SYNOPTIC_CHART_WORKER=True)
+class ChartWorkerTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        settings.TEST_MATPLOTLIB = True
+        self.addCleanup(setattr, settings, "TEST_MATPLOTLIB", False)
+        # The worker process has a copy of the settings of when it was started, so
+        # each test needs a new one.
+        self.addCleanup(chartworker.close_worker)
+
+    def _get_chart_data(self, syntsg):
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, "chart", str(syntsg.id) + ".dat"
+        )
+        with open(filename) as f:
+            return eval(f.read().replace("array", "np.array"))
+
+    def test_grouped_chart(self):
+        create_static_files()
+        data_array = self._get_chart_data(self.data.stsg1_3)
+        self.assertEqual(len(data_array), 2)
+        np.testing.assert_allclose(data_array[0][:, 1], [3.7, 4.5, 4.1])
+        np.testing.assert_allclose(data_array[1][:, 1], [2.9, 3.2, 3])
+
+    def test_charts_are_not_rendered_in_calling_process(self):
+        create_static_files()
+        self.assertIsNotNone(chartworker.get_worker().process)
+        self.assertNotEqual(chartworker.get_worker().process.pid, os.getpid())
+
+    @override_settings(ENHYDRIS_SYNOPTIC_CHART_WORKER_MAX_CHARTS=2)
+    def test_recycles_after_max_charts(self):
+        chartworker.close_worker()  # Use a worker with the overridden setting
+        with self.assertLogs("enhydris_synoptic.chartworker") as cm:
+            create_static_files()
+        self.assertIn("Recycling chart worker process", cm.output[0])
+
+    def test_does_not_recycle_before_max_charts(self):
+        create_static_files()
+        worker = chartworker.get_worker()
+        self.assertLess(worker.charts, worker.max_charts)
+        self.assertIsNotNone(worker.process)
+
+
+@RandomSynopticRoot()
+@override_settings(ENHYDRIS_SYNOPTIC_CHART_WORKER=True)
+@mock.patch("multiprocessing.current_process")
+class DaemonicProcessTestCase(TestCase):
+    """Celery's prefork pool runs tasks in daemonic processes."""
+
+    def setUp(self):
+        self.data = TestData()
+        self.addCleanup(chartworker.close_worker)
+
+    def test_charts_are_rendered_in_child_process(self, m):
+        m.return_value.daemon = True
+        create_static_files()
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, "chart", f"{self.data.stsg2_2.id}.png"
+        )
+        self.assertTrue(os.path.exists(filename))
+        self.assertIsNotNone(chartworker.get_worker().process)
+        self.assertNotEqual(chartworker.get_worker().process.pid, os.getpid())
+
+
+class GetMemoryTestCase(TestCase):
+    def test_returns_megabytes(self):
+        self.assertGreater(chartworker.get_memory(), 1)
+        self.assertLess(chartworker.get_memory(), 100000)
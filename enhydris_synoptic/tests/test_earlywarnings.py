@@ -0,0 +1,140 @@
+import datetime as dt
+import os
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from enhydris_synoptic import earlywarnings, models
+from enhydris_synoptic.tasks import check_early_warnings, create_static_files
+
+from .data import TestData
+from .test_tasks import RandomSynopticRoot
+
+
+@RandomSynopticRoot()
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    DEFAULT_FROM_EMAIL="noreply@enhydris.com",
+)
+class CheckEarlyWarningsTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        models.EarlyWarningEmail.objects.create(
+            synoptic_group=self.data.sg1, email="someone@blackhole.com"
+        )
+
+    def test_subject(self):
+        check_early_warnings()
+        self.assertEqual(
+            mail.outbox[0].message()["Subject"], "Enhydris early warning (Komboti)"
+        )
+
+    def test_payload(self):
+        check_early_warnings()
+        self.assertEqual(
+            mail.outbox[0].message().get_payload(),
+            "Komboti 2015-10-22 15:20 Air temperature 17.0 (low limit 17.1)\n"
+            "Komboti 2015-10-22 15:20 Wind 4.1 (high limit 4.0)\n",
+        )
+
+    def test_does_not_render(self):
+        check_early_warnings()
+        chart_dir = os.path.join(settings.ENHYDRIS_SYNOPTIC_ROOT, "chart")
+        self.assertFalse(os.path.exists(chart_dir))
+
+    def test_no_warning_within_limits(self):
+        self.data.stsg1_2.low_limit = 10
+        self.data.stsg1_2.save()
+        self.data.stsg1_4.high_limit = 5
+        self.data.stsg1_4.save()
+        check_early_warnings()
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_single_query(self):
+        models.LatestValue.objects.refresh_all()
+        with self.assertNumQueries(1):
+            earlywarnings.check_limits()
+
+    @override_settings(ENHYDRIS_SYNOPTIC_EARLY_WARNINGS_IN_RENDER=False)
+    def test_render_does_not_send_warnings_if_so_configured(self):
+        create_static_files()
+        self.assertEqual(len(mail.outbox), 0)
+
+
+@RandomSynopticRoot()
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    DEFAULT_FROM_EMAIL="noreply@enhydris.com",
+)
+class AlarmStateTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        models.EarlyWarningEmail.objects.create(
+            synoptic_group=self.data.sg1, email="someone@blackhole.com"
+        )
+        # Only Komboti's temperature (17.0) is checked, against a low limit of 17.1
+        self.data.stsg1_4.high_limit = None
+        self.data.stsg1_4.save()
+        check_early_warnings()
+        mail.outbox = []
+
+    def _set_low_limit(self, low_limit, hysteresis=None):
+        self.data.stsg1_2.low_limit = low_limit
+        self.data.stsg1_2.hysteresis = hysteresis
+        self.data.stsg1_2.save()
+
+    def test_state(self):
+        state = models.AlarmState.objects.get(
+            synoptic_timeseries_group=self.data.stsg1_2
+        )
+        self.assertEqual(state.status, "low")
+
+    def test_not_sent_again_while_in_alarm(self):
+        check_early_warnings()
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_sent_again_if_renotify_interval_has_elapsed(self):
+        self.data.sg1.renotify_interval = dt.timedelta(0)
+        self.data.sg1.save()
+        check_early_warnings()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_back_to_normal(self):
+        self._set_low_limit(10)
+        check_early_warnings()
+        self.assertEqual(
+            mail.outbox[0].message().get_payload(),
+            "Komboti 2015-10-22 15:20 Air temperature 17.0 (back to normal)\n",
+        )
+
+    def test_hysteresis_keeps_alarm(self):
+        self._set_low_limit(16.5, hysteresis=1)
+        check_early_warnings()
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_back_to_normal_beyond_hysteresis(self):
+        self._set_low_limit(15.9, hysteresis=1)
+        check_early_warnings()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_stations_with_same_variable_are_both_warned(self):
+        self.data.stsg2_2.high_limit = -100
+        self.data.stsg2_2.save()
+        check_early_warnings()
+        self.assertIn("Άγιος Αθανάσιος", mail.outbox[0].message().get_payload())
+
+
+class SendMessagesTestCase(TestCase):
+    @mock.patch("enhydris_synoptic.earlywarnings.get_connection")
+    def test_uses_single_connection(self, m):
+        messages = [mock.Mock(), mock.Mock()]
+        earlywarnings.send_messages(messages)
+        m.return_value.send_messages.assert_called_once_with(messages)
+
+    @mock.patch("enhydris_synoptic.earlywarnings.get_connection")
+    def test_failure_is_logged(self, m):
+        m.return_value.send_messages.side_effect = OSError("hello")
+        with self.assertLogs("enhydris_synoptic.earlywarnings", level="ERROR"):
+            earlywarnings.send_messages([mock.Mock()])
@@ -0,0 +1,211 @@
+import os
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.admin.sites import AdminSite
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from model_mommy import mommy
+
+from enhydris_synoptic import events, models
+from enhydris_synoptic.admin import GroupAdmin
+from enhydris_synoptic.tasks import render_pending_stations
+from enhydris_synoptic.views import render_synoptic_group
+
+from .data import TestData
+from .test_tasks import RandomSynopticRoot
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StationIndexTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        events.station_index.invalidate()
+
+    def test_finds_station(self):
+        result = events.station_index.get(self.data.tsg_komboti_rain.id)
+        self.assertEqual(result, {(self.data.sg1.id, self.data.sgs_komboti.id)})
+
+    def test_unused_timeseries_group(self):
+        self.assertEqual(
+            events.station_index.get(self.data.tsg_agios_rain.id + 1000), set()
+        )
+
+    def test_invalidated_when_configuration_changes(self):
+        events.station_index.get(self.data.tsg_komboti_rain.id)
+        mommy.make(
+            models.SynopticTimeseriesGroup,
+            synoptic_group_station=self.data.sgs_arta,
+            timeseries_group=self.data.tsg_komboti_rain,
+            order=1,
+        )
+        result = events.station_index.get(self.data.tsg_komboti_rain.id)
+        self.assertEqual(
+            result,
+            {
+                (self.data.sg1.id, self.data.sgs_komboti.id),
+                (self.data.sg1.id, self.data.sgs_arta.id),
+            },
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ENHYDRIS_SYNOPTIC_RENDER_DELAY=10)
+class QueueRenderTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        events.station_index.invalidate()
+        cache.clear()
+        patcher = mock.patch("enhydris_synoptic.tasks.render_pending_stations")
+        self.mock_task = patcher.start()
+        self.addCleanup(patcher.stop)
+        for tsg in (self.data.tsg_komboti_rain, self.data.tsg_komboti_temperature):
+            events.timeseries_changed(tsg.default_timeseries)
+
+    def test_render_is_queued_once(self):
+        self.mock_task.apply_async.assert_called_once_with(
+            args=[self.data.sg1.id], countdown=10
+        )
+
+    def test_pending_stations(self):
+        result = events.pop_pending_stations(self.data.sg1.id)
+        self.assertEqual(result, [self.data.sgs_komboti.id])
+
+    def test_pending_stations_are_unmarked(self):
+        events.pop_pending_stations(self.data.sg1.id)
+        self.assertEqual(events.pop_pending_stations(self.data.sg1.id), [])
+
+    def test_render_is_queued_again_after_pop(self):
+        events.pop_pending_stations(self.data.sg1.id)
+        events.timeseries_changed(self.data.tsg_agios_rain.default_timeseries)
+        self.assertEqual(self.mock_task.apply_async.call_count, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, ENHYDRIS_SYNOPTIC_RENDER_ON_CHANGE=True)
+class ConfigurationChangeTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        cache.clear()
+        patcher = mock.patch("enhydris_synoptic.tasks.render_pending_stations")
+        self.mock_task = patcher.start()
+        self.addCleanup(patcher.stop)
+        # TestCase never commits, so we run the on_commit() callbacks immediately
+        patcher = mock.patch(
+            "django.db.transaction.on_commit", side_effect=lambda func: func()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_group_change_renders_all_stations(self):
+        self.data.sg1.save()
+        self.assertEqual(
+            set(events.pop_pending_stations(self.data.sg1.id)),
+            {self.data.sgs_komboti.id, self.data.sgs_agios.id, self.data.sgs_arta.id},
+        )
+
+    def test_timeseries_group_change_renders_its_station(self):
+        self.data.stsg1_1.save()
+        self.assertEqual(
+            events.pop_pending_stations(self.data.sg1.id), [self.data.sgs_komboti.id]
+        )
+
+    def test_render_is_queued_soon(self):
+        self.data.stsg1_1.save()
+        self.mock_task.apply_async.assert_called_once_with(
+            args=[self.data.sg1.id], countdown=events.CHANGE_RENDER_DELAY
+        )
+
+    def test_station_deletion_renders_only_map(self):
+        self.data.sgs_arta.delete()
+        self.assertTrue(events.is_render_queued(self.data.sg1.id))
+        self.assertEqual(events.pop_pending_stations(self.data.sg1.id), [])
+
+    @override_settings(ENHYDRIS_SYNOPTIC_RENDER_ON_CHANGE=False)
+    def test_disabled(self):
+        self.data.sg1.save()
+        self.mock_task.apply_async.assert_not_called()
+
+
+@RandomSynopticRoot()
+@override_settings(CACHES=LOCMEM_CACHES)
+class RenderPendingStationsTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        cache.clear()
+        with mock.patch("enhydris_synoptic.tasks.render_pending_stations"):
+            events.queue_render(self.data.sg1.id, [self.data.sgs_komboti.id])
+        render_pending_stations(self.data.sg1.id)
+
+    def _station_page_exists(self, synoptic_group_station):
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT,
+            self.data.sg1.slug,
+            "station",
+            str(synoptic_group_station.station.id),
+            "index.html",
+        )
+        return os.path.exists(filename)
+
+    def test_group_page_is_rendered(self):
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, self.data.sg1.slug, "index.html"
+        )
+        self.assertTrue(os.path.exists(filename))
+
+    def test_pending_station_is_rendered(self):
+        self.assertTrue(self._station_page_exists(self.data.sgs_komboti))
+
+    def test_other_station_is_not_rendered(self):
+        self.assertFalse(self._station_page_exists(self.data.sgs_agios))
+
+    def test_last_rendered(self):
+        self.data.sg1.refresh_from_db()
+        self.assertIsNotNone(self.data.sg1.last_rendered)
+
+
+@RandomSynopticRoot()
+@override_settings(CACHES=LOCMEM_CACHES)
+class RenderStatusTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        cache.clear()
+        with mock.patch("enhydris_synoptic.tasks.render_pending_stations"):
+            events.queue_render(self.data.sg1.id, [self.data.sgs_komboti.id])
+
+    def _get_status(self):
+        synoptic_group = models.SynopticGroup.objects.get(id=self.data.sg1.id)
+        model_admin = GroupAdmin(models.SynopticGroup, AdminSite())
+        return str(model_admin.render_status(synoptic_group))
+
+    def test_queued(self):
+        self.assertEqual(self._get_status(), "Rendering…")
+
+    def test_during_render(self):
+        statuses = []
+
+        def render(*args, **kwargs):
+            statuses.append(self._get_status())
+            return render_synoptic_group(*args, **kwargs)
+
+        with mock.patch(
+            "enhydris_synoptic.tasks.render_synoptic_group", side_effect=render
+        ):
+            render_pending_stations(self.data.sg1.id)
+        self.assertEqual(statuses, ["Rendering…"])
+
+    def test_after_render(self):
+        render_pending_stations(self.data.sg1.id)
+        self.assertTrue(self._get_status().startswith("Rendered at"))
+
+    def test_after_failed_render(self):
+        with mock.patch(
+            "enhydris_synoptic.tasks.render_synoptic_group",
+            side_effect=RuntimeError("hello"),
+        ):
+            with self.assertRaises(RuntimeError):
+                render_pending_stations(self.data.sg1.id)
+        self.assertEqual(self._get_status(), "Not rendered yet")
@@ -0,0 +1,59 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.test import SimpleTestCase
+
+from enhydris_synoptic import views
+
+MEASURE_IMPORT = """
+import json, sys, time
+import django
+django.setup()
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure_import(module):
+    """Import module in a fresh interpreter.
+
+    Return a dictionary with the time the import took (after setting up Django) and
+    the modules that were loaded.
+    """
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE_IMPORT.format(module=module)],
+        capture_output=True,
+        check=True,
+        env=env,
+        text=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+class ImportTasksTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.result = measure_import("enhydris_synoptic.tasks")
+
+    def test_matplotlib_not_loaded(self):
+        self.assertNotIn("matplotlib", self.result["modules"])
+
+    def test_pandas_plotting_not_loaded(self):
+        self.assertNotIn("pandas.plotting", self.result["modules"])
+
+    def test_views_loaded(self):
+        self.assertIn("enhydris_synoptic.views", self.result["modules"])
+
+
+class LoadChartEngineTestCase(SimpleTestCase):
+    def test_uses_agg_backend(self):
+        self.assertEqual(views.load_chart_engine().get_backend().lower(), "agg")
+
+    def test_loads_once(self):
+        self.assertIs(views.load_chart_engine(), views.load_chart_engine())
@@ -1,7 +1,9 @@
 import datetime as dt
 import textwrap
 from io import StringIO
+from unittest import mock
 
+from django.core.management import call_command
 from django.db import IntegrityError
 from django.test import TestCase
 
@@ -10,13 +12,19 @@ from model_mommy import mommy
 
 from enhydris.models import Station, Timeseries, TimeseriesGroup, TimeZone
 from enhydris_synoptic.models import (
+    ChartWindow,
+    LatestValue,
     SynopticGroup,
     SynopticGroupStation,
     SynopticTimeseriesGroup,
+    TimeseriesRollup,
 )
+from enhydris_synoptic.runs import Run
 
 from .data import TestData
 
+UTC = dt.timezone.utc
+
 
 class SynopticGroupTestCase(TestCase):
     def test_create(self):
@@ -47,6 +55,126 @@ class SynopticGroupTestCase(TestCase):
         self.assertEqual(str(sg), "hello world")
 
 
+@freeze_time("2015-10-23 13:30:00")
+class RefreshPolicyTestCase(TestCase):
+    def setUp(self):
+        self.sg = mommy.make(SynopticGroup, refresh_interval=dt.timedelta(minutes=5))
+
+    def _render(self, last_data_date):
+        with mock.patch.object(
+            SynopticGroup, "_get_last_data_date", return_value=last_data_date
+        ):
+            self.sg.mark_rendered()
+        self.sg.refresh_from_db()
+
+    def test_fixed(self):
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        self.assertEqual(
+            self.sg.next_render, dt.datetime(2015, 10, 23, 13, 35, tzinfo=UTC)
+        )
+
+    def test_incomplete_render_does_not_reschedule(self):
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        with freeze_time("2015-10-23 13:33:00"):
+            self.sg.mark_rendered(complete=False)
+        self.sg.refresh_from_db()
+        self.assertEqual(
+            self.sg.last_rendered, dt.datetime(2015, 10, 23, 13, 33, tzinfo=UTC)
+        )
+        self.assertEqual(
+            self.sg.next_render, dt.datetime(2015, 10, 23, 13, 35, tzinfo=UTC)
+        )
+
+    def test_uses_last_common_dates_of_specified_stations(self):
+        synstations = [
+            mock.Mock(last_common_date=dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC)),
+            mock.Mock(last_common_date=None),
+        ]
+        self.sg.mark_rendered(synstations)
+        self.sg.refresh_from_db()
+        self.assertEqual(
+            self.sg.last_data_date, dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC)
+        )
+
+    def test_learns_data_interval(self):
+        self._render(dt.datetime(2015, 10, 23, 12, 0, tzinfo=UTC))
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        self.assertEqual(self.sg.data_interval, dt.timedelta(hours=1))
+
+    def test_smooths_data_interval(self):
+        self._render(dt.datetime(2015, 10, 23, 12, 0, tzinfo=UTC))
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        self._render(dt.datetime(2015, 10, 23, 13, 10, tzinfo=UTC))
+        self.assertEqual(self.sg.data_interval, dt.timedelta(minutes=45))
+
+    def test_unchanged_data_date_is_not_an_observation(self):
+        self._render(dt.datetime(2015, 10, 23, 12, 0, tzinfo=UTC))
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        self.assertEqual(self.sg.data_interval, dt.timedelta(hours=1))
+
+    def test_adaptive(self):
+        self.sg.refresh_policy = SynopticGroup.ADAPTIVE
+        self._render(dt.datetime(2015, 10, 23, 12, 0, tzinfo=UTC))
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        self.assertEqual(
+            self.sg.next_render, dt.datetime(2015, 10, 23, 14, 0, tzinfo=UTC)
+        )
+
+    def test_adaptive_is_not_faster_than_refresh_interval(self):
+        self.sg.refresh_policy = SynopticGroup.ADAPTIVE
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        self._render(dt.datetime(2015, 10, 23, 13, 1, tzinfo=UTC))
+        self.assertEqual(
+            self.sg.next_render, dt.datetime(2015, 10, 23, 13, 35, tzinfo=UTC)
+        )
+
+    def test_adaptive_is_not_slower_than_maximum(self):
+        self.sg.refresh_policy = SynopticGroup.ADAPTIVE
+        self._render(dt.datetime(2015, 10, 20, 13, 0, tzinfo=UTC))
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        self.assertEqual(
+            self.sg.next_render, dt.datetime(2015, 10, 23, 14, 30, tzinfo=UTC)
+        )
+
+    def test_due(self):
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        now = dt.datetime(2015, 10, 23, 13, 35, tzinfo=UTC)
+        self.assertEqual(list(SynopticGroup.objects.due(now)), [self.sg])
+
+    def test_not_due(self):
+        self._render(dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC))
+        now = dt.datetime(2015, 10, 23, 13, 34, tzinfo=UTC)
+        self.assertEqual(list(SynopticGroup.objects.due(now)), [])
+
+
+class LastDataDateTestCase(TestCase):
+    def test_last_data_date(self):
+        data = TestData()
+        self.assertEqual(
+            data.sg1._get_last_data_date(),
+            dt.datetime(2015, 10, 23, 13, 20, tzinfo=UTC),
+        )
+
+
+class ChartWindowTestCase(TestCase):
+    def test_slug_in_days(self):
+        window = ChartWindow(duration=dt.timedelta(days=7))
+        self.assertEqual(window.slug, "7d")
+
+    def test_slug_in_hours(self):
+        window = ChartWindow(duration=dt.timedelta(hours=36))
+        self.assertEqual(window.slug, "36h")
+
+    def test_hourly_aggregation(self):
+        window = ChartWindow(duration=dt.timedelta(days=31))
+        self.assertEqual(window.aggregation_unit, "hour")
+
+    def test_daily_aggregation(self):
+        window = ChartWindow(duration=dt.timedelta(days=32))
+        self.assertEqual(window.aggregation_unit, "day")
+
+
 class SynopticGroupStationTestCase(TestCase):
     def test_create(self):
         sg = mommy.make(SynopticGroup)
@@ -267,3 +395,226 @@ class SynopticTimeseriesGroupTestCase(TestCase):
             timeseries_group__name="mytimeseriesgroup",
         )
         self.assertEqual(str(stg), "mystation - mytimeseriesgroup (mysubtitle)")
+
+
+class TimeseriesRollupTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        self.timeseries = self.data.tsg_agios_rain.default_timeseries
+        TimeseriesRollup.objects.refresh(self.timeseries)
+
+    def _get_rollups(self, unit):
+        return TimeseriesRollup.objects.filter(timeseries=self.timeseries, unit=unit)
+
+    def test_hourly_timestamps(self):
+        self.assertEqual(
+            [x.timestamp for x in self._get_rollups("hour")],
+            [
+                dt.datetime(2015, 10, 22, 13, 0, tzinfo=UTC),
+                dt.datetime(2015, 10, 23, 13, 0, tzinfo=UTC),
+            ],
+        )
+
+    def test_hourly_statistics(self):
+        rollup = self._get_rollups("hour").last()
+        self.assertAlmostEqual(rollup.min, 0)
+        self.assertAlmostEqual(rollup.max, 1.4)
+        self.assertAlmostEqual(rollup.mean, 0.5333333)
+        self.assertEqual(rollup.count, 3)
+
+    def test_daily_timestamps(self):
+        self.assertEqual(
+            [x.timestamp for x in self._get_rollups("day")],
+            [
+                dt.datetime(2015, 10, 21, 22, 0, tzinfo=UTC),
+                dt.datetime(2015, 10, 22, 22, 0, tzinfo=UTC),
+            ],
+        )
+
+    def test_incremental_refresh_updates_last_hour(self):
+        self.timeseries.append_data(StringIO("2015-10-23 15:40,2.2,\n"))
+        TimeseriesRollup.objects.refresh(self.timeseries)
+        rollup = self._get_rollups("hour").last()
+        self.assertEqual(rollup.count, 4)
+        self.assertAlmostEqual(rollup.max, 2.2)
+
+    def test_incremental_refresh_keeps_older_hours(self):
+        first_rollup = self._get_rollups("hour").first()
+        self.timeseries.append_data(StringIO("2015-10-23 16:10,2.2,\n"))
+        TimeseriesRollup.objects.refresh(self.timeseries)
+        self.assertEqual(self._get_rollups("hour").first().id, first_rollup.id)
+        self.assertEqual(self._get_rollups("hour").count(), 3)
+
+    def test_get_data_includes_records_after_last_refresh(self):
+        self.timeseries.append_data(StringIO("2015-10-23 15:40,2.2,\n"))
+        data = TimeseriesRollup.objects.get_data(
+            self.timeseries,
+            "hour",
+            start_date=dt.datetime(2015, 10, 20, 0, 0, tzinfo=UTC),
+            end_date=dt.datetime(2015, 10, 24, 0, 0, tzinfo=UTC),
+        )
+        self.assertEqual(list(data["count"]), [1, 4])
+        self.assertEqual(data.index[-1], dt.datetime(2015, 10, 23, 15, 0))
+
+
+class BackfillSynopticRollupsTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        call_command("backfill_synoptic_rollups", stdout=StringIO())
+
+    def test_creates_rollups_for_all_timeseries(self):
+        self.assertEqual(
+            TimeseriesRollup.objects.values("timeseries").distinct().count(), 7
+        )
+
+
+class LatestValueTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        LatestValue.objects.refresh_all()
+        self.timeseries = self.data.tsg_agios_rain.default_timeseries
+
+    def test_timestamp(self):
+        latest_value = LatestValue.objects.get(timeseries=self.timeseries)
+        self.assertEqual(
+            latest_value.timestamp, dt.datetime(2015, 10, 23, 13, 30, tzinfo=UTC)
+        )
+
+    def test_value(self):
+        latest_value = LatestValue.objects.get(timeseries=self.timeseries)
+        self.assertAlmostEqual(latest_value.value, 1.4)
+
+    def test_null_value(self):
+        timeseries = self.data.tsg_agios_wind_speed.default_timeseries
+        self.assertIsNone(LatestValue.objects.get(timeseries=timeseries).value)
+
+    def test_refresh_finds_appended_records(self):
+        self.timeseries.append_data(StringIO("2015-10-23 15:40,2.2,\n"))
+        LatestValue.objects.refresh_all()
+        latest_value = LatestValue.objects.get(timeseries=self.timeseries)
+        self.assertEqual(
+            latest_value.timestamp, dt.datetime(2015, 10, 23, 13, 40, tzinfo=UTC)
+        )
+        self.assertAlmostEqual(latest_value.value, 2.2)
+
+    def test_last_common_date_uses_cache(self):
+        LatestValue.objects.filter(
+            timeseries=self.data.tsg_agios_temperature.default_timeseries
+        ).update(timestamp=dt.datetime(2015, 10, 23, 13, 10, tzinfo=UTC))
+        self.assertEqual(
+            self.data.sgs_agios.last_common_date,
+            dt.datetime(2015, 10, 23, 13, 10, tzinfo=UTC),
+        )
+
+    def test_value_uses_cache(self):
+        LatestValue.objects.filter(
+            timeseries=self.data.tsg_agios_temperature.default_timeseries
+        ).update(value=42.0)
+        self.assertAlmostEqual(
+            self.data.sgs_agios.synoptic_timeseries_groups[1].value, 42.0
+        )
+
+
+class LatestValueWithManyTimeseriesTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        tsg = self.data.tsg_komboti_temperature
+        initial = tsg.default_timeseries
+        self.checked = mommy.make(
+            Timeseries, timeseries_group=tsg, type=Timeseries.CHECKED
+        )
+        self.checked.set_data(
+            StringIO(
+                "2015-10-22 15:00,99,\n2015-10-22 15:10,99,\n2015-10-22 15:20,99,\n"
+            )
+        )
+        # Make the checked time series the default of the group, whatever Enhydris
+        # would choose
+        original = SynopticTimeseriesGroup.get_default_timeseries
+
+        def get_default_timeseries(asyntsg):
+            if asyntsg.timeseries_group_id == tsg.id:
+                return self.checked
+            return original(asyntsg)
+
+        patcher = mock.patch.object(
+            SynopticTimeseriesGroup,
+            "get_default_timeseries",
+            autospec=True,
+            side_effect=get_default_timeseries,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The initial time series is also in the cache, after the default one
+        LatestValue.objects.all().delete()
+        LatestValue.objects.refresh([self.checked])
+        LatestValue.objects.refresh([initial])
+
+    def test_value_is_from_default_timeseries(self):
+        synstation = SynopticGroupStation.objects.get(id=self.data.sgs_komboti.id)
+        asyntsg = synstation.synoptic_timeseries_groups[1]
+        self.assertEqual(asyntsg.timeseries_group_id, self.checked.timeseries_group_id)
+        self.assertAlmostEqual(asyntsg.value, 99)
+
+    def test_latest_value_is_from_default_timeseries(self):
+        synstation = SynopticGroupStation.objects.get(id=self.data.sgs_komboti.id)
+        asyntsg = synstation.synoptictimeseriesgroup_set.get(order=2)
+        latest_value = synstation.get_latest_value(asyntsg)
+        self.assertEqual(latest_value.timeseries_id, self.checked.id)
+
+
+class RunDataCacheTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        self.sg2 = mommy.make(
+            SynopticGroup,
+            slug="national",
+            fresh_time_limit=dt.timedelta(minutes=60),
+            time_zone=self.data.sg1.time_zone,
+        )
+        self.sgs2_komboti = mommy.make(
+            SynopticGroupStation,
+            synoptic_group=self.sg2,
+            station=self.data.station_komboti,
+            order=1,
+        )
+        mommy.make(
+            SynopticTimeseriesGroup,
+            synoptic_group_station=self.sgs2_komboti,
+            timeseries_group=self.data.tsg_komboti_rain,
+            order=1,
+        )
+        self.run = Run()
+        self.data.sg1.render_run = self.run
+        self.sg2.render_run = self.run
+
+    def test_data_is_read_once(self):
+        data1 = self.data.sgs_komboti.synoptic_timeseries_groups[0].data
+        data2 = self.sgs2_komboti.synoptic_timeseries_groups[0].data
+        self.assertIs(data1, data2)
+
+    def test_hits(self):
+        self.data.sgs_komboti.synoptic_timeseries_groups[0].data
+        hits_before = self.run.data_cache.hits
+        self.sgs2_komboti.synoptic_timeseries_groups[0].data
+        self.assertGreater(self.run.data_cache.hits, hits_before)
+
+    def test_streaming_run_does_not_keep_data(self):
+        self.run = self.data.sg1.render_run = self.sg2.render_run = Run(streaming=True)
+        data1 = self.data.sgs_komboti.synoptic_timeseries_groups[0].data
+        data2 = self.sgs2_komboti.synoptic_timeseries_groups[0].data
+        self.assertIsNot(data1, data2)
+
+    def test_free_data(self):
+        syntsg = self.data.sgs_komboti.synoptic_timeseries_groups[0]
+        syntsg.data
+        self.data.sgs_komboti.free_data()
+        self.assertFalse(hasattr(syntsg, "_data"))
+
+    def test_free_data_keeps_value(self):
+        syntsg = self.data.sgs_komboti.synoptic_timeseries_groups[0]
+        value = syntsg.value
+        self.data.sgs_komboti.free_data()
+        self.assertEqual(
+            self.data.sgs_komboti.synoptic_timeseries_groups[0].value, value
+        )
@@ -0,0 +1,93 @@
+import glob
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+
+from enhydris_synoptic import profiling
+from enhydris_synoptic.tasks import create_static_files
+
+from .data import TestData
+from .test_tasks import RandomSynopticRoot
+
+
+@RandomSynopticRoot()
+class ProfileTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        settings_override = override_settings(ENHYDRIS_SYNOPTIC_PROFILE_DIR=tmpdir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _get_profiles(self, extension="prof"):
+        return glob.glob(os.path.join(profiling.get_directory(), f"*.{extension}"))
+
+    def test_not_profiled_by_default(self):
+        create_static_files()
+        self.assertEqual(self._get_profiles(), [])
+
+    def test_profile_option(self):
+        create_static_files(profile=True)
+        profiles = self._get_profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertTrue(profiles[0].endswith("-create_static_files-mygroup.prof"))
+
+    def test_summary(self):
+        create_static_files(profile=True)
+        with open(self._get_profiles("txt")[0]) as f:
+            self.assertIn("render_synoptic_group", f.read())
+
+    @override_settings(ENHYDRIS_SYNOPTIC_PROFILE=True)
+    def test_setting(self):
+        create_static_files()
+        self.assertEqual(len(self._get_profiles()), 1)
+
+    @override_settings(
+        ENHYDRIS_SYNOPTIC_PROFILE=True, ENHYDRIS_SYNOPTIC_PROFILE_SAMPLE_RATE=0
+    )
+    def test_sampling(self):
+        create_static_files()
+        self.assertEqual(self._get_profiles(), [])
+
+    @override_settings(
+        ENHYDRIS_SYNOPTIC_PROFILE=True, ENHYDRIS_SYNOPTIC_PROFILE_SAMPLE_RATE=0
+    )
+    def test_option_overrides_sampling(self):
+        create_static_files(profile=True)
+        self.assertEqual(len(self._get_profiles()), 1)
+
+
+@RandomSynopticRoot()
+class DefaultDirectoryTestCase(TestCase):
+    def test_not_in_synoptic_root(self):
+        root = os.path.realpath(settings.ENHYDRIS_SYNOPTIC_ROOT)
+        directory = os.path.realpath(profiling.get_directory())
+        self.assertNotEqual(os.path.commonpath([root, directory]), root)
+
+
+class RotateTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        for basename in ("20261018T100000-a", "20261018T110000-a", "20261018T120000-a"):
+            for extension in ("prof", "txt"):
+                open(os.path.join(self.tmpdir, f"{basename}.{extension}"), "w").close()
+        with override_settings(
+            ENHYDRIS_SYNOPTIC_PROFILE_DIR=self.tmpdir, ENHYDRIS_SYNOPTIC_PROFILE_KEEP=2
+        ):
+            profiling._rotate()
+
+    def test_removes_oldest(self):
+        self.assertEqual(
+            sorted(os.listdir(self.tmpdir)),
+            [
+                "20261018T110000-a.prof",
+                "20261018T110000-a.txt",
+                "20261018T120000-a.prof",
+                "20261018T120000-a.txt",
+            ],
+        )
@@ -0,0 +1,68 @@
+import datetime as dt
+
+from django.test import TestCase
+
+import numpy as np
+
+from enhydris_synoptic import records
+
+from .data import TestData
+
+EET = dt.timezone(dt.timedelta(hours=2), "EET")
+
+
+class SeriesArraysTestCase(TestCase):
+    def setUp(self):
+        self.arrays = records.SeriesArrays(
+            np.array(
+                ["2015-10-23T15:00", "2015-10-23T15:10", "2015-10-23T15:20"],
+                dtype="datetime64[ns]",
+            ),
+            np.array([40, 39, 38.5]),
+        )
+
+    def test_len(self):
+        self.assertEqual(len(self.arrays), 3)
+
+    def test_value_at(self):
+        self.assertEqual(self.arrays.value_at(dt.datetime(2015, 10, 23, 15, 10)), 39)
+
+    def test_value_at_missing_timestamp(self):
+        with self.assertRaises(KeyError):
+            self.arrays.value_at(dt.datetime(2015, 10, 23, 15, 5))
+
+    def test_value_at_after_end(self):
+        with self.assertRaises(KeyError):
+            self.arrays.value_at(dt.datetime(2015, 10, 23, 15, 30))
+
+    def test_slice(self):
+        arrays = self.arrays.slice(
+            dt.datetime(2015, 10, 23, 15, 5), dt.datetime(2015, 10, 23, 15, 20)
+        )
+        np.testing.assert_allclose(arrays.values, [39, 38.5])
+
+
+class ReadArraysTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+
+    def test_timestamps_are_local(self):
+        arrays = records.read_arrays(
+            self.data.tsg_agios_temperature.default_timeseries,
+            start_date=dt.datetime(2015, 10, 23, 15, 10, tzinfo=EET),
+        )
+        np.testing.assert_array_equal(
+            arrays.timestamps,
+            np.array(["2015-10-23T15:10", "2015-10-23T15:20"], dtype="datetime64[ns]"),
+        )
+        np.testing.assert_allclose(arrays.values, [39, 38.5])
+
+    def test_null_values_are_nan(self):
+        arrays = records.read_arrays(self.data.tsg_agios_wind_speed.default_timeseries)
+        self.assertTrue(np.isnan(arrays.values).all())
+
+    def test_last(self):
+        arrays = records.read_arrays(
+            self.data.tsg_agios_rain.default_timeseries, last=2
+        )
+        np.testing.assert_allclose(arrays.values, [0.2, 1.4])
@@ -0,0 +1,88 @@
+import time
+
+from django.test import TestCase, override_settings
+
+from enhydris_synoptic import scheduler
+from enhydris_synoptic.models import SynopticGroupStation
+from enhydris_synoptic.runs import Run
+
+from .data import TestData
+
+
+class SchedulerTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        self.run = Run()
+        self.rendered = []
+
+    def _get_synstations(self):
+        return SynopticGroupStation.objects.filter(
+            id__in=[self.data.sgs_komboti.id, self.data.sgs_agios.id]
+        )
+
+    def _render(self, render_station=None):
+        return scheduler.render_stations(
+            self._get_synstations(), render_station or self.rendered.append, self.run
+        )
+
+    def test_renders_all_stations(self):
+        self._render()
+        self.assertEqual(len(self.rendered), 2)
+
+    def test_stations_with_new_data_come_first(self):
+        SynopticGroupStation.objects.filter(id=self.data.sgs_komboti.id).update(
+            last_rendered_date=self.data.sgs_komboti.last_common_date
+        )
+        self._render()
+        self.assertEqual(
+            [x.id for x in self.rendered],
+            [self.data.sgs_agios.id, self.data.sgs_komboti.id],
+        )
+
+    def test_marks_stations_rendered(self):
+        self._render()
+        self.data.sgs_agios.refresh_from_db()
+        self.assertFalse(self.data.sgs_agios.has_new_data)
+
+    def test_does_not_mark_stations_rendered_without_pages(self):
+        self.run.pages = False
+        self._render()
+        self.data.sgs_agios.refresh_from_db()
+        self.assertTrue(self.data.sgs_agios.has_new_data)
+
+    def test_failure_does_not_stop_other_stations(self):
+        def render_station(synstation):
+            if synstation.id == self.data.sgs_komboti.id:
+                raise ValueError("hello")
+            self.rendered.append(synstation)
+
+        result = self._render(render_station)
+        self.assertEqual([x.id for x in result], [self.data.sgs_agios.id])
+
+    def test_failure_is_recorded(self):
+        def render_station(synstation):
+            raise ValueError("hello")
+
+        self._render(render_station)
+        self.assertEqual(
+            self.run.station_outcomes[(self.data.sg1.slug, "Komboti")], "failed"
+        )
+
+    @override_settings(ENHYDRIS_SYNOPTIC_STATION_TIME_BUDGET=0.1)
+    def test_slow_station_times_out(self):
+        def render_station(synstation):
+            if synstation.id == self.data.sgs_komboti.id:
+                time.sleep(1)
+            self.rendered.append(synstation)
+
+        self._render(render_station)
+        self.assertEqual(
+            self.run.station_outcomes[(self.data.sg1.slug, "Komboti")], "timed out"
+        )
+        self.assertEqual([x.id for x in self.rendered], [self.data.sgs_agios.id])
+
+    def test_stations_are_skipped_when_run_is_out_of_time(self):
+        self.run.time_budget = 0
+        self._render()
+        self.assertEqual(self.rendered, [])
+        self.assertEqual(set(self.run.station_outcomes.values()), {"skipped"})
@@ -0,0 +1,130 @@
+import datetime as dt
+import json
+import os
+
+from django.conf import settings
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from enhydris_synoptic import earlywarnings, models, staleness
+from enhydris_synoptic.tasks import check_staleness
+
+from .data import TestData
+from .test_tasks import RandomSynopticRoot
+
+# Half an hour after the last common date of Άγιος Αθανάσιος (15:20 EET), which is
+# therefore fresh; Komboti's data is a day older, and Arta has no data.
+NOW = dt.datetime(2015, 10, 23, 13, 50, tzinfo=dt.timezone.utc)
+
+
+@RandomSynopticRoot()
+class StalenessReportTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        models.LatestValue.objects.refresh_all()
+        staleness.check_stations(now=NOW)
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, "mygroup", "staleness.json"
+        )
+        with open(filename) as f:
+            self.report = json.load(f)
+
+    def test_station_count(self):
+        self.assertEqual(self.report["stations"], 3)
+
+    def test_stale_stations(self):
+        names = [x["name"] for x in self.report["stale_stations"]]
+        self.assertEqual(names, ["Komboti", "Arta"])
+
+    def test_stale_station(self):
+        self.assertEqual(
+            self.report["stale_stations"][0],
+            {
+                "id": self.data.station_komboti.id,
+                "name": "Komboti",
+                "last_common_date": "2015-10-22T13:20:00+00:00",
+                "stale_since": "2015-10-22T14:20:00+00:00",
+                "stale_seconds": 84600,
+            },
+        )
+
+    def test_station_without_data(self):
+        self.assertIsNone(self.report["stale_stations"][1]["stale_seconds"])
+
+    def test_stale_field(self):
+        self.assertTrue(
+            models.SynopticGroupStation.objects.get(id=self.data.sgs_komboti.id).stale
+        )
+        self.assertFalse(
+            models.SynopticGroupStation.objects.get(id=self.data.sgs_agios.id).stale
+        )
+
+    def test_queries(self):
+        # Two queries, plus the update of the stations that have changed
+        with self.assertNumQueries(2):
+            staleness.check_stations(now=NOW)
+
+
+@RandomSynopticRoot()
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    DEFAULT_FROM_EMAIL="noreply@enhydris.com",
+    ENHYDRIS_SYNOPTIC_STALENESS_ALERTS=True,
+)
+class StalenessAlertTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        models.EarlyWarningEmail.objects.create(
+            synoptic_group=self.data.sg1, email="someone@blackhole.com"
+        )
+        models.LatestValue.objects.refresh_all()
+
+    def _check(self, now=NOW):
+        mail.outbox = []
+        earlywarnings.send_messages(staleness.check_stations(now=now))
+
+    def test_subject(self):
+        self._check()
+        self.assertEqual(
+            mail.outbox[0].subject,
+            "Enhydris stale stations ({})".format(self.data.sg1.name),
+        )
+
+    def test_payload(self):
+        self._check()
+        self.assertEqual(
+            mail.outbox[0].body,
+            "Komboti stale (no new data since 2015-10-22 14:20)\n"
+            "Arta stale (no data)\n",
+        )
+
+    def test_not_sent_again_while_stale(self):
+        self._check()
+        self._check()
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_fresh_again(self):
+        self._check()
+        self.data.sg1.fresh_time_limit = dt.timedelta(days=2)
+        self.data.sg1.save()
+        self._check()
+        self.assertEqual(
+            mail.outbox[0].body, "Komboti fresh again (last data 2015-10-22 14:20)\n"
+        )
+
+    def test_becoming_stale(self):
+        self._check()
+        self._check(now=NOW + dt.timedelta(hours=1))
+        self.assertEqual(
+            mail.outbox[0].body,
+            "Άγιος Αθανάσιος stale (no new data since 2015-10-23 14:20)\n",
+        )
+
+    @override_settings(ENHYDRIS_SYNOPTIC_STALENESS_ALERTS=False)
+    def test_disabled(self):
+        self._check()
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_task(self):
+        check_staleness()
+        self.assertEqual(len(mail.outbox), 1)
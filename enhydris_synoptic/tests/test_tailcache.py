@@ -0,0 +1,67 @@
+import datetime as dt
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.test import TestCase, override_settings
+
+import numpy as np
+
+from enhydris_synoptic.tailcache import TailCache
+
+from .data import TestData
+
+EET = dt.timezone(dt.timedelta(hours=2), "EET")
+
+
+class TailCacheTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.override = override_settings(
+            ENHYDRIS_SYNOPTIC_TAIL_CACHE_DIR=self.tmpdir,
+            ENHYDRIS_SYNOPTIC_TAIL_CACHE_SIZE=3,
+        )
+        self.override.enable()
+        self.data = TestData()
+        self.timeseries = self.data.tsg_agios_rain.default_timeseries
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.tmpdir)
+
+    def _get_data(self, start_date=dt.datetime(2015, 10, 23, 15, 0, tzinfo=EET)):
+        end_date = dt.datetime(2015, 10, 23, 18, 0, tzinfo=EET)
+        return TailCache(self.timeseries).get_arrays(start_date, end_date)
+
+    def test_data(self):
+        data = self._get_data()
+        np.testing.assert_array_equal(
+            data.timestamps,
+            np.array(
+                ["2015-10-23T15:10", "2015-10-23T15:20", "2015-10-23T15:30"],
+                dtype="datetime64[ns]",
+            ),
+        )
+        np.testing.assert_allclose(data.values, [0, 0.2, 1.4])
+
+    def test_creates_file(self):
+        self._get_data()
+        filename = os.path.join(self.tmpdir, f"{self.timeseries.id}.tail")
+        self.assertTrue(os.path.exists(filename))
+
+    def test_appended_records(self):
+        self._get_data()
+        self.timeseries.append_data(StringIO("2015-10-23 15:40,2.2,\n"))
+        data = self._get_data()
+        np.testing.assert_allclose(data.values, [0.2, 1.4, 2.2])
+
+    def test_replaced_records(self):
+        self._get_data()
+        self.timeseries.set_data(StringIO("2015-10-23 15:00,5.0,\n"))
+        data = self._get_data()
+        np.testing.assert_allclose(data.values, [5.0])
+
+    def test_returns_none_if_period_is_not_cached(self):
+        data = self._get_data(start_date=dt.datetime(2015, 10, 22, 0, 0, tzinfo=EET))
+        self.assertIsNone(data)
@@ -1,14 +1,18 @@
 import datetime as dt
+import json
 import locale
 import os
 import shutil
 import tempfile
+import time
 from io import StringIO
-from unittest import skipUnless
+from unittest import mock, skipUnless
 from urllib.parse import urlparse
 
 from django.conf import settings
 from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
 from django.http import HttpResponse
 from django.test import TestCase, override_settings
 
@@ -16,11 +20,14 @@ import numpy as np
 from bs4 import BeautifulSoup
 from django_selenium_clean import PageElement
 from freezegun import freeze_time
+from model_mommy import mommy
 from selenium.webdriver.common.by import By
 
 from enhydris.tests.test_views import SeleniumTestCase
-from enhydris_synoptic import models
-from enhydris_synoptic.tasks import create_static_files
+from enhydris_synoptic import models, sharedseries, tasks, views
+from enhydris_synoptic.locks import GroupLock
+from enhydris_synoptic.tasks import create_static_files, render_due_synoptic_groups
+from enhydris_synoptic.views import render_synoptic_group
 
 from .data import TestData
 
@@ -142,6 +149,664 @@ class ChartTestCase(TestCase):
         np.testing.assert_allclose(data_array[1], desired_result[1])
 
 
+@RandomSynopticRoot()
+@override_settings(ENHYDRIS_SYNOPTIC_CHART_PROCESSES=2)
+@skipUnless(sharedseries.is_available(), "Shared memory requires Python 3.8")
+class ParallelChartTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.data = TestData()
+        settings.TEST_MATPLOTLIB = True
+        create_static_files()
+
+    @classmethod
+    def tearDownClass(self):
+        settings.TEST_MATPLOTLIB = False
+        super().tearDownClass()
+
+    def _get_chart_data(self, syntsg):
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, "chart", str(syntsg.id) + ".dat"
+        )
+        with open(filename) as f:
+            return eval(f.read().replace("array", "np.array"))
+
+    def test_chart(self):
+        desired_result = np.array(
+            [
+                [days_since_epoch(2015, 10, 23, 15, 00), 40],
+                [days_since_epoch(2015, 10, 23, 15, 10), 39],
+                [days_since_epoch(2015, 10, 23, 15, 20), 38.5],
+            ]
+        )
+        np.testing.assert_allclose(
+            self._get_chart_data(self.data.stsg2_2), desired_result
+        )
+
+    def test_grouped_chart(self):
+        data_array = self._get_chart_data(self.data.stsg1_3)
+        self.assertEqual(len(data_array), 2)
+        np.testing.assert_allclose(data_array[0][:, 1], [3.7, 4.5, 4.1])
+        np.testing.assert_allclose(data_array[1][:, 1], [2.9, 3.2, 3])
+
+    def test_station_page(self):
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT,
+            self.data.sg1.slug,
+            "station",
+            str(self.data.sgs_agios.station.id),
+            "index.html",
+        )
+        self.assertTrue(os.path.exists(filename))
+
+
+@RandomSynopticRoot()
+@override_settings(ENHYDRIS_SYNOPTIC_CHART_PROCESSES=2)
+@skipUnless(sharedseries.is_available(), "Shared memory requires Python 3.8")
+class ParallelChartFailureTestCase(TestCase):
+    # The pool processes are forked while the mocks are active, so they use them
+
+    def setUp(self):
+        self.data = TestData()
+        models.LatestValue.objects.refresh_all()
+        self.original_render = views.render_detached_charts
+
+    def _render(self):
+        run = tasks.Run()
+        render_synoptic_group(self.data.sg1, run=run)
+        self.data.sgs_komboti.refresh_from_db()
+        self.data.sgs_agios.refresh_from_db()
+        return run
+
+    def _render_failing_komboti(self, detached_syntsgs, *args):
+        if any(x.id == self.data.stsg1_1.id for x in detached_syntsgs):
+            raise ValueError("hello")
+        return self.original_render(detached_syntsgs, *args)
+
+    def _render_slow_komboti(self, detached_syntsgs, *args):
+        if any(x.id == self.data.stsg1_1.id for x in detached_syntsgs):
+            time.sleep(2)
+        return self.original_render(detached_syntsgs, *args)
+
+    @mock.patch("enhydris_synoptic.views.render_detached_charts")
+    def test_station_with_failed_charts_is_not_marked_rendered(self, m):
+        m.side_effect = self._render_failing_komboti
+        run = self._render()
+        self.assertEqual(
+            run.station_outcomes[(self.data.sg1.slug, "Komboti")], "failed"
+        )
+        self.assertTrue(self.data.sgs_komboti.has_new_data)
+        self.assertFalse(self.data.sgs_agios.has_new_data)
+
+    @mock.patch("enhydris_synoptic.views.Chart.link_to", side_effect=OSError("hello"))
+    def test_failed_link_fails_only_the_station(self, m):
+        # Render the group twice in the same run, so that the charts are linked the
+        # second time
+        run = self._render()
+        render_synoptic_group(self.data.sg1, run=run)
+        self.assertEqual(
+            run.station_outcomes[(self.data.sg1.slug, "Komboti")], "failed"
+        )
+        self.assertNotIn(self.data.sg1.slug, run.group_outcomes)
+
+    @override_settings(ENHYDRIS_SYNOPTIC_STATION_TIME_BUDGET=0.5)
+    @mock.patch("enhydris_synoptic.views.render_detached_charts")
+    def test_slow_charts_time_out(self, m):
+        m.side_effect = self._render_slow_komboti
+        run = self._render()
+        self.assertEqual(
+            run.station_outcomes[(self.data.sg1.slug, "Komboti")], "timed out"
+        )
+        self.assertTrue(self.data.sgs_komboti.has_new_data)
+
+
+@RandomSynopticRoot()
+@override_settings(ENHYDRIS_SYNOPTIC_CHART_PROCESSES=2)
+class ParallelChartFallbackTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        self.chart = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, "chart", f"{self.data.stsg2_2.id}.png"
+        )
+        views._logged_parallel_fallbacks.clear()
+        self.addCleanup(views._logged_parallel_fallbacks.clear)
+
+    def _render(self):
+        with mock.patch("enhydris_synoptic.views.ProcessPoolExecutor") as m:
+            with self.assertLogs("enhydris_synoptic.views", level="WARNING") as cm:
+                create_static_files()
+        m.assert_not_called()
+        self.assertTrue(os.path.exists(self.chart))
+        return cm.output
+
+    @mock.patch("enhydris_synoptic.sharedseries.is_available", return_value=False)
+    def test_without_shared_memory(self, m):
+        output = self._render()
+        self.assertIn("shared memory requires Python 3.8", output[0])
+
+    @mock.patch("multiprocessing.current_process")
+    def test_in_daemonic_process(self, m):
+        m.return_value.daemon = True
+        output = self._render()
+        self.assertIn("daemonic process", output[0])
+
+    @mock.patch("enhydris_synoptic.sharedseries.is_available", return_value=False)
+    def test_warning_is_logged_once(self, m):
+        self._render()
+        with mock.patch.object(views.logger, "warning") as mock_warning:
+            create_static_files()
+        mock_warning.assert_not_called()
+
+
+@RandomSynopticRoot()
+@override_settings(ENHYDRIS_SYNOPTIC_STREAMING=True)
+class StreamingTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        settings.TEST_MATPLOTLIB = True
+        self.addCleanup(setattr, settings, "TEST_MATPLOTLIB", False)
+        create_static_files()
+
+    def _read(self, *path):
+        with open(os.path.join(settings.ENHYDRIS_SYNOPTIC_ROOT, *path)) as f:
+            return f.read()
+
+    def test_grouped_chart(self):
+        data = self._read("chart", f"{self.data.stsg1_3.id}.dat")
+        data_array = eval(data.replace("array", "np.array"))
+        self.assertEqual(len(data_array), 2)
+        np.testing.assert_allclose(data_array[0][:, 1], [3.7, 4.5, 4.1])
+        np.testing.assert_allclose(data_array[1][:, 1], [2.9, 3.2, 3])
+
+    def test_station_page(self):
+        station_id = str(self.data.sgs_agios.station.id)
+        page = self._read(self.data.sg1.slug, "station", station_id, "index.html")
+        self.assertIn("Άγιος Αθανάσιος", page)
+
+    def test_map_page_has_all_stations(self):
+        page = self._read(self.data.sg1.slug, "index.html")
+        self.assertEqual(page.count("enhydris.mapStations.push"), 3)
+
+    def test_map_page_has_last_values(self):
+        page = self._read(self.data.sg1.slug, "index.html")
+        self.assertIn('"Wind (gust)":', page)
+
+
+@RandomSynopticRoot()
+class FileTestCase(TestCase):
+    def _read(self):
+        with open(os.path.join(settings.ENHYDRIS_SYNOPTIC_ROOT, "hello.txt")) as f:
+            return f.read()
+
+    def test_write(self):
+        size = views.File("hello.txt").write("hello")
+        self.assertEqual(size, 5)
+        self.assertEqual(self._read(), "hello")
+
+    def test_concurrent_writes_use_different_temporary_files(self):
+        file1 = views.File("hello.txt")
+        original_write = file1._write_to_temporary_file
+
+        def write_while_another_writer_writes(s):
+            original_write(s)
+            views.File("hello.txt").write("world")
+
+        file1._write_to_temporary_file = write_while_another_writer_writes
+        file1.write("hello")
+        self.assertEqual(self._read(), "hello")
+
+    def test_no_temporary_files_are_left(self):
+        views.File("hello.txt").write("hello")
+        with self.assertRaises(FileNotFoundError):
+            views.File("world.txt").link("nonexistent.txt")
+        self.assertEqual(os.listdir(settings.ENHYDRIS_SYNOPTIC_ROOT), ["hello.txt"])
+
+
+@RandomSynopticRoot()
+class IdenticalChartsTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        sg2 = mommy.make(
+            models.SynopticGroup,
+            slug="national",
+            fresh_time_limit=dt.timedelta(minutes=60),
+            time_zone=self.data.sg1.time_zone,
+        )
+        sgs2_komboti = mommy.make(
+            models.SynopticGroupStation,
+            synoptic_group=sg2,
+            station=self.data.station_komboti,
+            order=1,
+        )
+        self.stsg_national_rain = mommy.make(
+            models.SynopticTimeseriesGroup,
+            synoptic_group_station=sgs2_komboti,
+            timeseries_group=self.data.tsg_komboti_rain,
+            order=1,
+        )
+        create_static_files()
+
+    def _get_chart_filename(self, syntsg):
+        return os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, "chart", str(syntsg.id) + ".png"
+        )
+
+    def test_identical_chart_is_the_same_file(self):
+        self.assertTrue(
+            os.path.samefile(
+                self._get_chart_filename(self.data.stsg1_1),
+                self._get_chart_filename(self.stsg_national_rain),
+            )
+        )
+
+    def test_different_chart_is_another_file(self):
+        self.assertFalse(
+            os.path.samefile(
+                self._get_chart_filename(self.data.stsg1_1),
+                self._get_chart_filename(self.data.stsg2_1),
+            )
+        )
+
+
+@RandomSynopticRoot()
+class IdenticalChartsAfterFailureTestCase(TestCase):
+    """A chart that failed to render is rendered again rather than linked."""
+
+    def setUp(self):
+        self.data = TestData()
+        models.LatestValue.objects.refresh_all()
+        self.sg2 = mommy.make(
+            models.SynopticGroup,
+            slug="national",
+            fresh_time_limit=dt.timedelta(minutes=60),
+            time_zone=self.data.sg1.time_zone,
+        )
+        sgs2_komboti = mommy.make(
+            models.SynopticGroupStation,
+            synoptic_group=self.sg2,
+            station=self.data.station_komboti,
+            order=1,
+        )
+        self.stsg_national_rain = mommy.make(
+            models.SynopticTimeseriesGroup,
+            synoptic_group_station=sgs2_komboti,
+            timeseries_group=self.data.tsg_komboti_rain,
+            order=1,
+        )
+        self.national_chart = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT,
+            "chart",
+            f"{self.stsg_national_rain.id}.png",
+        )
+
+    def _render(self, failing):
+        run = tasks.Run()
+        with failing:
+            render_synoptic_group(
+                models.SynopticGroup.objects.get(id=self.data.sg1.id), run=run
+            )
+        render_synoptic_group(models.SynopticGroup.objects.get(id=self.sg2.id), run=run)
+        self.assertEqual(
+            run.station_outcomes[(self.data.sg1.slug, "Komboti")], "failed"
+        )
+        self.assertEqual(run.station_outcomes[("national", "Komboti")], "rendered")
+        self.assertTrue(os.path.exists(self.national_chart))
+
+    def test_in_calling_process(self):
+        original_render = views.Chart.render
+        failing_id = self.data.stsg1_1.id
+
+        def render(chart):
+            if chart.current_synoptic_timeseries_group.id == failing_id:
+                raise ValueError("hello")
+            original_render(chart)
+
+        self._render(
+            mock.patch.object(views.Chart, "render", autospec=True, side_effect=render)
+        )
+
+    @override_settings(ENHYDRIS_SYNOPTIC_CHART_PROCESSES=2)
+    @skipUnless(sharedseries.is_available(), "Shared memory requires Python 3.8")
+    def test_in_parallel(self):
+        # The pool processes are forked while the mock is active, so they use it
+        original_render = views.render_detached_charts
+        failing_id = self.data.stsg1_1.id
+
+        def render(detached_syntsgs, *args):
+            if any(x.id == failing_id for x in detached_syntsgs):
+                raise ValueError("hello")
+            return original_render(detached_syntsgs, *args)
+
+        self._render(
+            mock.patch(
+                "enhydris_synoptic.views.render_detached_charts", side_effect=render
+            )
+        )
+
+
+@RandomSynopticRoot()
+class ChartWindowTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.data = TestData()
+        models.ChartWindow.objects.create(
+            synoptic_group=cls.data.sg1, duration=dt.timedelta(days=7)
+        )
+        settings.TEST_MATPLOTLIB = True
+        create_static_files()
+
+    @classmethod
+    def tearDownClass(self):
+        settings.TEST_MATPLOTLIB = False
+        super().tearDownClass()
+
+    def test_chart(self):
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT,
+            "chart",
+            "{}-7d.png".format(self.data.stsg2_1.id),
+        )
+        self.assertGreater(os.stat(filename).st_size, 100)
+
+    def test_chart_data_is_hourly(self):
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT,
+            "chart",
+            "{}-7d.dat".format(self.data.stsg2_1.id),
+        )
+        datastr = open(filename).read()
+        data_array = eval(datastr.replace("array", "np.array"))
+        desired_result = np.array(
+            [
+                [days_since_epoch(2015, 10, 22, 15, 00), 0],
+                [days_since_epoch(2015, 10, 23, 15, 00), 0.1],
+            ]
+        )
+        np.testing.assert_allclose(data_array, desired_result)
+
+    def test_station_page_links_to_chart(self):
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT,
+            self.data.sg1.slug,
+            "station",
+            str(self.data.sgs_agios.station.id),
+            "index.html",
+        )
+        with open(filename) as f:
+            soup = BeautifulSoup(f, "html.parser")
+        chart_url = "../../../chart/{}-7d.png".format(self.data.stsg2_1.id)
+        self.assertIsNotNone(soup.find("img", src=chart_url))
+
+
+@RandomSynopticRoot()
+class RenderDueSynopticGroupsTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        self.filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, self.data.sg1.slug, "index.html"
+        )
+
+    def test_renders_new_group(self):
+        render_due_synoptic_groups()
+        self.assertTrue(os.path.exists(self.filename))
+
+    def test_schedules_next_render(self):
+        self.data.sg1.refresh_interval = dt.timedelta(minutes=10)
+        self.data.sg1.save()
+        render_due_synoptic_groups()
+        self.data.sg1.refresh_from_db()
+        self.assertEqual(
+            self.data.sg1.next_render,
+            self.data.sg1.last_rendered + dt.timedelta(minutes=10),
+        )
+
+    def test_does_not_render_group_that_is_not_due(self):
+        future = dt.datetime.now(dt.timezone.utc) + dt.timedelta(minutes=10)
+        models.SynopticGroup.objects.update(next_render=future)
+        render_due_synoptic_groups()
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_partial_render_does_not_schedule_next_render(self):
+        self.data.sg1.refresh_interval = dt.timedelta(minutes=10)
+        self.data.sg1.save()
+        render_synoptic_group(
+            self.data.sg1, synoptic_group_station_ids=[self.data.sgs_komboti.id]
+        )
+        self.data.sg1.refresh_from_db()
+        self.assertIsNotNone(self.data.sg1.last_rendered)
+        self.assertIsNone(self.data.sg1.next_render)
+        render_due_synoptic_groups()
+        self.assertTrue(os.path.exists(self.filename))
+
+
+@RandomSynopticRoot()
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class GroupLockTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        cache.clear()
+        self.filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, self.data.sg1.slug, "index.html"
+        )
+
+    def test_locked_group_is_not_rendered(self):
+        GroupLock(self.data.sg1.id).acquire()
+        create_static_files()
+        self.assertFalse(os.path.exists(self.filename))
+
+    def test_locked_group_gets_followup(self):
+        GroupLock(self.data.sg1.id).acquire()
+        create_static_files()
+        self.assertTrue(GroupLock(self.data.sg1.id).pop_followup())
+
+    def test_lock_is_released(self):
+        create_static_files()
+        self.assertTrue(GroupLock(self.data.sg1.id).acquire())
+
+    def test_followup_is_rendered_once(self):
+        def render(sgroup, **kwargs):
+            # Two triggers arrive while the first render is running
+            if mock_render.call_count == 1:
+                create_static_files()
+                create_static_files()
+
+        with mock.patch(
+            "enhydris_synoptic.tasks.render_synoptic_group", side_effect=render
+        ) as mock_render:
+            create_static_files()
+        self.assertEqual(mock_render.call_count, 2)
+
+    def test_lock_duration_is_reported(self):
+        run = tasks.Run()
+        tasks.render_synoptic_group_exclusively(self.data.sg1, run=run)
+        self.assertGreater(run.lock_durations[self.data.sg1.slug], 0)
+
+    def _render_with_trigger_before_release(self, then_acquire=False):
+        # A trigger arrives after the last check for follow-ups, just before the lock
+        # is released; if then_acquire is True, another process acquires the lock
+        # as soon as it is released.
+        original_release = GroupLock.release
+        triggered = []
+
+        def release(lock):
+            if not triggered:
+                triggered.append(True)
+                GroupLock(self.data.sg1.id).request_followup()
+            original_release(lock)
+            if then_acquire and len(triggered) == 1:
+                triggered.append(True)
+                GroupLock(self.data.sg1.id).acquire()
+
+        with mock.patch.object(
+            GroupLock, "release", autospec=True, side_effect=release
+        ), mock.patch("enhydris_synoptic.tasks.render_synoptic_group") as mock_render:
+            create_static_files()
+        return mock_render
+
+    def test_followup_requested_before_release_is_rendered(self):
+        mock_render = self._render_with_trigger_before_release()
+        self.assertEqual(mock_render.call_count, 2)
+
+    def test_followup_is_left_to_new_lock_holder(self):
+        mock_render = self._render_with_trigger_before_release(then_acquire=True)
+        self.assertEqual(mock_render.call_count, 1)
+        self.assertTrue(GroupLock(self.data.sg1.id).pop_followup())
+
+    def test_followup_requests_are_merged(self):
+        lock = GroupLock(self.data.sg1.id)
+        lock.request_followup()
+        lock.request_followup()
+        self.assertTrue(lock.pop_followup())
+        self.assertFalse(lock.pop_followup())
+
+    def test_followup_metrics_are_written(self):
+        def render(sgroup, **kwargs):
+            if mock_render.call_count == 1:
+                create_static_files()
+            return render_synoptic_group(sgroup, **kwargs)
+
+        with mock.patch(
+            "enhydris_synoptic.tasks.render_synoptic_group", side_effect=render
+        ) as mock_render:
+            create_static_files()
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, "metrics", "followup.json"
+        )
+        self.assertTrue(os.path.exists(filename))
+
+
+@RandomSynopticRoot()
+class MetricsTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.data = TestData()
+        create_static_files()
+        filename = os.path.join(
+            settings.ENHYDRIS_SYNOPTIC_ROOT, "metrics", "create_static_files.{}"
+        )
+        with open(filename.format("prom")) as f:
+            cls.prometheus_text = f.read()
+        with open(filename.format("json")) as f:
+            cls.summary = json.load(f)
+
+    def test_prometheus_charts_rendered(self):
+        self.assertIn(
+            'enhydris_synoptic_charts_rendered{run="create_static_files"} 7\n',
+            self.prometheus_text,
+        )
+
+    def test_prometheus_group_stage(self):
+        self.assertIn(
+            'enhydris_synoptic_group_stage_seconds{run="create_static_files",'
+            'group="mygroup",stage="station pages"}',
+            self.prometheus_text,
+        )
+
+    def test_prometheus_group_stage_count(self):
+        self.assertIn(
+            'enhydris_synoptic_group_stage_count{run="create_static_files",'
+            'group="mygroup",stage="station pages"} 3\n',
+            self.prometheus_text,
+        )
+
+    def test_json_stages(self):
+        self.assertEqual(self.summary["stages"]["station pages"]["count"], 3)
+
+    def test_json_early_warning_emails_stage(self):
+        self.assertEqual(self.summary["stages"]["early warning emails"]["count"], 1)
+
+    def test_json_counts_queries(self):
+        self.assertGreater(self.summary["counts"]["queries"], 0)
+
+    def test_json_counts_bytes(self):
+        self.assertGreater(
+            self.summary["groups"]["mygroup"]["counts"]["bytes written"], 0
+        )
+
+    def test_json_stations(self):
+        self.assertEqual(self.summary["stations"], {"rendered": 3})
+
+
+@RandomSynopticRoot()
+class RenderSynopticCommandTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        self.stdout = StringIO()
+
+    def _call(self, *args):
+        call_command("render_synoptic", *args, stdout=self.stdout)
+
+    def _exists(self, *path):
+        return os.path.exists(os.path.join(settings.ENHYDRIS_SYNOPTIC_ROOT, *path))
+
+    def _station_page_exists(self, synstation):
+        return self._exists(
+            self.data.sg1.slug, "station", str(synstation.station.id), "index.html"
+        )
+
+    def _chart_exists(self, syntsg):
+        return self._exists("chart", f"{syntsg.id}.png")
+
+    def test_renders_group(self):
+        self._call("--group", "mygroup")
+        self.assertTrue(self._exists("mygroup", "index.html"))
+        self.assertTrue(self._station_page_exists(self.data.sgs_agios))
+        self.assertTrue(self._chart_exists(self.data.stsg2_1))
+
+    def test_timing_report(self):
+        self._call()
+        self.assertIn("station pages", self.stdout.getvalue())
+
+    def test_unknown_group(self):
+        with self.assertRaises(CommandError):
+            self._call("--group", "nonexistent")
+
+    def test_station(self):
+        self._call("--station", str(self.data.station_agios.id))
+        self.assertTrue(self._station_page_exists(self.data.sgs_agios))
+        self.assertFalse(self._station_page_exists(self.data.sgs_komboti))
+
+    def test_unknown_station(self):
+        with self.assertRaisesRegex(CommandError, "9999999"):
+            self._call("--station", str(self.data.station_agios.id), "9999999")
+
+    def test_station_not_in_selected_group(self):
+        sg2 = mommy.make(models.SynopticGroup, slug="national")
+        with self.assertRaises(CommandError):
+            self._call(
+                "--group", sg2.slug, "--station", str(self.data.station_agios.id)
+            )
+
+    def test_pages_only(self):
+        self._call("--pages-only")
+        self.assertTrue(self._station_page_exists(self.data.sgs_agios))
+        self.assertFalse(self._chart_exists(self.data.stsg2_1))
+
+    def test_charts_only(self):
+        self._call("--charts-only")
+        self.assertFalse(self._station_page_exists(self.data.sgs_agios))
+        self.assertTrue(self._chart_exists(self.data.stsg2_1))
+
+    def test_charts_only_does_not_mark_stations_rendered(self):
+        self._call("--charts-only")
+        self.data.sgs_agios.refresh_from_db()
+        self.assertIsNone(self.data.sgs_agios.last_rendered_date)
+
+    def test_dry_run(self):
+        self._call("--dry-run")
+        self.assertFalse(self._exists("mygroup", "index.html"))
+        self.assertIn("Άγιος Αθανάσιος: 3 charts (new data)", self.stdout.getvalue())
+
+    def test_profile(self):
+        self._call("--profile")
+        self.assertIn("cumulative", self.stdout.getvalue())
+
+
 @RandomSynopticRoot()
 class StationReportTestCase(TestCase):
     @classmethod
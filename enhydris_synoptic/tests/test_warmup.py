@@ -0,0 +1,46 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from enhydris_synoptic import tasks, views, warmup
+
+
+class WarmUpTestCase(SimpleTestCase):
+    def test_template_names(self):
+        self.assertIn("enhydris-synoptic/group.html", warmup.get_template_names())
+
+    def test_warm_up(self):
+        with self.assertLogs("enhydris_synoptic.warmup", level="INFO"):
+            warmup.warm_up()
+
+    def test_renders_with_chart(self):
+        with mock.patch.object(
+            views.Chart, "render_to_bytes", autospec=True, return_value=b""
+        ) as m:
+            warmup.render_throwaway_chart()
+        self.assertEqual(m.call_count, 2)
+
+    def test_does_not_write_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with override_settings(ENHYDRIS_SYNOPTIC_ROOT=tmpdir):
+                warmup.render_throwaway_chart()
+            self.assertEqual(os.listdir(tmpdir), [])
+
+
+@mock.patch("enhydris_synoptic.warmup.warm_up")
+class WarmUpWorkerProcessTestCase(SimpleTestCase):
+    def test_warms_up_by_default(self, m):
+        tasks.warm_up_worker_process()
+        m.assert_called_once_with()
+
+    @override_settings(ENHYDRIS_SYNOPTIC_WARM_UP=False)
+    def test_setting(self, m):
+        tasks.warm_up_worker_process()
+        m.assert_not_called()
+
+    def test_failure_is_logged(self, m):
+        m.side_effect = RuntimeError("hello")
+        with self.assertLogs("enhydris_synoptic.tasks", level="ERROR"):
+            tasks.warm_up_worker_process()
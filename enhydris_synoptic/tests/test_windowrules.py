@@ -0,0 +1,161 @@
+import datetime as dt
+import math
+from unittest import mock
+
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+
+import numpy as np
+
+from enhydris_synoptic import models
+from enhydris_synoptic.records import SeriesArrays
+from enhydris_synoptic.tasks import create_static_files
+from enhydris_synoptic.windowrules import RuleCheck, evaluate
+
+from .data import TestData
+from .test_tasks import RandomSynopticRoot
+
+
+def make_check(kind, threshold, minutes, values):
+    """Return a RuleCheck for values every ten minutes ending at 2015-10-22 15:20."""
+    end_date = dt.datetime(2015, 10, 22, 15, 20)
+    timestamps = [
+        end_date - dt.timedelta(minutes=10 * i) for i in reversed(range(len(values)))
+    ]
+    asyntsg = mock.Mock()
+    asyntsg.synoptic_group_station.last_common_date = end_date
+    asyntsg.data = SeriesArrays(
+        np.array(timestamps, dtype="datetime64[ns]"), np.array(values, dtype=float)
+    )
+    rule = models.WarningRule(
+        kind=kind, threshold=threshold, duration=dt.timedelta(minutes=minutes)
+    )
+    return RuleCheck(rule, asyntsg)
+
+
+class EvaluateTestCase(TestCase):
+    def _evaluate(self, *args):
+        triggered, measured = evaluate([make_check(*args)])
+        return triggered[0], measured[0]
+
+    def test_above_for_whole_duration(self):
+        self.assertEqual(self._evaluate("above", 4, 20, [1, 5, 6]), (True, 6))
+
+    def test_above_for_part_of_duration(self):
+        self.assertFalse(self._evaluate("above", 4, 20, [5, 3, 6])[0])
+
+    def test_above_with_data_not_covering_duration(self):
+        self.assertFalse(self._evaluate("above", 4, 30, [5, 5, 6])[0])
+
+    def test_below(self):
+        self.assertTrue(self._evaluate("below", 4, 10, [5, 5, 3])[0])
+
+    def test_rate(self):
+        self.assertEqual(self._evaluate("rate", 2, 20, [9, 8, 6]), (True, -3))
+
+    def test_rate_within_threshold(self):
+        self.assertEqual(self._evaluate("rate", 2, 10, [9, 8, 6]), (False, -2))
+
+    def test_total(self):
+        # The value at the start of the window is not included in the total
+        self.assertEqual(self._evaluate("total", 2.5, 20, [7, 1, 2]), (True, 3))
+
+    def test_total_ignores_nulls(self):
+        self.assertEqual(self._evaluate("total", 2.5, 20, [7, np.nan, 2]), (False, 2))
+
+    def test_no_data(self):
+        triggered, measured = self._evaluate("above", 4, 20, [])
+        self.assertFalse(triggered)
+        self.assertTrue(math.isnan(measured))
+
+    def test_many_checks(self):
+        checks = [
+            make_check("above", 4, 20, [1, 5, 6]),
+            make_check("total", 10, 20, []),
+            make_check("rate", 2, 20, [9, 8, 6]),
+            make_check("total", 2.5, 20, [7, 1, 2]),
+        ]
+        triggered, measured = evaluate(checks)
+        np.testing.assert_equal(triggered, [True, False, True, True])
+        np.testing.assert_equal(measured, [6, np.nan, -3, 3])
+
+    def test_check_copies_window(self):
+        check = make_check("above", 4, 10, [1, 5, 6])
+        check_values = check.values
+        self.assertIsNone(check_values.base)
+        np.testing.assert_equal(check_values, [5, 6])
+
+
+class WarningRuleCleanTestCase(TestCase):
+    def _clean(self, kind, duration):
+        models.WarningRule(kind=kind, threshold=1, duration=duration).clean()
+
+    def test_negative_duration(self):
+        with self.assertRaises(ValidationError):
+            self._clean("above", dt.timedelta(hours=-1))
+
+    def test_duration_longer_than_a_day(self):
+        with self.assertRaises(ValidationError):
+            self._clean("total", dt.timedelta(hours=25))
+
+    def test_total_of_a_day(self):
+        self._clean("total", dt.timedelta(days=1))
+
+    def test_rate_of_a_day(self):
+        with self.assertRaises(ValidationError):
+            self._clean("rate", dt.timedelta(days=1))
+
+
+@RandomSynopticRoot()
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    DEFAULT_FROM_EMAIL="noreply@enhydris.com",
+)
+class WarningRuleEmailTestCase(TestCase):
+    def setUp(self):
+        self.data = TestData()
+        models.EarlyWarningEmail.objects.create(
+            synoptic_group=self.data.sg1, email="someone@blackhole.com"
+        )
+        # Only the rules are checked
+        models.SynopticTimeseriesGroup.objects.update(low_limit=None, high_limit=None)
+        self.rule = models.WarningRule.objects.create(
+            synoptic_timeseries_group=self.data.stsg2_2,
+            kind="rate",
+            threshold=1,
+            duration=dt.timedelta(minutes=20),
+        )
+
+    def test_payload(self):
+        create_static_files()
+        self.assertEqual(
+            mail.outbox[0].message().get_payload(),
+            "Άγιος Αθανάσιος 2015-10-23 15:20 Air temperature -1.5 "
+            "(changed by more than 1.0 in 0:20:00)\n",
+        )
+
+    def test_state(self):
+        create_static_files()
+        self.rule.refresh_from_db()
+        self.assertTrue(self.rule.in_alarm)
+
+    def test_not_sent_again_while_in_alarm(self):
+        create_static_files()
+        mail.outbox = []
+        create_static_files()
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_back_to_normal(self):
+        create_static_files()
+        mail.outbox = []
+        self.rule.threshold = 2
+        self.rule.save()
+        create_static_files()
+        self.assertIn("(back to normal)", mail.outbox[0].message().get_payload())
+
+    def test_not_triggered(self):
+        self.rule.threshold = 2
+        self.rule.save()
+        create_static_files()
+        self.assertEqual(len(mail.outbox), 0)
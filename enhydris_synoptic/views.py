@@ -5,30 +5,55 @@ uses celery to render its output to static files. So this file contains function
 to do such offline rendering. It doesn't know about requests and responses, and it
 doesn't know about HTTP. But logically it's the "views" part of a Django app.
 """
+import hashlib
+import logging
 import math
+import multiprocessing
 import os
+import shutil
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from functools import lru_cache
 from io import BytesIO
 
 from django.conf import settings
 from django.contrib.gis.db.models import Extent
+from django.db import connection
 from django.http import HttpRequest
 from django.template.loader import render_to_string
 
-import matplotlib
+import numpy as np
 
-# We have to execute matplotlib.use() after the matplotlib import and before the rest of
-# the matplotlib imports, and isort doesn't like that. I'm afraid we need to tell isort
-# to just skip this file.
-# isort:skip_file
-matplotlib.use("AGG")  # NOQA
+import enhydris.context_processors
+from enhydris.views_common import ensure_extent_is_large_enough
 
-import enhydris.context_processors  # NOQA
-import matplotlib.pyplot as plt  # NOQA
-import pandas.plotting  # NOQA
-from enhydris.views_common import ensure_extent_is_large_enough  # NOQA
-from matplotlib.dates import DateFormatter, DayLocator, HourLocator  # NOQA
+from . import chartworker, earlywarnings, profiling, runs, scheduler, sharedseries
+from .models import ChartWindow
 
-pandas.plotting.register_matplotlib_converters()
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def load_chart_engine():
+    """Load and configure matplotlib, and return pyplot.
+
+    Importing matplotlib and pandas.plotting takes a while, and this module is imported
+    by every process that loads the celery tasks (including the web server), so the
+    chart engine is only loaded when it is first needed.
+    """
+    import matplotlib
+
+    matplotlib.use("AGG")
+    import matplotlib.pyplot as plt
+    import pandas.plotting
+
+    pandas.plotting.register_matplotlib_converters()
+    plt.rcParams.update({"font.size": 7})
+    return plt
 
 
 class File:
@@ -38,7 +63,9 @@ class File:
     resulting output file name is the concatenation of ENHYDRIS_SYNOPTIC_ROOT plus
     relative_filename. Directories are automatically created. The file is written
     atomically; so if many processes attempt to write to it at the same time, only one
-    will win (i.e. the file will not be corrupt).
+    will win (i.e. the file will not be corrupt). Each write goes through a temporary
+    file with a unique name, so concurrent writers don't interfere with each other.
+    write() returns the size of the file.
     """
 
     def __init__(self, relative_filename):
@@ -49,29 +76,77 @@ class File:
 
     def write(self, s):
         self._ensure_directory_exists()
-        self._write_to_temporary_file(s)
-        self._atomically_replace_final_file()
+        with self._temporary_file():
+            self._write_to_temporary_file(s)
+            self._atomically_replace_final_file()
+        return os.path.getsize(self.full_pathname)
 
     def _ensure_directory_exists(self):
         dirname = os.path.dirname(self.full_pathname)
         if not os.path.exists(dirname):
             os.makedirs(dirname)
 
+    @contextmanager
+    def _temporary_file(self):
+        # Not tempfile.mkstemp(), because the file must have the permissions set by
+        # the umask, like any other file we write, so that the web server can read it.
+        self.temporary_full_pathname = "{}.{}.tmp".format(
+            self.full_pathname, uuid.uuid4().hex
+        )
+        try:
+            yield
+        except BaseException:
+            if os.path.lexists(self.temporary_full_pathname):
+                os.remove(self.temporary_full_pathname)
+            raise
+
     def _write_to_temporary_file(self, s):
-        self.temporary_full_pathname = self.full_pathname + ".1"
-        mode = "wb" if isinstance(s, bytes) else "w"
+        mode = "xb" if isinstance(s, bytes) else "x"
         encoding = None if isinstance(s, bytes) else "utf-8"
         with open(self.temporary_full_pathname, mode, encoding=encoding) as f:
             f.write(s)
 
+    def link(self, relative_source_filename):
+        """Make the file a hard link to another file (or a copy, if linking fails).
+
+        The source is also relative to ENHYDRIS_SYNOPTIC_ROOT. Since write() never
+        modifies files in place, the link won't change if the source is rewritten.
+        """
+        self._ensure_directory_exists()
+        source = os.path.join(settings.ENHYDRIS_SYNOPTIC_ROOT, relative_source_filename)
+        with self._temporary_file():
+            try:
+                os.link(source, self.temporary_full_pathname)
+            except OSError:
+                shutil.copyfile(source, self.temporary_full_pathname)
+            self._atomically_replace_final_file()
+
     def _atomically_replace_final_file(self):
         os.replace(self.temporary_full_pathname, self.full_pathname)
 
 
 def render_synoptic_station(synstation):
-    _check_for_null_values(synstation)
-    _render_station_page(synstation)
-    _render_station_charts(synstation)
+    run = runs.get_run(synstation.synoptic_group)
+    with run.timer("data"):
+        _load_station_data(synstation, run)
+    if run.pages:
+        with run.timer("station pages"):
+            _render_station_page(synstation)
+    if run.charts:
+        with run.timer("charts"):
+            _render_station_charts(synstation)
+
+
+def _load_station_data(synstation, run):
+    # The data is loaded lazily and cached, so loading it here is not necessary, but
+    # it lets the run report the time spent reading data separately.
+    windows = (
+        list(synstation.synoptic_group.chartwindow_set.all()) if run.charts else []
+    )
+    for syntsg in synstation.synoptic_timeseries_groups:
+        syntsg.data
+        for window in windows:
+            syntsg.get_window_arrays(window)
 
 
 def _check_for_null_values(synstation):
@@ -80,34 +155,151 @@ def _check_for_null_values(synstation):
 
 
 def _render_station_page(synstation):
-    output = render_to_string(
-        "enhydris-synoptic/groupstation.html", context={"object": synstation}
-    )
+    _check_for_null_values(synstation)
+    run = runs.get_run(synstation.synoptic_group)
+    with run.timer("templates"):
+        output = render_to_string(
+            "enhydris-synoptic/groupstation.html", context={"object": synstation}
+        )
     filename = os.path.join(
         synstation.synoptic_group.slug,
         "station",
         str(synstation.station.id),
         "index.html",
     )
-    File(filename).write(output)
+    _write_page(run, filename, output)
+
+
+def _write_page(run, filename, output):
+    with run.timer("writes"):
+        size = File(filename).write(output)
+    run.count("bytes written", size)
 
 
 def _render_station_charts(synstation):
-    for t in synstation.synoptic_timeseries_groups:
-        Chart(t, synstation.synoptic_timeseries_groups).render()
+    run = runs.get_run(synstation.synoptic_group)
+    windows = list(synstation.synoptic_group.chartwindow_set.all())
+    rendered_charts = _get_rendered_charts(synstation.synoptic_group)
+    use_worker = chartworker.is_enabled()
+    charts_to_render = []
+    fingerprints = {}
+    for chart in _get_station_charts(synstation, windows):
+        fingerprint = chart.get_fingerprint()
+        if fingerprint in rendered_charts:
+            chart.link_to(rendered_charts[fingerprint])
+            run.count("charts linked")
+            continue
+        if use_worker:
+            window_id = chart.window and chart.window.id
+            charts_to_render.append(
+                (chart.current_synoptic_timeseries_group.id, window_id)
+            )
+            fingerprints[fingerprint] = chart.filename
+        else:
+            with run.timer("chart render"):
+                chart.render()
+            _record_chart_stats(run, chart.get_stats())
+            rendered_charts[fingerprint] = chart.filename
+    if charts_to_render:
+        _render_charts_in_worker(synstation, windows, charts_to_render)
+        rendered_charts.update(fingerprints)
+
+
+def _render_charts_in_worker(synstation, windows, charts_to_render):
+    run = synstation.synoptic_group.render_run
+    arrays = {}
+    detached_syntsgs = _get_detached_syntsgs(synstation, windows, arrays)
+    detached_windows = [ChartWindow(id=w.id, duration=w.duration) for w in windows]
+    stats = chartworker.get_worker().render(
+        detached_syntsgs, arrays, charts_to_render, detached_windows
+    )
+    run.add_time("chart render", stats["render_seconds"], stats["charts"])
+    _record_chart_stats(run, stats)
 
 
-def render_synoptic_group(synoptic_group):
-    _render_only_group(synoptic_group)
-    _render_group_stations(synoptic_group)
-    synoptic_group.send_early_warning_emails()
+def _record_chart_stats(run, stats):
+    run.add_time("writes", stats["write_seconds"], count=stats["charts"])
+    run.count("charts rendered", stats["charts"])
+    run.count("bytes written", stats["bytes"])
 
 
-def _render_only_group(synoptic_group):
-    context = {"object": synoptic_group, **_get_map_context(synoptic_group)}
-    output = render_to_string("enhydris-synoptic/group.html", context=context)
+def _get_station_charts(synstation, windows):
+    syntsgs = synstation.synoptic_timeseries_groups
+    for syntsg in syntsgs:
+        for window in [None] + windows:
+            yield Chart(syntsg, syntsgs, window=window)
+
+
+def _get_rendered_charts(synoptic_group):
+    """Return a dictionary that maps chart fingerprints to chart filenames.
+
+    A chart depends only on its data and settings, so if the same chart is needed
+    again (usually the same station in another synoptic group), the file already
+    rendered in the same run is linked instead of rendering it again. A chart is added
+    to the dictionary only after it has been rendered successfully.
+    """
+    run = getattr(synoptic_group, "render_run", None)
+    return {} if run is None else run.rendered_charts
+
+
+def render_synoptic_group(synoptic_group, run=None, synoptic_group_station_ids=None):
+    """Render the map page of a synoptic group and the pages of its stations.
+
+    If synoptic_group_station_ids is specified, only these stations are rendered
+    (the map page is always rendered). The stations are rendered by the scheduler,
+    which records in the run what happened to each of them.
+    """
+    # A run created here is finished here; otherwise the caller finishes it (and
+    # sends its emails)
+    is_own_run = run is None
+    synoptic_group.render_run = run = run or runs.Run()
+    run.current_group = synoptic_group.slug
+    try:
+        with profiling.profile(synoptic_group, run):
+            with connection.execute_wrapper(run.count_query):
+                _render_synoptic_group(synoptic_group, run, synoptic_group_station_ids)
+    finally:
+        run.current_group = None
+        if is_own_run:
+            with run.timer("early warning emails"):
+                earlywarnings.send_messages(run.outbox)
+
+
+def _render_synoptic_group(synoptic_group, run, synoptic_group_station_ids):
+    if run.streaming:
+        synstations = _render_synoptic_group_streaming(
+            synoptic_group, synoptic_group_station_ids
+        )
+    else:
+        if run.pages:
+            with run.timer("map pages"):
+                _render_only_group(synoptic_group)
+        synstations = _render_group_stations(synoptic_group, synoptic_group_station_ids)
+    if earlywarnings.in_render():
+        with run.timer("early warnings"):
+            message = synoptic_group.get_early_warning_message()
+        run.count("early warnings", len(getattr(synoptic_group, "early_warnings", {})))
+        if message is not None:
+            run.outbox.append(message)
+    if synoptic_group_station_ids is None and run.pages and run.charts:
+        synoptic_group.mark_rendered(synstations)
+    else:
+        synoptic_group.mark_rendered(complete=False)
+
+
+def _render_only_group(synoptic_group, synstations=None):
+    run = synoptic_group.render_run
+    if synstations is None:
+        synstations = synoptic_group.synopticgroupstation_set.all()
+    context = {
+        "object": synoptic_group,
+        "synoptic_group_stations": synstations,
+        **_get_map_context(synoptic_group),
+    }
+    with run.timer("templates"):
+        output = render_to_string("enhydris-synoptic/group.html", context=context)
     filename = os.path.join(synoptic_group.slug, "index.html")
-    File(filename).write(output)
+    _write_page(run, filename, output)
 
 
 def _get_map_context(sgroup):
@@ -125,19 +317,344 @@ def _get_bounding_box(sgroup):
     return extent
 
 
-def _render_group_stations(synoptic_group):
-    for synstation in synoptic_group.synopticgroupstation_set.all():
+def _render_group_stations(synoptic_group, synoptic_group_station_ids=None):
+    """Render the stations and return them (whether they succeeded or not)."""
+    synstations = synoptic_group.synopticgroupstation_set.all()
+    if synoptic_group_station_ids is not None:
+        synstations = synstations.filter(id__in=synoptic_group_station_ids)
+    synstations = list(synstations)
+    run = synoptic_group.render_run
+    processes = run.chart_processes
+    if processes <= 1 or not run.charts or not _can_render_charts_in_parallel():
+        scheduler.render_stations(synstations, render_synoptic_station, run)
+        return synstations
+    # The stations are marked rendered after their charts have been rendered
+    rendered = scheduler.render_stations(
+        synstations, _render_page_only, run, mark_rendered=False
+    )
+    _render_charts_in_parallel(synoptic_group, rendered, processes)
+    return synstations
+
+
+_logged_parallel_fallbacks = set()
+
+
+def _can_render_charts_in_parallel():
+    if not sharedseries.is_available():
+        reason = "shared memory requires Python 3.8 or later"
+    elif multiprocessing.current_process().daemon:
+        reason = (
+            "this is a daemonic process (such as a celery prefork worker), which "
+            "can't have child processes"
+        )
+    else:
+        return True
+    if reason not in _logged_parallel_fallbacks:
+        _logged_parallel_fallbacks.add(reason)
+        logger.warning(
+            "ENHYDRIS_SYNOPTIC_CHART_PROCESSES is ignored and charts are rendered in "
+            "the calling process, because %s",
+            reason,
+        )
+    return False
+
+
+def _render_synoptic_group_streaming(synoptic_group, synoptic_group_station_ids):
+    # The data of each station is freed as soon as the station has been rendered, and
+    # the map page is rendered last, from what is left (the latest values), so the
+    # memory needed depends on the largest station rather than on the whole group.
+    # Charts are rendered in the calling process (ENHYDRIS_SYNOPTIC_CHART_PROCESSES is
+    # ignored), since the parallel renderer needs the data of all stations at once.
+    run = synoptic_group.render_run
+    synstations = list(synoptic_group.synopticgroupstation_set.all())
+    selected = synstations
+    if synoptic_group_station_ids is not None:
+        selected = [x for x in synstations if x.id in synoptic_group_station_ids]
+    rendered = scheduler.render_stations(selected, _render_station_and_free_data, run)
+    if not run.pages:
+        return selected
+    rendered_ids = {x.id for x in rendered}
+    with run.timer("map pages"):
+        for synstation in synstations:
+            if synstation.id not in rendered_ids:
+                # Not rendered (or rendering failed midway), so determine its latest
+                # values from scratch
+                vars(synstation).pop("_synoptic_timeseries_groups", None)
+                synstation.synoptic_timeseries_groups
+                synstation.free_data()
+        _render_only_group(synoptic_group, synstations)
+    return selected
+
+
+def _render_station_and_free_data(synstation):
+    try:
         render_synoptic_station(synstation)
+    finally:
+        synstation.free_data()
+
+
+def _render_page_only(synstation):
+    run = synstation.synoptic_group.render_run
+    if run.pages:
+        with run.timer("station pages"):
+            _render_station_page(synstation)
+
+
+def _render_charts_in_parallel(synoptic_group, synstations, processes):
+    # The data of all stations goes in a single shared memory block; each worker
+    # process receives only the (small) chart specifications of a station and reads
+    # the data from the block. Charts identical to ones already rendered (or to be
+    # rendered by another job) are not sent to the workers; they are linked when the
+    # workers finish, provided that the job that rendered them succeeded.
+    run = synoptic_group.render_run
+    windows = list(synoptic_group.chartwindow_set.all())
+    detached_windows = [ChartWindow(id=w.id, duration=w.duration) for w in windows]
+    rendered_charts = _get_rendered_charts(synoptic_group)
+    arrays = {}
+    jobs = []
+    queued = set()
+    for synstation in synstations:
+        try:
+            with run.timer("data"):
+                detached_syntsgs = _get_detached_syntsgs(synstation, windows, arrays)
+        except Exception:
+            logger.exception("Failed to read the data of station %s", synstation)
+            run.record_station(synstation, "failed")
+            continue
+        charts_to_render = []
+        fingerprints = {}
+        links = []
+        for chart in _get_station_charts(synstation, windows):
+            fingerprint = chart.get_fingerprint()
+            if fingerprint in rendered_charts or fingerprint in queued:
+                links.append((chart, fingerprint))
+                continue
+            queued.add(fingerprint)
+            fingerprints[fingerprint] = chart.filename
+            window_id = chart.window and chart.window.id
+            charts_to_render.append(
+                (chart.current_synoptic_timeseries_group.id, window_id)
+            )
+        jobs.append(
+            _ChartJob(
+                synstation, detached_syntsgs, charts_to_render, fingerprints, links
+            )
+        )
+    with run.timer("charts"):
+        succeeded = _run_chart_jobs(run, jobs, arrays, detached_windows, processes)
+        for job in succeeded:
+            rendered_charts.update(job.fingerprints)
+        for job in succeeded:
+            if _link_charts(run, job, rendered_charts) and run.pages:
+                job.synstation.mark_rendered()
+
+
+_ChartJob = namedtuple(
+    "_ChartJob", "synstation detached_syntsgs charts_to_render fingerprints links"
+)
+
+
+def _link_charts(run, job, rendered_charts):
+    """Link the charts of the job that are identical to rendered ones.
+
+    Return True on success; otherwise record the station as failed and return False.
+    """
+    for chart, fingerprint in job.links:
+        if fingerprint not in rendered_charts:
+            logger.error(
+                "Chart %s of station %s can't be linked, because the chart it is "
+                "identical to was not rendered",
+                chart.filename,
+                job.synstation,
+            )
+            run.record_station(job.synstation, "failed")
+            return False
+        try:
+            chart.link_to(rendered_charts[fingerprint])
+        except Exception:
+            logger.exception(
+                "Failed to link chart %s of station %s", chart.filename, job.synstation
+            )
+            run.record_station(job.synstation, "failed")
+            return False
+        run.count("charts linked")
+    return True
+
+
+def _run_chart_jobs(run, jobs, arrays, detached_windows, processes):
+    """Render the charts of the jobs and return the jobs that succeeded."""
+    succeeded = []
+    with sharedseries.SharedSeriesBlock(arrays) as block:
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [
+                executor.submit(
+                    _render_charts_from_block,
+                    block.handle,
+                    job.detached_syntsgs,
+                    job.charts_to_render,
+                    detached_windows,
+                )
+                for job in jobs
+            ]
+            for job, future in zip(jobs, futures):
+                # A job that has already started can't be stopped, so the pool still
+                # waits for it when it shuts down, but its charts are not used.
+                if run.is_out_of_time():
+                    future.cancel()
+                    run.record_station(job.synstation, "skipped")
+                    continue
+                try:
+                    stats = future.result(timeout=scheduler.get_station_time_limit(run))
+                except FutureTimeoutError:
+                    future.cancel()
+                    logger.warning(
+                        "Charts of station %s took too long; skipped", job.synstation
+                    )
+                    run.record_station(job.synstation, "timed out")
+                    continue
+                except Exception:
+                    logger.exception("Failed to render charts of %s", job.synstation)
+                    run.record_station(job.synstation, "failed")
+                    continue
+                run.add_time("chart render", stats["render_seconds"], stats["charts"])
+                _record_chart_stats(run, stats)
+                succeeded.append(job)
+    return succeeded
+
+
+def _get_detached_syntsgs(synstation, windows, arrays):
+    """Put the data of the station in "arrays" and return its detached syntsgs."""
+    result = []
+    for syntsg in synstation.synoptic_timeseries_groups:
+        arrays[syntsg.id] = syntsg.data
+        for window in windows:
+            arrays[(syntsg.id, window.id)] = syntsg.get_window_arrays(window)
+        result.append(DetachedSynopticTimeseriesGroup(syntsg))
+    return result
+
+
+def _render_charts_from_block(handle, detached_syntsgs, charts_to_render, windows):
+    """Render charts in a worker process and return their combined statistics."""
+    with sharedseries.attach(handle) as arrays:
+        stats = render_detached_charts(
+            detached_syntsgs, arrays, charts_to_render, windows
+        )
+        for syntsg in detached_syntsgs:
+            syntsg.detach()
+    return stats
+
+
+def render_detached_charts(detached_syntsgs, arrays, charts_to_render, windows):
+    """Render charts of detached syntsgs and return their combined statistics.
+
+    "arrays" is a dictionary like the one filled by _get_detached_syntsgs();
+    "charts_to_render" is a list of (syntsg id, window id or None) tuples.
+    """
+    syntsgs_by_id = {x.id: x for x in detached_syntsgs}
+    windows_by_id = {w.id: w for w in windows}
+    windows_by_id[None] = None
+    stats = {"charts": 0, "bytes": 0, "write_seconds": 0.0, "render_seconds": 0.0}
+    for syntsg in detached_syntsgs:
+        syntsg.attach(arrays, windows)
+    for syntsg_id, window_id in charts_to_render:
+        syntsg = syntsgs_by_id[syntsg_id]
+        window = windows_by_id[window_id]
+        chart = Chart(syntsg, detached_syntsgs, window=window)
+        start = time.perf_counter()
+        chart.render()
+        stats["render_seconds"] += time.perf_counter() - start
+        for key, value in chart.get_stats().items():
+            stats[key] += value
+    return stats
+
+
+class DetachedSynopticTimeseriesGroup:
+    """What Chart needs from a SynopticTimeseriesGroup, without the data.
+
+    Model instances carry their related objects (and these carry their data) when
+    pickled, so we send these lightweight objects to chart worker processes instead.
+    The data is attached afterwards from a sharedseries block.
+    """
+
+    def __init__(self, syntsg):
+        self.id = syntsg.id
+        self.group_with_id = syntsg.group_with_id
+        self.subtitle = syntsg.get_subtitle()
+        self.default_chart_min = syntsg.default_chart_min
+        self.default_chart_max = syntsg.default_chart_max
+
+    def get_subtitle(self):
+        return self.subtitle
+
+    def attach(self, arrays, windows):
+        self.data = arrays[self.id]
+        self.window_arrays = {w.id: arrays[(self.id, w.id)] for w in windows}
+
+    def detach(self):
+        del self.data
+        del self.window_arrays
+
+    def get_window_arrays(self, window):
+        return self.window_arrays[window.id]
 
 
 class Chart:
-    def __init__(self, current_syn_timeseries_group, all_synoptic_timeseries_groups):
+    """Chart of a synoptic timeseries group (and those groupped with it).
+
+    If "window" (a ChartWindow) is not specified, the chart shows the last 24 hours
+    and is stored in "chart/{id}.png"; otherwise it shows the aggregated data of the
+    window and is stored in "chart/{id}-{window.slug}.png".
+    """
+
+    def __init__(
+        self, current_syn_timeseries_group, all_synoptic_timeseries_groups, window=None
+    ):
         self.current_synoptic_timeseries_group = current_syn_timeseries_group
         self.all_synoptic_timeseries_groups = all_synoptic_timeseries_groups
+        self.window = window
+        self.filename = self._get_filename("png")
+
+    def get_fingerprint(self):
+        """Return a hash of everything that affects the chart.
+
+        Two charts with the same fingerprint are identical, even if they are for
+        different synoptic timeseries groups.
+        """
+        self._prepare()
+        current = self.current_synoptic_timeseries_group
+        fingerprint = hashlib.sha1()
+        fingerprint.update(
+            repr(
+                (
+                    self.window and self.window.duration,
+                    current.default_chart_min,
+                    current.default_chart_max,
+                    [x.get_subtitle() for x in self._synoptic_timeseries_groups],
+                )
+            ).encode()
+        )
+        for synts in self._synoptic_timeseries_groups:
+            data = self._get_data(synts)
+            fingerprint.update(data.timestamps.tobytes())
+            fingerprint.update(data.values.tobytes())
+        return fingerprint.hexdigest()
+
+    def link_to(self, filename):
+        """Make this chart's file a link to the file of an identical chart."""
+        File(self.filename).link(filename)
+        if getattr(settings, "TEST_MATPLOTLIB", False):
+            File(self._get_filename("dat")).link(filename[: -len("png")] + "dat")
 
     def render(self):
-        self._get_all_groupped_timeseries_groups()
-        self._reorder_groupped_timeseries_groups()
+        content = self.render_to_bytes()
+        start = time.perf_counter()
+        self.bytes_written = File(self.filename).write(content)
+        self.write_seconds = time.perf_counter() - start
+        self._write_data_to_file_for_unit_testing()
+
+    def render_to_bytes(self):
+        """Draw the chart and return it as PNG, without writing it to a file."""
+        self._prepare()
         self._setup_plot()
         self._draw_lines()
         if len(self.xdata):
@@ -145,36 +662,43 @@ class Chart:
             self._fill()
             self._set_x_ticks_and_labels()
             self._set_gridlines_and_legend()
-        self._create_and_save_plot()
-        self._write_data_to_file_for_unit_testing()
+        f = BytesIO()
+        self.fig.savefig(f)
+        load_chart_engine().close(self.fig)  # Release some memory
+        return f.getvalue()
+
+    def _prepare(self):
+        if not hasattr(self, "_synoptic_timeseries_groups"):
+            self._get_all_groupped_timeseries_groups()
+            self._reorder_groupped_timeseries_groups()
 
     def _get_all_groupped_timeseries_groups(self):
         self._synoptic_timeseries_groups = [
             x
             for x in self.all_synoptic_timeseries_groups
-            if (x.id == self.current_synoptic_timeseries_group.id)
-            or (
-                x.group_with
-                and x.group_with.id == self.current_synoptic_timeseries_group.id
-            )
+            if self.current_synoptic_timeseries_group.id in (x.id, x.group_with_id)
         ]
 
+    def _get_data(self, synts):
+        if self.window is None:
+            return synts.data
+        return synts.get_window_arrays(self.window)
+
     def _reorder_groupped_timeseries_groups(self):
         self._synoptic_timeseries_groups.sort(
-            key=lambda x: float(x.data.value.sum()), reverse=True
+            key=lambda x: float(np.nansum(self._get_data(x).values)), reverse=True
         )
 
     def _setup_plot(self):
-        self.fig = plt.figure()
+        self.fig = load_chart_engine().figure()
         self.fig.set_dpi(100)
         self.fig.set_size_inches(3.2, 2)
         self.fig.subplots_adjust(left=0.10, right=0.99, bottom=0.15, top=0.97)
-        matplotlib.rcParams.update({"font.size": 7})
         self.ax = self.fig.add_subplot(1, 1, 1)
 
     def _draw_lines(self):
         for i, s in enumerate(self._synoptic_timeseries_groups):
-            if len(s.data) <= 1:
+            if len(self._get_data(s)) <= 1:
                 self._set_chart_empty()
             else:
                 self._plot_line(i, s)
@@ -190,8 +714,9 @@ class Chart:
         # We use matplotlib's plot() instead of pandas's wrapper, because otherwise
         # there is trouble modifying the x axis labels (see
         # http://stackoverflow.com/questions/12945971/).
-        self.xdata = synts.data.index.to_pydatetime()
-        self.ydata = synts.data["value"]
+        data = self._get_data(synts)
+        self.xdata = data.timestamps
+        self.ydata = data.values
         self.ax.plot(
             self.xdata, self.ydata, color=self._get_color(i), label=synts.get_subtitle()
         )
@@ -213,6 +738,11 @@ class Chart:
         self.ax.fill_between(self.xdata, self.gydata, self.ymin, color="#ffff00")
 
     def _set_x_ticks_and_labels(self):
+        from matplotlib.dates import DateFormatter, DayLocator, HourLocator
+
+        if self.window is not None:
+            self._set_x_ticks_and_labels_for_window()
+            return
         self.ax.xaxis.set_minor_locator(HourLocator(byhour=range(0, 24, 3)))
         self.ax.xaxis.set_minor_formatter(DateFormatter("%H:%M"))
         self.ax.xaxis.set_major_locator(DayLocator())
@@ -220,26 +750,40 @@ class Chart:
             DateFormatter("\n    %Y-%m-%d $\\rightarrow$")
         )
 
+    def _set_x_ticks_and_labels_for_window(self):
+        from matplotlib.dates import DateFormatter, DayLocator, HourLocator
+
+        # Roughly one major tick per day for a week, one per week for a month, etc.
+        days = max(self.window.duration.days, 1)
+        self.ax.xaxis.set_major_locator(DayLocator(interval=max(days // 7, 1)))
+        self.ax.xaxis.set_major_formatter(DateFormatter("%d/%m"))
+        if days <= 7:
+            self.ax.xaxis.set_minor_locator(HourLocator(byhour=[12]))
+        else:
+            self.ax.xaxis.set_minor_locator(DayLocator())
+
     def _set_gridlines_and_legend(self):
         self.ax.grid(b=True, which="both", color="b", linestyle=":")
         if len(self._synoptic_timeseries_groups) > 1:
             self.ax.legend()
 
-    def _create_and_save_plot(self):
-        f = BytesIO()
-        self.fig.savefig(f)
-        plt.close(self.fig)  # Release some memory
-        filename = os.path.join(
-            "chart", str(self.current_synoptic_timeseries_group.id) + ".png"
-        )
-        File(filename).write(f.getvalue())
-        f.close()
+    def get_stats(self):
+        """Return the size of the rendered file and the time it took to write it."""
+        return {
+            "charts": 1,
+            "bytes": self.bytes_written,
+            "write_seconds": self.write_seconds,
+        }
+
+    def _get_filename(self, extension):
+        basename = str(self.current_synoptic_timeseries_group.id)
+        if self.window is not None:
+            basename += "-" + self.window.slug
+        return os.path.join("chart", basename + "." + extension)
 
     def _write_data_to_file_for_unit_testing(self):
         if hasattr(settings, "TEST_MATPLOTLIB") and settings.TEST_MATPLOTLIB:
-            filename = os.path.join(
-                "chart", str(self.current_synoptic_timeseries_group.id) + ".dat"
-            )
+            filename = self._get_filename("dat")
             data = [
                 repr(line.get_xydata()).replace("\n", " ") for line in self.ax.lines
             ]
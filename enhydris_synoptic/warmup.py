@@ -0,0 +1,97 @@
+"""Prepare a process for rendering.
+
+The first render in a new process is much slower than the rest, because the chart
+engine has to be loaded (see views.load_chart_engine()), matplotlib has to load its
+fonts and mathtext parser, and the templates have to be compiled. warm_up() does all
+that beforehand; the celery workers call it when they start (unless
+ENHYDRIS_SYNOPTIC_WARM_UP is False), so that the first real run is as fast as the
+next ones.
+"""
+import datetime as dt
+import logging
+import os
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.template.loader import get_template
+
+import numpy as np
+
+from .records import SeriesArrays
+from .views import Chart, DetachedSynopticTimeseriesGroup
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+
+def is_enabled():
+    return getattr(settings, "ENHYDRIS_SYNOPTIC_WARM_UP", True)
+
+
+def warm_up():
+    """Load the chart engine, render a throwaway chart and compile the templates."""
+    start = time.perf_counter()
+    render_throwaway_chart()
+    compile_templates()
+    logger.info("Warmed up for rendering in %.2f s", time.perf_counter() - start)
+
+
+def render_throwaway_chart():
+    """Render in memory, with views.Chart, a 24-hour chart and a window chart.
+
+    The charts have two grouped lines of synthetic data, so that all the code paths
+    of a real chart (lines, fill, ticks, legend) are loaded.
+    """
+    end_date = dt.datetime(2000, 1, 8)
+    window = SimpleNamespace(id=1, duration=dt.timedelta(days=7), slug="7day")
+    arrays = {}
+    syntsgs = []
+    for i, group_with_id in ((1, None), (2, 1)):
+        syntsg = DetachedSynopticTimeseriesGroup(
+            SimpleNamespace(
+                id=i,
+                group_with_id=group_with_id,
+                get_subtitle=lambda: f"Line {i}",
+                default_chart_min=None,
+                default_chart_max=None,
+            )
+        )
+        arrays[i] = _get_synthetic_series(end_date, dt.timedelta(hours=1), 25, i)
+        arrays[(i, window.id)] = _get_synthetic_series(
+            end_date, dt.timedelta(hours=6), 29, i
+        )
+        syntsgs.append(syntsg)
+    for syntsg in syntsgs:
+        syntsg.attach(arrays, [window])
+    Chart(syntsgs[0], syntsgs).render_to_bytes()
+    Chart(syntsgs[0], syntsgs, window=window).render_to_bytes()
+
+
+def _get_synthetic_series(end_date, step, length, scale):
+    timestamps = np.array(
+        [end_date - i * step for i in range(length - 1, -1, -1)],
+        dtype="datetime64[ns]",
+    )
+    return SeriesArrays(timestamps, scale * np.sin(np.arange(length)))
+
+
+def get_template_names():
+    names = []
+    for dirpath, dirnames, filenames in os.walk(TEMPLATE_DIR):
+        for filename in filenames:
+            if filename.endswith(".html"):
+                pathname = os.path.join(dirpath, filename)
+                names.append(os.path.relpath(pathname, TEMPLATE_DIR))
+    return sorted(names)
+
+
+def compile_templates():
+    """Load the templates of the app (or those that override them).
+
+    With the cached template loader (Django's default when DEBUG is off), they stay
+    compiled for the life of the process.
+    """
+    for name in get_template_names():
+        get_template(name.replace(os.sep, "/"))